@@ -1,10 +1,12 @@
-import yaml, logging, os, io, re, glob
+import logging, os, io, re, glob, importlib
 
 from collections import Sequence, Mapping
 
 import crow.tools
 
-from .from_yaml import ConvertFromYAML
+from .eval_tools import invalidate_cache, update_globals
+from .eval_tools import start_eval_stats, stop_eval_stats
+from .eval_tools import evaluate_immediates as _evaluate_immediates
 from .template import Template
 from .represent import Action, Platform, ShellCommand
 from .tools import CONFIG_TOOLS, ENV
@@ -14,17 +16,16 @@ from .tasks import Suite, Depend, AndDependency, SuitePath, \
     RUNNING, COMPLETED, FAILED, TRUE_DEPENDENCY, FALSE_DEPENDENCY, \
     CycleExistsDependency, InputSlot, OutputSlot, EventDependency, \
     Event, DataEvent, ShellEvent, TaskExistsDependency
-from .to_yaml import to_yaml
-from .eval_tools import invalidate_cache, update_globals
-from .eval_tools import evaluate_immediates as _evaluate_immediates
 from .exceptions import ConfigError, ConfigUserError
+from .snapshot import snapshot_for
 
 __all__=["from_string","from_file","to_py", 'Action', 'Platform', 'Template',
          'TaskStateAnd', 'TaskStateOr', 'TaskStateNot', 'TaskStateIs',
          'Taskable', 'Task', 'Family', 'CycleAt', 'CycleTime', 'Cycle',
          'Trigger', 'Depend', 'Timespec', 'SuitePath', 'ShellEvent', 'Event',
          'DataEvent', 'CycleExistsDependency', 'validate', 'EventDependency',
-         'TaskExistsDependency', 'follow_main', 'from_dir', 'update_globals' ]
+         'TaskExistsDependency', 'follow_main', 'from_dir', 'update_globals',
+         'start_eval_stats', 'stop_eval_stats' ]
 
 _logger=logging.getLogger('crow.config')
 
@@ -40,22 +41,42 @@ def expand_text(text,scope):
 
 evaluate_immediates=_evaluate_immediates
 
+## The yaml package and the modules that register CROW's YAML types
+## with it take most of the time needed to import crow.config, and
+## are not needed to load snapshots, so they are imported on first use.
+
+def to_yaml(obj):
+    return importlib.import_module('._to_yaml',__name__).to_yaml(obj)
+
 def from_string(s,evaluate_immediates=True,validation_stage=None):
     if not s: raise TypeError('Cannot parse null string')
+    import yaml
+    from .from_yaml import ConvertFromYAML
     c=ConvertFromYAML(yaml.load(s),CONFIG_TOOLS,ENV)
     result=c.convert(validation_stage=validation_stage,
                      evaluate_immediates=evaluate_immediates)
     return result
 
+def _from_snapshot(snapshot,s,evaluate_immediates,validation_stage):
+    """!Same as from_string, but loads or saves the result in the
+    snapshot, if there is one."""
+    convert=lambda: from_string(s,evaluate_immediates=evaluate_immediates,
+                                validation_stage=validation_stage)
+    if snapshot is None or not s: return convert()
+    return snapshot.convert(s,convert,
+                            evaluate_immediates=evaluate_immediates,
+                            validation_stage=validation_stage)
+
 def from_file(*args,evaluate_immediates=True,validation_stage=None):
     if not args: raise TypeError('Specify which files to read.')
     data=list()
     for file in args:
         with open(file,'rt') as fopen:
             data.append(fopen.read())
-    return from_string(u'\n\n\n'.join(data),
-                       evaluate_immediates=evaluate_immediates,
-                       validation_stage=validation_stage)
+    snapshot=snapshot_for(*args,evaluate_immediates=evaluate_immediates,
+                          validation_stage=validation_stage)
+    return _from_snapshot(snapshot,u'\n\n\n'.join(data),
+                          evaluate_immediates,validation_stage)
 
 def _recursive_validate(obj,stage,memo=None):
     if memo is None: memo=set()
@@ -80,8 +101,10 @@ def from_dir(reldir,evaluate_immediates=True,validation_stage=None,main_globals=
     with io.StringIO() as fd:
         follow_main(fd,reldir,main_globals)
         yaml=fd.getvalue()
-    return from_string(yaml,evaluate_immediates=evaluate_immediates,
-                       validation_stage=validation_stage)
+    snapshot=snapshot_for(reldir,main_globals=main_globals,
+                          evaluate_immediates=evaluate_immediates,
+                          validation_stage=validation_stage)
+    return _from_snapshot(snapshot,yaml,evaluate_immediates,validation_stage)
 
 def follow_main(fd,reldir,main_globals=None):
     if main_globals is None: main_globals={}
@@ -29,22 +29,32 @@ feature:
 
 """
 
-import logging
+import logging, time
 from collections.abc import MutableMapping, MutableSequence, Sequence, Mapping
+from collections import defaultdict
 from copy import copy,deepcopy
 from crow.config.exceptions import *
-from crow.tools import typecheck
+from crow.tools import typecheck, compile_expression, compile_fstring
 
 __all__=[ 'expand', 'strcalc', 'from_config', 'dict_eval',
-          'list_eval', 'multidict', 'Eval', 'user_error_message' ]
+          'list_eval', 'multidict', 'Eval', 'user_error_message',
+          'EvalStats', 'start_eval_stats', 'stop_eval_stats' ]
 _logger=logging.getLogger('crow.config')
 
+## Read sets of the evaluations in progress, innermost last.  Each is
+## a dict mapping (id(obj),key) to (obj,key) for every obj[key] read
+## while evaluating.
+_eval_stack=[]
+
+## The EvalStats receiving evaluation counts and times, or None
+_eval_stats=None
+
 class user_error_message(str):
     """!Used to embed assertions in configuration code."""
     def _result(self,globals,locals):
         c=copy(globals)
         c['this']=locals
-        raise ConfigUserError(eval("f'''"+self+"'''",c,locals))
+        raise ConfigUserError(eval(compile_fstring(self),c,locals))
     def _is_error(self): pass
 
 class expand(str):
@@ -60,7 +70,7 @@ class expand(str):
             cmd=cmd[:-1] + "\\" + cmd[-1]
         c=copy(globals)
         c['this']=locals
-        return eval("f'''"+cmd+"'''",c,locals)
+        return eval(compile_fstring(cmd),c,locals)
 
 #f''''blah bla'h \''''
 
@@ -72,7 +82,7 @@ class strcalc(str):
     def _result(self,globals,locals):
         c=copy(globals)
         c['this']=locals
-        return eval(self,c,locals)
+        return eval(compile_expression(self),c,locals)
 
 def from_config(key,val,globals,locals,path):
     """!Converts s strcalc cor Conditional to another data type via eval().
@@ -96,6 +106,70 @@ def from_config(key,val,globals,locals,path):
         raise CalcRecursionTooDeep(
             f'{path}: !{key} {type(val).__name__}')
 
+class EvalStats(object):
+    """!Counts the number of evaluations of each path, and the total
+    time spent in them.  Times are inclusive: an evaluation's time
+    includes the time spent evaluating the values it reads."""
+    def __init__(self):
+        self.count=defaultdict(int)
+        self.seconds=defaultdict(float)
+    def _record(self,path,seconds):
+        self.count[path]+=1
+        self.seconds[path]+=seconds
+    def total_count(self):
+        return sum(self.count.values())
+    def report(self,limit=30):
+        """!Returns a table of the most expensive paths, sorted by total time."""
+        paths=sorted(self.seconds,key=lambda p: self.seconds[p],reverse=True)
+        lines=[ f'{self.total_count()} evaluations of {len(paths)} paths',
+                f'{"COUNT":>8s} {"SECONDS":>10s}  PATH' ]
+        for path in paths[:limit]:
+            lines.append(f'{self.count[path]:8d} {self.seconds[path]:10.4f}  {path}')
+        return '\n'.join(lines)
+
+def start_eval_stats():
+    """!Starts recording evaluation counts and times per path.  Returns
+    the EvalStats object that receives them."""
+    global _eval_stats
+    _eval_stats=EvalStats()
+    return _eval_stats
+
+def stop_eval_stats():
+    """!Stops recording evaluation statistics and returns the EvalStats
+    that received them, or None if they were not being recorded."""
+    global _eval_stats
+    stats, _eval_stats = _eval_stats, None
+    return stats
+
+def _record_read(obj,key):
+    """!Adds obj[key] to the read set of the innermost evaluation in progress."""
+    if _eval_stack:
+        _eval_stack[-1][id(obj),key]=(obj,key)
+
+def _tracked_call(obj,key,func,*args):
+    """!Calls func(*args) to calculate obj[key], and registers obj[key]
+    as a dependent of everything the call read, so that it is
+    invalidated when any of them are.  The obj must have an
+    _invalidate_value(key) method."""
+    reads=dict()
+    _eval_stack.append(reads)
+    try:
+        result=func(*args)
+    finally:
+        _eval_stack.pop()
+    for read_obj,read_key in reads.values():
+        read_obj._add_dependent(read_key,obj,key)
+    return result
+
+def _tracked_from_config(obj,key,val,globals,locals,path):
+    """!Calls from_config() to evaluate obj[key], tracking what it reads
+    like _tracked_call(), and records its time in the EvalStats."""
+    stats=_eval_stats
+    if stats is not None: start=time.perf_counter()
+    result=_tracked_call(obj,key,from_config,key,val,globals,locals,path)
+    if stats is not None: stats._record(path,time.perf_counter()-start)
+    return result
+
 class multidict(MutableMapping):
     """!This is a dict-like object that makes multiple dicts act as one.
     Its methods look over the dicts in order, returning the result
@@ -137,7 +211,7 @@ class multidict(MutableMapping):
             return True
         except KeyError: return False
     def _expand_text(self,text):
-        eval("f'''"+text+"'''",self._globals(),self)
+        eval(compile_fstring(text),self._globals(),self)
     def __repr__(self):
         return '%s(%s)'%(
             type(self).__name__,
@@ -164,6 +238,7 @@ class dict_eval(MutableMapping):
         typecheck('child',child,Mapping)
         self.__child=copy(child)
         self.__cache=copy(child)
+        self.__dependents=dict()
         self.__globals={} if globals is None else globals
         self.__is_validated=False
         self._path=path
@@ -183,8 +258,24 @@ class dict_eval(MutableMapping):
             self.__cache=copy(self.__child)
             #if 'ecflow_def' in self:
             #    print(f'ecflow_def = {self.__cache["ecflow_def"]!r}')
+            self._invalidate_dependents(list(self.__dependents.keys()))
         else:
+            self._invalidate_value(key)
+    def _add_dependent(self,key,obj,obj_key):
+        """!Records that obj[obj_key] was calculated from self[key]"""
+        self.__dependents.setdefault(key,dict())[id(obj),obj_key]=(obj,obj_key)
+    def _invalidate_value(self,key):
+        """!Discards the cached value of self[key] and of everything
+        calculated from it."""
+        if key in self.__child:
             self.__cache[key]=self.__child[key]
+        self._invalidate_dependents([key])
+    def _invalidate_dependents(self,keys):
+        """!Invalidates the cached values calculated from these keys, and
+        the values calculated from those, and so on."""
+        for key in keys:
+            for obj,obj_key in self.__dependents.pop(key,{}).values():
+                obj._invalidate_value(obj_key)
     def _raw_child(self):       return self.__child
     def _has_raw(self,key):     return key in self.__child
     def _iter_raw(self):
@@ -200,7 +291,7 @@ class dict_eval(MutableMapping):
         """!Returns the global values used in eval() functions"""
         return self.__globals
     def _expand_text(self,text):
-        return eval('f'+repr(text),self.__globals,self)
+        return eval(compile_expression('f'+repr(text)),self.__globals,self)
     def _deepcopy_child(self,memo):
         cls=type(self.__child)
         return deepcopy(self.__child,memo)
@@ -208,7 +299,9 @@ class dict_eval(MutableMapping):
         self.__globals=deepcopy(other.__globals,memo)
 #dict([ ( deepcopy(k,memo),deepcopy(v,memo) )
 #                              for k,v in other.__globals.items() ])
-        self.__cache=deepcopy(other.__cache,memo)
+        # The cache is not copied: its dependency records name the
+        # original objects, so the copy could not invalidate it.
+        self.__cache=copy(self.__child)
         self._path=deepcopy(other._path,memo)
         self.__is_validated=deepcopy(other.__is_validated,memo)
         #self.__globals=deepcopy(other.__globals,memo)
@@ -219,12 +312,22 @@ class dict_eval(MutableMapping):
         r.__child=self._deepcopy_child(memo)
         r._deepcopy_privates_from(memo,self)
         return r
+    def __getstate__(self):
+        """!Pickles the unevaluated values only; the cache and dependency
+        records are rebuilt as needed after unpickling."""
+        state=dict(self.__dict__)
+        state['_dict_eval__cache']=copy(self.__child)
+        state['_dict_eval__dependents']=dict()
+        return state
     def __setitem__(self,k,v):  
         if 'final' in self._path and k=='Rocoto':
             assert(isinstance(v,expand))
         self.__child[k]=v
         self.__cache[k]=v
-    def __delitem__(self,k): del(self.__child[k], self.__cache[k])
+        self._invalidate_dependents([k])
+    def __delitem__(self,k):
+        del(self.__child[k], self.__cache[k])
+        self._invalidate_dependents([k])
     def __iter__(self):
         for k in self.__child.keys(): yield k
     def _validate(self,stage,memo=None):
@@ -265,6 +368,7 @@ class dict_eval(MutableMapping):
                     tmpl=Template(tmpl,self._path+'.Template',self.__globals)
                 tmpl._check_scope(self,stage,memo)
     def __getitem__(self,key):
+        _record_read(self,key)
         if key not in self.__cache:
             if key not in self.__child:
                 raise KeyError(f'{self._path}: no {key} in {list(self.keys())}')
@@ -272,13 +376,15 @@ class dict_eval(MutableMapping):
         val=self.__cache[key]
         if hasattr(val,'_result'):
             immediate=hasattr(val,'_is_immediate')
-            val=from_config(key=key,val=val,globals=self.__globals,locals=self,
-                            path=f'{self._path}.{key}')
+            val=_tracked_from_config(self,key,val,self.__globals,self,
+                                     f'{self._path}.{key}')
             self.__cache[key]=val
             if immediate:
                 self.__child[key]=val
         return val
     def __getattr__(self,name):
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name) # pickle, copy, etc. probe for these
         if name in self: return self[name]
         raise AttributeError(f'{self._path}: no {name} in {list(self.keys())}')
     def __setattr__(self,name,value):
@@ -333,6 +439,7 @@ class list_eval(MutableSequence):
         typecheck('child',child,Sequence)
         self.__child=list(child)
         self.__cache=list(child)
+        self.__dependents=dict()
         self.__locals=locals
         self.__globals={}
         self._path=path
@@ -363,30 +470,64 @@ class list_eval(MutableSequence):
         return r
     def _deepcopy_privates_from(self,memo,other):
         self.__child=deepcopy(other.__child,memo)
-        self.__cache=deepcopy(other.__cache,memo)
+        # The cache is not copied, as in dict_eval.
+        self.__cache=list(self.__child)
         self._path=deepcopy(other._path)
+        self.__locals=deepcopy(other.__locals,memo)
         self.__globals=deepcopy(other.__globals,memo)
-        self.__cache=deepcopy(other.__cache,memo)
+    def __getstate__(self):
+        """!Pickles the unevaluated values only; the cache and dependency
+        records are rebuilt as needed after unpickling."""
+        state=dict(self.__dict__)
+        state['_list_eval__cache']=list(self.__child)
+        state['_list_eval__dependents']=dict()
+        return state
     def _invalidate_cache(self,index=None):
         _logger.debug(f'{self._path}: invalidate cache')
         if index is None:
             self.__cache=copy(self.__child)
+            self._invalidate_dependents(list(self.__dependents.keys()))
         else:
-            self.__cache[key]=self.__child[key]
+            self._invalidate_value(index)
+    def _add_dependent(self,index,obj,obj_key):
+        """!Records that obj[obj_key] was calculated from self[index]"""
+        self.__dependents.setdefault(index,dict())[id(obj),obj_key]=(obj,obj_key)
+    def _invalidate_value(self,index):
+        """!Discards the cached value of self[index] and of everything
+        calculated from it."""
+        if self._has_raw(index):
+            self.__cache[index]=self.__child[index]
+        self._invalidate_dependents([index])
+    def _invalidate_dependents(self,indices):
+        """!Invalidates the cached values calculated from these indices,
+        and the values calculated from those, and so on."""
+        for index in indices:
+            for obj,obj_key in self.__dependents.pop(index,{}).values():
+                obj._invalidate_value(obj_key)
     def __setitem__(self,k,v):
         self.__child[k]=v
         self.__cache[k]=v
+        self._invalidate_dependents([k])
     def __delitem__(self,k):
         del(self.__child[k], self.__cache[k])
+        self._invalidate_dependents(list(self.__dependents.keys()))
     def insert(self,i,o):
         self.__child.insert(i,o)
         self.__cache.insert(i,o)
+        self._invalidate_dependents(list(self.__dependents.keys()))
     def __getitem__(self,index):
+        if isinstance(index,slice):
+            for i in range(*index.indices(len(self.__child))):
+                _record_read(self,i)
+        elif index<0:
+            _record_read(self,index+len(self.__child))
+        else:
+            _record_read(self,index)
         val=self.__cache[index]
         if hasattr(val,'_result'):
             immediate=hasattr(val,'_is_immediate')
-            val=from_config(index,val,self.__globals,self.__locals,
-                            f'{self._path}[{index}]')
+            val=_tracked_from_config(self,index,val,self.__globals,
+                                     self.__locals,f'{self._path}[{index}]')
             self.__cache[index]=val
             if immediate:
                 self.__child[index]=val
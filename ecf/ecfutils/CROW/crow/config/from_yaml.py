@@ -22,6 +22,7 @@ from crow.config.represent import *
 from crow.config.tasks import *
 from crow.config.template import *
 from crow.config.exceptions import *
+from crow.config.yaml_types import *
 from crow.tools import to_timedelta
 import crow.sysenv
 
@@ -35,30 +36,7 @@ class SelectYAML(YAMLObject):     yaml_tag=u'!Select'
 class ActionYAML(YAMLObject):     yaml_tag=u'!Action'
 #class TemplateYAML(YAMLObject):   yaml_tag=u'!Template'
 
-class FirstMaxYAML(list):         yaml_tag=u'!FirstMax'
-class FirstMinYAML(list):         yaml_tag=u'!FirstMin'
-class FirstTrueYAML(list):        yaml_tag=u'!FirstTrue'
-class LastTrueYAML(list):         yaml_tag=u'!LastTrue'
-class ImmediateYAML(list):        yaml_tag=u'!Immediate'
-class InheritYAML(list):          yaml_tag=u'!Inherit'
-class MergeMappingYAML(list):     yaml_tag=u'!MergeMapping'
-
-class ClockYAML(dict):            yaml_tag=u'!Clock'
-class EvalYAML(dict): pass
-class ShellCommandYAML(dict): pass
-class DataEventYAML(dict): pass
-class ShellEventYAML(dict): pass
-class TaskYAML(OrderedDict): pass
-class TaskArrayYAML(OrderedDict): pass
-class TaskElementYAML(OrderedDict): pass
-class DataEventElementYAML(OrderedDict): pass
-class ShellEventElementYAML(OrderedDict): pass
-class FamilyYAML(OrderedDict): pass
-class CycleYAML(OrderedDict): pass
-class TemplateYAML(OrderedDict): pass
-class InputSlotYAML(dict): pass
-class OutputSlotYAML(dict): pass
-class JobResourceSpecMakerYAML(list): pass
+# Containers for the other YAML types are in crow.config.yaml_types
 
 # Mapping from YAML representation class to a pair:
 # * internal representation class
@@ -0,0 +1,173 @@
+"""!Fast-load snapshots of converted configuration documents.
+
+Converting YAML to a crow.config document, evaluating its immediates
+and validating it is expensive, and every job in a workflow reads the
+same documents again.  The from_file() and from_dir() functions save
+the converted document in a pickled snapshot, and later calls with
+the same inputs load the snapshot instead of converting again.
+
+A snapshot is only used if the text of the inputs, the conversion
+options and the crow source files are unchanged, and if every
+environment variable and filesystem query made during the conversion
+gives the same answer as before.  Otherwise, the inputs are converted
+again and the snapshot is replaced.
+
+Snapshots are off unless $CROW_CONFIG_SNAPSHOT_DIR names the
+directory to store them in.  Nothing is written next to the inputs.
+
+Snapshots are pickles; only keep them where the YAML itself could
+be kept.  """
+
+import os, sys, pickle, hashlib, logging
+from contextlib import contextmanager
+from crow.config.tools import CONFIG_TOOLS, ENV, start_probe_log, \
+    stop_probe_log, probes_unchanged, add_probes
+
+__all__=[ 'Snapshot', 'snapshot_for' ]
+_logger=logging.getLogger('crow.config')
+
+## Version of the snapshot file layout.  Increment when it changes.
+SNAPSHOT_FORMAT=1
+
+## Minimum recursion limit while pickling and unpickling documents,
+## which are deeply nested.
+PICKLE_RECURSION_LIMIT=20000
+
+_code_stamp=None
+
+def code_stamp():
+    """!Returns a hash of the names, sizes and modification times of
+    the crow source files, so that snapshots pickled by other versions
+    of crow are not used."""
+    global _code_stamp
+    if _code_stamp is None:
+        crowdir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        stamp=hashlib.sha256(repr(sys.version_info[:2]).encode('utf-8'))
+        for dirpath,dirnames,filenames in sorted(os.walk(crowdir)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.py'): continue
+                st=os.stat(os.path.join(dirpath,filename))
+                stamp.update(f'{dirpath}/{filename} {st.st_size} '
+                             f'{st.st_mtime_ns}\n'.encode('utf-8'))
+        _code_stamp=stamp.hexdigest()
+    return _code_stamp
+
+@contextmanager
+def _recursion_limit(limit):
+    old=sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old,limit))
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(old)
+
+class _Pickler(pickle.Pickler):
+    """!Pickles references to the CONFIG_TOOLS and ENV by name, so the
+    unpickled document uses those of the current process."""
+    def persistent_id(self,obj):
+        if obj is CONFIG_TOOLS: return 'tools'
+        if obj is ENV: return 'ENV'
+        return None
+
+class _Unpickler(pickle.Unpickler):
+    def persistent_load(self,pid):
+        if pid=='tools': return CONFIG_TOOLS
+        if pid=='ENV': return ENV
+        raise pickle.UnpicklingError(f'{pid!r}: unknown persistent id')
+
+class Snapshot(object):
+    """!A file that stores one converted document.  The file holds
+    two pickles: a header with the key and the environment and
+    filesystem queries made during conversion, then the document."""
+    def __init__(self,path):
+        self.path=path
+
+    def key(self,text,**options):
+        """!Returns the key of the document converted from this text
+        with these conversion options."""
+        key=hashlib.sha256()
+        key.update(f'{SNAPSHOT_FORMAT} {code_stamp()} '
+                   f'{sorted(options.items())!r}\n'.encode('utf-8'))
+        key.update(text.encode('utf-8'))
+        return key.hexdigest()
+
+    def load(self,key):
+        """!Returns the stored document if it has this key and the
+        queries made during its conversion give the same answers as
+        before.  Otherwise, returns None."""
+        try:
+            with open(self.path,'rb') as fd:
+                unpickler=_Unpickler(fd)
+                header=unpickler.load()
+                if header[:2]!=(SNAPSHOT_FORMAT,key):
+                    _logger.debug(f'{self.path}: inputs changed')
+                    return None
+                if not probes_unchanged(header[2]):
+                    _logger.debug(f'{self.path}: environment changed')
+                    return None
+                with _recursion_limit(PICKLE_RECURSION_LIMIT):
+                    doc=unpickler.load()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _logger.debug(f'{self.path}: cannot load snapshot: {e}')
+            return None
+        _logger.debug(f'{self.path}: loaded snapshot')
+        add_probes(header[2])
+        return doc
+
+    def save(self,key,doc,probes):
+        """!Atomically replaces the file with one that stores doc under
+        this key.  Failures are logged and otherwise ignored, since
+        the snapshot is only an optimization."""
+        import tempfile # only needed here; slow to import
+        dirname=os.path.dirname(self.path)
+        try:
+            fd,temp=tempfile.mkstemp(dir=dirname,prefix='.crow-snapshot-',
+                                     suffix='.tmp')
+        except OSError as e:
+            _logger.debug(f'{dirname}: cannot write snapshot: {e}')
+            return
+        try:
+            with open(fd,'wb') as fopen:
+                pickler=_Pickler(fopen,pickle.HIGHEST_PROTOCOL)
+                pickler.dump((SNAPSHOT_FORMAT,key,probes))
+                with _recursion_limit(PICKLE_RECURSION_LIMIT):
+                    pickler.dump(doc)
+            umask=os.umask(0)
+            os.umask(umask)
+            os.chmod(temp,0o666&~umask) # mkstemp creates it as 0600
+            os.replace(temp,self.path)
+            _logger.debug(f'{self.path}: saved snapshot')
+        except Exception as e:
+            _logger.debug(f'{self.path}: cannot save snapshot: {e}')
+            try:
+                os.unlink(temp)
+            except OSError: pass
+
+    def convert(self,text,convert,**options):
+        """!Returns the stored document converted from text with these
+        options, if there is a usable one.  Otherwise, calls convert()
+        to make the document, and stores it."""
+        key=self.key(text,**options)
+        doc=self.load(key)
+        if doc is not None: return doc
+        log,old=start_probe_log()
+        try:
+            doc=convert()
+        finally:
+            stop_probe_log(log,old)
+        self.save(key,doc,log)
+        return doc
+
+def snapshot_for(*sources,**options):
+    """!Returns the Snapshot for documents converted from these sources
+    with these options, in $CROW_CONFIG_SNAPSHOT_DIR, or None if that
+    variable is unset or empty."""
+    directory=os.environ.get('CROW_CONFIG_SNAPSHOT_DIR','')
+    if not directory: return None
+    sources=[ os.path.abspath(s) for s in sources ]
+    name=hashlib.sha1(repr((sources,sorted(options.items())))
+                      .encode('utf-8')).hexdigest()[:20]
+    return Snapshot(os.path.join(directory,f'.crow-snapshot-{name}.pickle'))
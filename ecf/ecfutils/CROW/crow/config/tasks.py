@@ -18,7 +18,9 @@ from collections.abc import Mapping, Sequence
 from copy import copy, deepcopy
 from crow.config.exceptions import *
 from crow.config.eval_tools import dict_eval, strcalc, multidict, from_config, update_globals
-from crow.tools import to_timedelta, typecheck, NamedConstant, MISSING
+from crow.config.eval_tools import _record_read, _tracked_call
+from crow.tools import to_timedelta, typecheck, NamedConstant, MISSING, \
+    compile_expression, compile_fstring
 
 __all__=[ 'SuiteView', 'Suite', 'Depend', 'LogicalDependency',
           'AndDependency', 'OrDependency', 'NotDependency',
@@ -138,10 +140,18 @@ class SuiteView(Mapping):
                 yield r
 
     def _invalidate_cache(self,key):
-        self.__cache={}
+        if key is None:
+            self.__cache={}
+        else:
+            self.__cache.pop(key,None)
         if hasattr(self.viewed,'_invalidate_cache'):
             self.viewed._invalidate_cache(key)
 
+    def _invalidate_value(self,key):
+        """!Discards the cached view or dependency for self[key], which
+        was made from values that have changed."""
+        self.__cache.pop(key,None)
+
     def _globals(self):
         return self.viewed._globals()
 
@@ -175,7 +185,7 @@ class SuiteView(Mapping):
                 kwargs[k]=[v]
         deps=TRUE_DEPENDENCY
         for d in subdict_iter(kwargs):
-            name=eval(f"f'''{string}'''",self.viewed._globals(),d)
+            name=eval(compile_fstring(string),self.viewed._globals(),d)
             deps = deps & self[name]
         return deps
 
@@ -239,21 +249,26 @@ class SuiteView(Mapping):
 
     def __getitem__(self,key):
         assert(isinstance(key,str))
-        if key in self.__cache: return self.__cache[key]
+        if key in self.__cache:
+            _record_read(self.viewed,key)
+            return self.__cache[key]
         if key not in self.viewed:
             raise KeyError(f'{key}: not in {", ".join([k for k in self.keys()])}')
         val=self.viewed[key]
         
+        # Only views and dependencies are cached here.  Other values
+        # are cached by self.viewed, which invalidates them when the
+        # values they were calculated from change.
         if hasattr(val,'_is_suite_view'):
             return val
         elif type(val) in SUITE_CLASS_MAP:
             val=self.__wrap(key,val)
         elif isinstance(val,TaskArray):
-            val=self.__wrap(key,val)
+            val=_tracked_call(self,key,self.__wrap,key,val)
         elif hasattr(val,'_as_dependency'):
-            locals=multidict(self.parent,self)
-            val=self.__wrap(key,val._as_dependency(
-                self.viewed._globals(),locals,self.path))
+            val=_tracked_call(self,key,self.__wrap_dependency,key,val)
+        else:
+            return val
         self.__cache[key]=val
         return val
 
@@ -262,6 +277,11 @@ class SuiteView(Mapping):
                 hasattr(obj,'_generate') or \
                 type(obj) in SUITE_CLASS_MAP )
 
+    def __wrap_dependency(self,key,depend):
+        locals=multidict(self.parent,self)
+        return self.__wrap(key,depend._as_dependency(
+            self.viewed._globals(),locals,self.path))
+
     def __wrap(self,key,obj):
         if isinstance(obj,Cycle):
             # Reset path when we see a cycle
@@ -431,14 +451,14 @@ class Suite(SuiteView):
 class Message(str):
     def _as_dependency(self,globals,locals,path):
         try:
-            return eval(self,globals,locals)
+            return eval(compile_expression(self),globals,locals)
         except(ValueError,SyntaxError,TypeError,KeyError,NameError,IndexError,AttributeError) as ke:
             raise DependError(f'!Message {self}: {ke}')
 
 class Depend(str):
     def _as_dependency(self,globals,locals,path):
         try:
-            result=eval(self,globals,locals)
+            result=eval(compile_expression(self),globals,locals)
             result=as_dependency(result,path)
             return result
         except(AttributeError,KeyError,NameError) as ne:
@@ -18,6 +18,7 @@ from datetime import timedelta, datetime
 from crow.config.exceptions import *
 from crow.config.eval_tools import list_eval, dict_eval, multidict, from_config
 from crow.config.represent import GenericList, GenericDict, GenericOrderedDict
+from crow.tools import compile_expression
 from collections.abc import Mapping
 
 _logger=logging.getLogger('crow.config')
@@ -31,7 +32,7 @@ class Inherit(list_eval):
             try:
                 scopename=str(scopename)
                 _logger.debug(f'{target._path}: inherit from {scopename}')
-                scope=eval(scopename,globals,locals)
+                scope=eval(compile_expression(scopename),globals,locals)
                 if hasattr(scope,'_validate'):
                     scope._validate(stage,memo)
                 for key in scope:
@@ -61,6 +62,10 @@ class Template(dict_eval):
         self.__my_id=id(child)
         super().__init__(child,path,globals)
 
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.__my_id=id(self._child()) # old id is meaningless after unpickling
+
     def _check_scope(self,scope,stage,memo):
         if self.__my_id in memo:
             _logger.debug(f'{scope._path}: do not re-validate with {self._path}')
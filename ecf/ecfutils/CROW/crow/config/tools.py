@@ -2,18 +2,88 @@ import crow.tools
 import os, re, datetime, logging
 from collections import Sequence, Mapping
 from crow.config.exceptions import *
-from crow.tools import typecheck
+from crow.tools import typecheck, compile_fstring
 import crow.sysenv
 
 logger=logging.getLogger('crow.config')
 
+## Results of the environment and filesystem queries made while
+## probes are recorded, keyed by (tool name, args).  See
+## start_probe_log().
+_probe_log=None
+
+def _log_probe(name,args,outcome):
+    try:
+        _probe_log[name,args]=outcome
+    except TypeError: # unhashable arguments, so it cannot be repeated
+        _probe_log[None,()]=None
+
+def _probe(name,func):
+    """!Wraps func so that its calls are recorded in the probe log."""
+    def probe(*args):
+        if _probe_log is None: return func(*args)
+        try:
+            result=func(*args)
+        except Exception as e:
+            _log_probe(name,args,('raise',type(e).__name__))
+            raise
+        _log_probe(name,args,('return',result))
+        return result
+    probe.__name__=func.__name__
+    probe.__doc__=func.__doc__
+    return probe
+
+def _unrepeatable(func):
+    """!Wraps func, whose results depend on the environment but cannot
+    be compared, so that calling it while probes are recorded makes
+    the log unrepeatable."""
+    def unrepeatable(*args,**kwargs):
+        if _probe_log is not None: _probe_log[None,()]=None
+        return func(*args,**kwargs)
+    unrepeatable.__name__=func.__name__
+    unrepeatable.__doc__=func.__doc__
+    return unrepeatable
+
 class Environment(dict):
     def __getattr__(self,key):
         if key in self: return self[key]
         raise AttributeError(key)
+    def _log_key(self,key):
+        if _probe_log is not None:
+            _log_probe('ENV',(key,),('return',dict.get(self,key)))
+    def _log_all(self):
+        if _probe_log is not None:
+            _log_probe('ENV*',(),('return',_environment_items()))
+    def __contains__(self,key):
+        self._log_key(key)
+        return super().__contains__(key)
+    def __getitem__(self,key):
+        self._log_key(key)
+        return super().__getitem__(key)
+    def get(self,key,default=None):
+        self._log_key(key)
+        return super().get(key,default)
+    def __iter__(self):
+        self._log_all()
+        return super().__iter__()
+    def __len__(self):
+        self._log_all()
+        return super().__len__()
+    def keys(self):
+        self._log_all()
+        return super().keys()
+    def values(self):
+        self._log_all()
+        return super().values()
+    def items(self):
+        self._log_all()
+        return super().items()
 
 ENV=Environment(os.environ)
 
+def _environment_items():
+    return sorted(dict.items(ENV))
+
 def strftime(d,fmt): return d.strftime(fmt)
 def strptime(d,fmt): return datetime.datetime.strptime(d,fmt)
 def to_YMDH(d): return d.strftime('%Y%m%d%H')
@@ -86,7 +156,7 @@ def indent(prefix,text):
     return '\n'.join([prefix+L for L in text.splitlines()])
 
 def expand(string,**kwargs):
-    return eval(f"f'''{string}'''",{},kwargs)
+    return eval(compile_fstring(string),{},kwargs)
 
 def uniq(inlist):
     outlist=[]
@@ -114,19 +184,19 @@ CONFIG_TOOLS=crow.tools.ImmutableMapping({
     'crow_install_dir':crow_install_dir,
     'to_upper':(lambda s: s.upper()),
     'to_lower':(lambda s: s.lower()),
-    'panasas_gb':crow.tools.panasas_gb,
-    'gpfs_gb':crow.tools.gpfs_gb,
+    'panasas_gb':_unrepeatable(crow.tools.panasas_gb),
+    'gpfs_gb':_unrepeatable(crow.tools.gpfs_gb),
     'basename':os.path.basename,
     'dirname':os.path.dirname,
-    'abspath':os.path.abspath,
-    'realpath':os.path.realpath,
-    'can_write':can_write,
-    'isdir':os.path.isdir,
-    'isfile':os.path.isfile,
-    'env':env,
-    'have_env':have_env,
-    'islink':os.path.islink,
-    'exists':os.path.exists,
+    'abspath':_probe('abspath',os.path.abspath),
+    'realpath':_probe('realpath',os.path.realpath),
+    'can_write':_probe('can_write',can_write),
+    'isdir':_probe('isdir',os.path.isdir),
+    'isfile':_probe('isfile',os.path.isfile),
+    'env':_probe('env',env),
+    'have_env':_probe('have_env',have_env),
+    'islink':_probe('islink',os.path.islink),
+    'exists':_probe('exists',os.path.exists),
     'strftime':strftime,
     'strptime':strptime,
     'uniq':uniq,
@@ -136,10 +206,57 @@ CONFIG_TOOLS=crow.tools.ImmutableMapping({
     'to_YMD':to_YMD, 'from_YMD':from_YMD,
     'grep':re.search,
     'join':join,
-    'get_parallelism':crow.sysenv.get_parallelism, 
-    'get_scheduler':crow.sysenv.get_scheduler,
+    'get_parallelism':_unrepeatable(crow.sysenv.get_parallelism),
+    'get_scheduler':_unrepeatable(crow.sysenv.get_scheduler),
     'node_tool_for':crow.sysenv.node_tool_for,
     'command_without_exe':command_without_exe,
     'indent':indent,
     'day_of':day_of,
 })
+
+def start_probe_log():
+    """!Starts recording the calls to the PROBED_TOOLS and the reads of
+    ENV.  Returns the new log and the one it replaced; pass both to
+    stop_probe_log()."""
+    global _probe_log
+    old, _probe_log = _probe_log, dict()
+    return _probe_log, old
+
+def stop_probe_log(log,old):
+    """!Stops recording into log and resumes recording into old, if
+    any.  Everything in log is copied to old."""
+    global _probe_log
+    if old is not None: old.update(log)
+    _probe_log=old
+
+def add_probes(log):
+    """!Adds the queries in log, from an earlier start_probe_log(), to
+    the log being recorded, if any."""
+    if _probe_log is not None: _probe_log.update(log)
+
+def probes_unchanged(log):
+    """!Repeats the queries in a log from start_probe_log().  Returns
+    True if all of them give the same results as they did before."""
+    for (name,args),outcome in log.items():
+        if name is None: return False
+        try:
+            if outcome!=('return',PROBED_TOOLS[name](*args)): return False
+        except Exception as e:
+            if outcome!=('raise',type(e).__name__): return False
+    return True
+
+## Tools whose results depend on the environment, filesystem or
+## working directory rather than only on their arguments.
+PROBED_TOOLS={
+    'ENV':(lambda key: dict.get(ENV,key)),
+    'ENV*':_environment_items,
+    'env':env,
+    'have_env':have_env,
+    'can_write':can_write,
+    'abspath':os.path.abspath,
+    'realpath':os.path.realpath,
+    'isdir':os.path.isdir,
+    'isfile':os.path.isfile,
+    'islink':os.path.islink,
+    'exists':os.path.exists,
+}
@@ -0,0 +1,39 @@
+"""!Containers for YAML types that are parsed to python core types
+before conversion to internal representations.  These can remain in
+converted documents, so they are kept apart from the yaml package
+and from_yaml, which need not be imported to unpickle a document."""
+
+from collections import OrderedDict
+
+__all__=[ 'FirstMaxYAML', 'FirstMinYAML', 'FirstTrueYAML', 'LastTrueYAML',
+          'ImmediateYAML', 'InheritYAML', 'MergeMappingYAML', 'ClockYAML',
+          'EvalYAML', 'ShellCommandYAML', 'DataEventYAML', 'ShellEventYAML',
+          'TaskYAML', 'TaskArrayYAML', 'TaskElementYAML',
+          'DataEventElementYAML', 'ShellEventElementYAML', 'FamilyYAML',
+          'CycleYAML', 'TemplateYAML', 'InputSlotYAML', 'OutputSlotYAML',
+          'JobResourceSpecMakerYAML' ]
+
+class FirstMaxYAML(list):         yaml_tag=u'!FirstMax'
+class FirstMinYAML(list):         yaml_tag=u'!FirstMin'
+class FirstTrueYAML(list):        yaml_tag=u'!FirstTrue'
+class LastTrueYAML(list):         yaml_tag=u'!LastTrue'
+class ImmediateYAML(list):        yaml_tag=u'!Immediate'
+class InheritYAML(list):          yaml_tag=u'!Inherit'
+class MergeMappingYAML(list):     yaml_tag=u'!MergeMapping'
+
+class ClockYAML(dict):            yaml_tag=u'!Clock'
+class EvalYAML(dict): pass
+class ShellCommandYAML(dict): pass
+class DataEventYAML(dict): pass
+class ShellEventYAML(dict): pass
+class TaskYAML(OrderedDict): pass
+class TaskArrayYAML(OrderedDict): pass
+class TaskElementYAML(OrderedDict): pass
+class DataEventElementYAML(OrderedDict): pass
+class ShellEventElementYAML(OrderedDict): pass
+class FamilyYAML(OrderedDict): pass
+class CycleYAML(OrderedDict): pass
+class TemplateYAML(OrderedDict): pass
+class InputSlotYAML(dict): pass
+class OutputSlotYAML(dict): pass
+class JobResourceSpecMakerYAML(list): pass
@@ -0,0 +1,215 @@
+"""!A long-lived local server that answers to_sh.py calls from memory.
+
+Every to_sh.py call normally pays for python startup, the crow
+imports, and loading and validating its configuration files.  A
+daemon started with:
+
+    to_sh.py --serve /path/to/socket [--idle-timeout SECONDS] FILE [FILE ...]
+
+loads and validates the files once and keeps the document in memory.
+When $CROW_TO_SH_SOCKET names the socket, to_sh.py sends its
+arguments, environment and working directory to the daemon before it
+imports crow.config, and prints the daemon's reply.  Each request is
+handled in a forked child of the daemon.  The child sees the document
+as it was just after loading, in the caller's environment and working
+directory, and nothing it does is seen by later requests.
+
+to_sh.py falls back to doing the work itself whenever the daemon
+cannot answer:
+
+ * no daemon is listening on the socket
+ * the call reads other files than the daemon loaded
+ * the environment variables or files that the document's conversion
+   depended on are different for the caller
+ * the call runs programs (run:, run_ignore:, runner:), which must run
+   in the caller's own process
+
+The daemon reloads its files when they change, and exits after the
+idle timeout.  Only the standard library is imported at load time, so
+that the client stays cheap.  """
+
+import os, io, re, json, time, socket, struct, socketserver, traceback, \
+    logging
+from contextlib import redirect_stdout, redirect_stderr
+
+__all__=[ 'SOCKET_VAR', 'Fallback', 'request', 'ConfigDaemon', 'serve' ]
+_logger=logging.getLogger('crow')
+
+## Environment variable with the path to the daemon's socket
+SOCKET_VAR='CROW_TO_SH_SOCKET'
+
+## Default number of seconds without requests before the daemon exits
+IDLE_TIMEOUT=3600
+
+## Maximum seconds between checks for exited children and idleness
+REAP_INTERVAL=1.0
+
+## Seconds to wait for a reply before doing the work locally
+REPLY_TIMEOUT=300
+
+## to_sh.py arguments that must be processed in the calling process
+LOCAL_ARGS=re.compile(r'(run|run_ignore|runner):')
+
+_HEADER=struct.Struct('!I')
+
+class Fallback(Exception):
+    """!Raised in the daemon when the caller must do the work itself."""
+
+def _send(sock,message):
+    data=json.dumps(message).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data))+data)
+
+def _recv_exactly(sock,size):
+    chunks=list()
+    while size>0:
+        chunk=sock.recv(min(size,1<<20))
+        if not chunk: raise EOFError('connection closed before reply')
+        chunks.append(chunk)
+        size-=len(chunk)
+    return b''.join(chunks)
+
+def _receive(sock):
+    size,=_HEADER.unpack(_recv_exactly(sock,_HEADER.size))
+    return json.loads(_recv_exactly(sock,size).decode('utf-8'))
+
+def request(argv,path=None):
+    """!Asks the daemon listening on path, or on $CROW_TO_SH_SOCKET, to
+    process the to_sh.py arguments argv.  Returns (status, stdout,
+    stderr), or None if the caller must process them itself."""
+    if path is None: path=os.environ.get(SOCKET_VAR,'')
+    if not path: return None
+    if any(LOCAL_ARGS.match(arg) for arg in argv): return None
+    try:
+        with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+            sock.settimeout(REPLY_TIMEOUT)
+            sock.connect(path)
+            _send(sock,{ 'argv':list(argv), 'cwd':os.getcwd(),
+                         'env':dict(os.environ) })
+            reply=_receive(sock)
+    except (OSError,EOFError,ValueError):
+        return None
+    if reply.get('fallback'): return None
+    return reply['status'], reply['stdout'], reply['stderr']
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            reply=self.server.answer(_receive(self.request))
+        except Exception as e:
+            _logger.warning(f'{self.server.server_address}: {e}',exc_info=True)
+            reply={ 'fallback':True }
+        _send(self.request,reply)
+
+class ConfigDaemon(socketserver.ForkingMixIn,socketserver.UnixStreamServer):
+    """!Serves to_sh.py requests for one list of files.  The process
+    argument is called in the forked child as process(argv,loaded),
+    where loaded is (files, document).  It must behave like to_sh.py,
+    writing to sys.stdout and sys.stderr, returning the exit status,
+    and raising Fallback if the caller must do the work itself."""
+    def __init__(self,path,files,process,idle_timeout=IDLE_TIMEOUT):
+        self.files=[ os.path.abspath(f) for f in files ]
+        self.process=process
+        self.idle_timeout=idle_timeout
+        self.timeout=min(idle_timeout,REAP_INTERVAL)
+        self.last_request=time.monotonic()
+        self.idle=False
+        self.config=None
+        self._load()
+        super().__init__(path,_Handler)
+
+    def _stamp(self):
+        stamp=list()
+        for path in self.files:
+            try:
+                st=os.stat(path)
+                stamp.append((st.st_mtime_ns,st.st_size))
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    def _load(self):
+        """!Loads and validates the files, recording the environment and
+        filesystem queries that the document depends on."""
+        import crow.config
+        from crow.config.tools import start_probe_log, stop_probe_log
+        self.stamp=self._stamp()
+        self.config=None
+        log,old=start_probe_log()
+        try:
+            config=crow.config.from_file(*self.files)
+        except Exception as e:
+            _logger.error(f'{" ".join(self.files)}: cannot load: {e}')
+            return
+        finally:
+            stop_probe_log(log,old)
+        crow.config.invalidate_cache(config,recurse=True)
+        self.config, self.probes = config, log
+        _logger.info(f'{" ".join(self.files)}: loaded')
+
+    def process_request(self,request,client_address):
+        self.last_request=time.monotonic()
+        if self._stamp()!=self.stamp: self._load()
+        super().process_request(request,client_address)
+
+    def handle_timeout(self):
+        super().handle_timeout()
+        if time.monotonic()-self.last_request>=self.idle_timeout:
+            self.idle=True
+
+    def reap_children(self):
+        """!Waits for all forked children to exit."""
+        for pid in list(self.active_children or ()):
+            try:
+                os.waitpid(pid,0)
+            except ChildProcessError:
+                pass
+        self.active_children=None
+
+    def answer(self,message):
+        """!Processes one request in a forked child, in the caller's
+        working directory and environment."""
+        from crow.config.tools import ENV, probes_unchanged
+        if self.config is None: return { 'fallback':True }
+        os.chdir(message['cwd'])
+        os.environ.clear()
+        os.environ.update(message['env'])
+        ENV.clear()
+        ENV.update(message['env'])
+        if not probes_unchanged(self.probes): return { 'fallback':True }
+        stdout, stderr = io.StringIO(), io.StringIO()
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler,logging.StreamHandler):
+                handler.setStream(stderr)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                status=self.process(message['argv'],(self.files,self.config))
+            except Fallback:
+                return { 'fallback':True }
+            except SystemExit as se:
+                status=se.code if isinstance(se.code,int) else 1
+            except Exception:
+                traceback.print_exc()
+                status=1
+        return { 'status':status, 'stdout':stdout.getvalue(),
+                 'stderr':stderr.getvalue() }
+
+def serve(path,files,process,idle_timeout=IDLE_TIMEOUT):
+    """!Runs a ConfigDaemon on the Unix socket path until it has been
+    idle for idle_timeout seconds.  A stale socket file is replaced,
+    but not one with a daemon listening on it."""
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise OSError(f'{path}: a daemon is already listening')
+    with ConfigDaemon(path,files,process,idle_timeout) as daemon:
+        try:
+            while not daemon.idle:
+                daemon.handle_request()
+                daemon.collect_children()
+        finally:
+            os.unlink(path)
+            daemon.reap_children()
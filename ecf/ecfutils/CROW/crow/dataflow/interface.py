@@ -125,6 +125,10 @@ class Dataflow(object):
         with transaction(self._con):
             add_cycle(self._con,cycle)
 
+    def add_cycles(self,cycles: List[datetime]) -> None:
+        with transaction(self._con):
+            add_cycles(self._con,cycles)
+
     def del_cycle(self,cycle: datetime) -> None:
         _logger.debug(f'{cycle:%Y-%m-%dt%H:%M:%S}: delete Data table '
                       'entries for cycle')
@@ -5,10 +5,11 @@ from collections import Sequence
 from sqlite3 import Cursor, Connection
 from typing import Generator, Callable, List, Tuple, Any, Union, Dict, IO
 from contextlib import contextmanager
+from crow.tools import compile_fstring
 
 __all__=['from_datetime','transaction','add_slots','itercur','create_tables',
          'get_meta','add_message','set_data','get_location','select_slot',
-         'del_cycle','add_cycle','add_one_slot']
+         'del_cycle','add_cycle','add_cycles','add_one_slot']
 
 _logger=logging.getLogger('crow.dataflow')
 _ZERO_DT=timedelta(seconds=0)
@@ -45,12 +46,16 @@ CREATE TABLE IF NOT EXISTS Meta (
   CONSTRAINT pid_name UNIQUE (pid,name,ival,sval)
 );
 
+CREATE INDEX IF NOT EXISTS Slot_actor_slot_flow ON Slot (actor,slot,flow);
+CREATE INDEX IF NOT EXISTS Data_cycle ON Data (cycle);
+CREATE INDEX IF NOT EXISTS Meta_pid ON Meta (pid,ityp);
+
 CREATE TEMP TABLE IF NOT EXISTS Row(n INTEGER,pid INTEGER);
 '''
 
 @contextmanager
 def transaction(con: Connection) -> Generator:
-    if not con.in_transaction:
+    if con.in_transaction:
         yield
     else:
         con.execute('BEGIN TRANSACTION')
@@ -59,7 +64,6 @@ def transaction(con: Connection) -> Generator:
             con.execute('END TRANSACTION')
         except Exception as e:
             con.execute('ROLLBACK TRANSACTION')
-            con.execute('END TRANSACTION')
             raise
 
 def _conex(con: Connection,*args) -> Cursor:
@@ -175,6 +179,15 @@ def add_slots(con: Connection,actor: str,slot: str,flow: str,defloc: str,meta: D
     # can simply add the slot
     add_one_slot(con,actor,slot,flow,defloc,meta)
 
+def _add_meta(meta: Dict,name: str,pyval: Any) -> None:
+    if name in meta:
+        if isinstance(meta[name],list) and pyval not in meta[name]:
+            meta[name].append(pyval)
+        elif not isinstance(meta[name],list) and meta[name]!=pyval:
+            meta[name]=[ meta[name], pyval ]
+    else:
+        meta[name]=pyval
+
 def get_meta(con: Connection,pid: int) -> Dict:
     meta=dict()
     for ityp in range(len(_ITYP_DATA)):
@@ -182,14 +195,7 @@ def get_meta(con: Connection,pid: int) -> Dict:
         for name,pval in itercur(_conex(con,
               f'SELECT name,{fld} FROM Meta WHERE pid==? AND ityp=?',
               [pid,ityp])):
-            pyval=back(pval)
-            if name in meta:
-                if isinstance(meta[name],list) and pyval not in meta[name]:
-                    meta[name].append(pyval)
-                elif not isinstance(meta[name],list) and meta[name]!=pyval:
-                    meta[name]=[ meta[name], pyval ]
-            else:
-                meta[name]=pyval
+            _add_meta(meta,name,back(pval))
     return meta
 
 def add_message(con: Connection,send: int,recv: int,
@@ -266,26 +272,52 @@ def select_slot(con: Connection,actor: str=None,slot: str=None,flow: str=None,
 def del_cycle(con,cycle):
     con.execute('DELETE FROM Data WHERE cycle=?',[from_datetime(cycle)])
 
-def add_cycle(con,cycle: datetime) -> None:
-    args=list() # type: List[Any]
-    scycle=from_datetime(cycle)
-    for pid,actor,slot,defloc in itercur(_conex(con,
-            'SELECT pid,actor,slot,defloc FROM Slot WHERE flow="O" AND '
-            'defloc IS NOT NULL')):
-        globals={'cycle':cycle,'actor':actor,'slot':slot}
+def _output_slots_with_defloc(con: Connection) -> List[Tuple[int,str,str,str,Dict]]:
+    """!Returns (pid,actor,slot,defloc,meta) for all output slots that
+    have a default location, from one query that joins the Slot and
+    Meta tables."""
+    slots=list() # type: List[Tuple[int,str,str,str,Dict]]
+    for pid,actor,slot,defloc,name,ityp,ival,sval in itercur(_conex(con,
+            'SELECT Slot.pid,actor,slot,defloc,name,ityp,ival,sval '
+            'FROM Slot LEFT JOIN Meta ON Slot.pid=Meta.pid '
+            'WHERE flow="O" AND defloc IS NOT NULL '
+            'ORDER BY Slot.pid,ityp')):
+        if not slots or slots[-1][0]!=pid:
+            slots.append((pid,actor,slot,defloc,dict()))
+        if name is None: continue
+        cls,fld,cmp2,back,fore=_ITYP_DATA[ityp]
+        _add_meta(slots[-1][4],name,back(ival if fld=='ival' else sval))
+    return slots
+
+def add_cycles(con,cycles: List[datetime]) -> None:
+    """!Adds the Data table entries for the default locations of all
+    output slots, for several cycles at once.  The slot metadata is
+    read once, and each default location is compiled once."""
+    slots=list()
+    for pid,actor,slot,defloc,meta in _output_slots_with_defloc(con):
         if "'''" in defloc:
             _logger.error(
                 f"Cannot have ''' in default location: {defloc}")
             continue
-        meta=get_meta(con,pid)
-        exec_me="f'''"+defloc+"'''"
-        try:
-            loc=eval(exec_me,globals,meta)
-        except(Exception) as e:
-            _logger.error(f"defloc {defloc}: {e} (actor={actor} slot={slot} meta={meta})")
-            continue
-        _logger.debug(f'loc {loc} for cycle={cycle:%Y%m%d%H%M} actor={actor} slot={slot} meta={meta}')
-        args.extend([pid,scycle,loc])
+        slots.append((pid,actor,slot,defloc,meta,compile_fstring(defloc)))
+    args=list() # type: List[Tuple[int,str,str]]
+    debug=_logger.isEnabledFor(logging.DEBUG)
+    for cycle in cycles:
+        scycle=from_datetime(cycle)
+        for pid,actor,slot,defloc,meta,code in slots:
+            globals={'cycle':cycle,'actor':actor,'slot':slot}
+            try:
+                loc=eval(code,globals,meta)
+            except(Exception) as e:
+                _logger.error(f"defloc {defloc}: {e} (actor={actor} slot={slot} meta={meta})")
+                continue
+            if debug:
+                _logger.debug(f'loc {loc} for cycle={cycle:%Y%m%d%H%M} actor={actor} slot={slot} meta={meta}')
+            args.append((pid,scycle,loc))
     if not args: return
-    _conex(con,'INSERT OR IGNORE INTO Data(pid,cycle,loc) VALUES ' + \
-               '(?,?,?), '*(len(args)//3-1) + '(?,?,?);',args)
+    with transaction(con):
+        con.executemany('INSERT OR IGNORE INTO Data(pid,cycle,loc) '
+                        'VALUES (?,?,?);',args)
+
+def add_cycle(con,cycle: datetime) -> None:
+    add_cycles(con,[cycle])
@@ -1,4 +1,16 @@
-from .rocoto import to_rocoto
-from .ecflow import to_ecflow
+__all__=[ 'to_rocoto', 'write_rocoto', 'to_ecflow' ]
 
-__all__=[ 'to_rocoto', 'to_ecflow' ]
+# The generators are imported on first use, so that a program that
+# only needs one of them does not pay for importing the other.
+
+def to_rocoto(suite):
+    from .rocoto import to_rocoto
+    return to_rocoto(suite)
+
+def write_rocoto(suite,fd):
+    from .rocoto import write_rocoto
+    return write_rocoto(suite,fd)
+
+def to_ecflow(suite,workers=1,store=None):
+    from .ecflow import to_ecflow
+    return to_ecflow(suite,workers,store)
@@ -1,6 +1,14 @@
-"""In-place simplification of dependency trees by applying rules of
-boolean algebra.  Ensures short circuit assumptions still hold."""
+"""Simplification of dependency trees by applying rules of boolean
+algebra.  Ensures short circuit assumptions still hold.
 
+The trees made here are hash-consed: intern() returns a shared copy
+of a tree in which structurally identical subtrees are the same
+object.  The complexity and simplification of each shared node are
+computed only once, and simplify() returns shared trees.  Shared
+trees must never be modified.  Use copy_dependencies() to get a tree
+that can be modified."""
+
+import weakref
 import crow.config
 from crow.config import OrDependency,AndDependency,NotDependency, \
     TRUE_DEPENDENCY, FALSE_DEPENDENCY, LogicalDependency,\
@@ -8,7 +16,73 @@ from crow.config import OrDependency,AndDependency,NotDependency, \
     EventDependency, RUNNING, COMPLETED, FAILED, TaskExistsDependency
 from crow.tools import typecheck, NamedConstant
 
-__all__=[ 'complexity', 'simplify', 'assume' ]
+__all__=[ 'complexity', 'simplify', 'assume', 'intern' ]
+
+## Shared nodes, by structure.  Leaves are keyed by the view they
+## refer to, and other nodes by the ids of their shared children,
+## which live at least as long as the node does.
+_interned=weakref.WeakValueDictionary()
+
+## Memoized simplify() result of a node that is already as simple
+## as it gets, to avoid a reference from the node to itself.
+_SIMPLEST=NamedConstant('_SIMPLEST')
+
+def _leaf_key(tree):
+    if isinstance(tree,StateDependency):
+        return ( StateDependency, id(tree.view), tuple(tree.view.path),
+                 tree.state ), lambda: StateDependency(tree.view,tree.state)
+    elif isinstance(tree,EventDependency):
+        return ( EventDependency, id(tree.event), tuple(tree.event.path) ), \
+            lambda: EventDependency(tree.event)
+    elif isinstance(tree,TaskExistsDependency):
+        return ( TaskExistsDependency, id(tree.view), tuple(tree.view.path) ), \
+            lambda: TaskExistsDependency(tree.view)
+    elif isinstance(tree,CycleExistsDependency):
+        return ( CycleExistsDependency, tree.dt ), \
+            lambda: CycleExistsDependency(tree.dt)
+    return None, None
+
+def _is_interned(tree):
+    key=getattr(tree,'_algebra_key',None)
+    return key is not None and _interned.get(key) is tree
+
+def intern(tree):
+    """!Returns the shared copy of a dependency tree.  Trees with the
+    same structure, referring to the same views, give the same
+    object.  The tree itself is not modified, and the result must not
+    be modified either."""
+    if tree is TRUE_DEPENDENCY or tree is FALSE_DEPENDENCY: return tree
+    if _is_interned(tree): return tree
+    if isinstance(tree,AndDependency) or isinstance(tree,OrDependency):
+        depends=[ intern(dep) for dep in tree ]
+        key=(type(tree),)+tuple([ id(dep) for dep in depends ])
+        make=lambda: type(tree)(*depends)
+    elif isinstance(tree,NotDependency):
+        depend=intern(tree.depend)
+        key=(NotDependency,id(depend))
+        make=lambda: NotDependency(depend)
+    else:
+        key,make=_leaf_key(tree)
+        if key is None: return tree # constants of other classes
+    shared=_interned.get(key)
+    if shared is None:
+        shared=make()
+        shared._algebra_key=key
+        _interned[key]=shared
+    return shared
+
+def _unchanged(tree,depends):
+    # Would combining these results of assume() on the children of an
+    # And, Or or Not node give a tree equal to the node?  That is so
+    # if they are its own children, and none of them would be dropped
+    # or merged by the &, | or ~ operators.  Returning the node itself
+    # keeps shared trees shared.
+    if len(depends)<2 and not isinstance(tree,NotDependency): return False
+    for old,new in zip(tree,depends):
+        if new is not old or type(new) is type(tree) or \
+           new==TRUE_DEPENDENCY or new==FALSE_DEPENDENCY:
+            return False
+    return True
 
 def assume(tree,existing_cycles,current_cycle,assume_complete=None,
            assume_never_run=None):
@@ -29,20 +103,26 @@ def assume(tree,existing_cycles,current_cycle,assume_complete=None,
         else:
             return FALSE_DEPENDENCY
     elif isinstance(tree,AndDependency):
+        depends=[ assume(d,existing_cycles,current_cycle,assume_complete,
+                         assume_never_run) for d in tree ]
+        if _unchanged(tree,depends): return tree
         a=TRUE_DEPENDENCY
-        for d in tree:
-            a=a & assume(d,existing_cycles,current_cycle,assume_complete,
-                         assume_never_run)
+        for d in depends:
+            a=a & d
         return a
     elif isinstance(tree,OrDependency):
+        depends=[ assume(d,existing_cycles,current_cycle,assume_complete,
+                         assume_never_run) for d in tree ]
+        if _unchanged(tree,depends): return tree
         a=FALSE_DEPENDENCY
-        for d in tree:
-            a=a | assume(d,existing_cycles,current_cycle,assume_complete,
-                         assume_never_run)
+        for d in depends:
+            a=a | d
         return a
     elif isinstance(tree,NotDependency):
-        return ~assume(tree.depend,existing_cycles,current_cycle,
-                       assume_complete,assume_never_run)
+        depend=assume(tree.depend,existing_cycles,current_cycle,
+                      assume_complete,assume_never_run)
+        if _unchanged(tree,[depend]): return tree
+        return ~depend
     elif isinstance(tree,StateDependency):
         if assume_never_run and assume_never_run(tree.path):
             return FALSE_DEPENDENCY
@@ -66,6 +146,14 @@ def assume(tree,existing_cycles,current_cycle,assume_complete=None,
     return tree
 
 def complexity(tree):
+    if not _is_interned(tree): return _complexity(tree)
+    try:
+        return tree._algebra_complexity
+    except AttributeError:
+        tree._algebra_complexity=_complexity(tree)
+        return tree._algebra_complexity
+
+def _complexity(tree):
     if isinstance(tree,AndDependency) or isinstance(tree,OrDependency):
         return 1.2*sum([ complexity(dep) for dep in tree.depends ])
     elif isinstance(tree,NotDependency):
@@ -73,10 +161,21 @@ def complexity(tree):
     return 1
 
 def simplify(tree):
+    """!Returns a simplified, shared copy of the tree.  The tree itself
+    is not modified.  Results are memoized per shared node."""
     typecheck('tree',tree,LogicalDependency)
-    tree=tree.copy_dependencies()
-    tree=simplify_no_de_morgan(tree)
-    return de_morgan(tree)
+    tree=intern(tree)
+    if not _is_interned(tree):
+        return de_morgan(simplify_no_de_morgan(tree))
+    try:
+        simplified=tree._algebra_simplified
+    except AttributeError:
+        simplified=intern(de_morgan(simplify_no_de_morgan(tree)))
+        tree._algebra_simplified = \
+            _SIMPLEST if simplified is tree else simplified
+    else:
+        if simplified is _SIMPLEST: simplified=tree
+    return simplified
 
 def simplify_no_de_morgan(tree):
     # Apply all simplificatios except de morgan's law.  Called from
@@ -85,27 +184,28 @@ def simplify_no_de_morgan(tree):
     if isinstance(tree,OrDependency) or isinstance(tree,AndDependency):
         tree=simplify_sequence(tree)
     if isinstance(tree,NotDependency):
-        tree.depend=simplify(tree.depend)
-        if isinstance(tree.depend,NotDependency):
-            return tree.depend.depend # not not x = x
-        elif tree.depend==TRUE_DEPENDENCY:
+        depend=simplify(tree.depend)
+        if isinstance(depend,NotDependency):
+            return depend.depend # not not x = x
+        elif depend==TRUE_DEPENDENCY:
             return FALSE_DEPENDENCY  # NOT true = false
-        elif tree.depend==FALSE_DEPENDENCY:
+        elif depend==FALSE_DEPENDENCY:
             return TRUE_DEPENDENCY  # NOT false = true
+        elif depend is not tree.depend:
+            tree=NotDependency(depend)
     return tree
 
 def de_morgan(tree):
     # Apply de morgan's law, choose least complex option.
     if not isinstance(tree,NotDependency): return tree
-    dup=tree.copy_dependencies()
-    if isinstance(dup.depend,AndDependency):
+    if isinstance(tree.depend,AndDependency):
         # not ( x and y ) = (not x) or (not y)
         alternative=simplify_no_de_morgan(OrDependency(
-            *[ NotDependency(dep) for dep in dup.depend.depends ]))
-    elif isinstance(dup.depend,OrDependency):
+            *[ NotDependency(dep) for dep in tree.depend.depends ]))
+    elif isinstance(tree.depend,OrDependency):
         # not ( x or y ) = (not x) and (not y)
         alternative=simplify_no_de_morgan(AndDependency(
-            *[ NotDependency(dep) for dep in dup.depend.depends ]))
+            *[ NotDependency(dep) for dep in tree.depend.depends ]))
     else: return tree
     if complexity(alternative)<complexity(tree):
         return alternative
@@ -114,28 +214,24 @@ def de_morgan(tree):
 def and_merge_ors(ors):
     # (X + B1 + B2 + Y) + (X + C1 + C2 + Y) = X + (B1+B2)(C1+C2) + Y
     original=AndDependency(*ors)
-    ors=original.copy_dependencies().depends
-    assert(isinstance(ors,list))
+    ors=[ list(orr.depends) for orr in ors ]
     min_len=min([ len(orr) for orr in ors ])
     i=0
-    while i<min_len and all( [ ors[j].depends[i]==ors[0].depends[i] for j in range(len(ors)) ] ):
+    while i<min_len and all( [ ors[j][i]==ors[0][i] for j in range(len(ors)) ] ):
         i=i+1
 
-    common_before=ors[0].depends[0:i]
-    for j in range(len(ors)):
-        ors[j].depends=ors[j].depends[i:]
+    common_before=ors[0][0:i]
+    ors=[ orr[i:] for orr in ors ]
 
     i=-1
     min_len=min([ len(orr) for orr in ors ])
     neg_limit=-min_len-1
-    while i>neg_limit and all( [ ors[j].depends[i]==ors[0].depends[-1] for j in range(len(ors)) ] ):
+    while i>neg_limit and all( [ ors[j][i]==ors[0][-1] for j in range(len(ors)) ] ):
         i=i-1
 
-    common_after=ors[0].depends[i+1:]
+    common_after=ors[0][i+1:]
     if i<-1:
-        for j in range(len(ors)):
-            new=ors[j].depends[:i+1]
-            ors[j].depends=new
+        ors=[ orr[:i+1] for orr in ors ]
 
     if len(common_before)>1:
         dep=OrDependency(*common_before)
@@ -149,9 +245,9 @@ def and_merge_ors(ors):
     for orr in ors:
         have_middle_dep=have_middle_dep or len(orr)
         if len(orr)>1:
-            middle_dep=middle_dep&orr
+            middle_dep=middle_dep&OrDependency(*orr)
         elif len(orr):
-            middle_dep=middle_dep&orr.depends[0]
+            middle_dep=middle_dep&orr[0]
     if have_middle_dep: dep = dep | middle_dep
 
     if len(common_after)>1:
@@ -164,7 +260,7 @@ def and_merge_ors(ors):
     return None
 
 def simplify_sequence(dep,no_merge=False):
-    deplist=dep.depends
+    deplist=list(dep.depends)
     cls=type(dep)
     is_or = isinstance(dep,OrDependency)
 
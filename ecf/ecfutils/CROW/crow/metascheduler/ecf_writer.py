@@ -0,0 +1,128 @@
+"""!Writes the suite definition and ecf files of an ecFlow workflow
+to disk, touching only the files whose contents changed.
+
+Regenerating the files of a workflow usually produces mostly the same
+text as last time.  The writer keeps a manifest, in the target
+directory, with the hash, size and modification time of each file it
+wrote.  A file is skipped if its new contents have the same hash and
+the file on disk still has the size and time in the manifest.  Other
+files are written to a temporary file and renamed into place, so a
+reader never sees a partial file.  Each directory is created once, and
+the writes can be done from a pool of threads.
+
+@note Environment variables
+
+ * CROW_ECF_MANIFEST=NO rewrites every file, and does not keep a
+   manifest."""
+
+import os, hashlib, logging, threading
+from collections import namedtuple
+
+__all__=[ 'WriteStats', 'write_files', 'MANIFEST_NAME' ]
+_logger=logging.getLogger('crow.metascheduler')
+
+## Name of the manifest file in the target directory
+MANIFEST_NAME='.crow-ecf-manifest'
+
+## Counts of files written and skipped by write_files(), and the
+## number of bytes written.
+WriteStats=namedtuple('WriteStats',[ 'written', 'skipped', 'bytes' ])
+
+def _use_manifest():
+    return os.environ.get('CROW_ECF_MANIFEST','YES').upper() not in \
+        ( 'NO', 'N', 'FALSE', 'F', 'OFF', '0' )
+
+def _read_manifest(path):
+    """!Returns a dict from file path, relative to the target
+    directory, to (hash, size, mtime in ns).  A missing or damaged
+    manifest is empty."""
+    manifest=dict()
+    try:
+        with open(path,'rt') as fd:
+            for line in fd:
+                digest,size,mtime,relpath=line.rstrip('\n').split(' ',3)
+                manifest[relpath]=(digest,int(size),int(mtime))
+    except FileNotFoundError:
+        pass
+    except (OSError,ValueError) as e:
+        _logger.warning(f'{path}: ignoring unreadable manifest: {e}')
+        manifest=dict()
+    return manifest
+
+def _write_atomically(path,data):
+    """!Writes data to a temporary file next to path, and renames it to
+    path.  Returns the os.stat_result of the new file."""
+    temp=os.path.join(os.path.dirname(path),
+        f'.{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        fd=os.open(temp,os.O_WRONLY|os.O_CREAT|os.O_TRUNC,0o666)
+        with open(fd,'wb') as fopen:
+            fopen.write(data)
+            fopen.flush()
+            stat=os.fstat(fopen.fileno())
+        os.replace(temp,path)
+        temp=None
+        return stat
+    finally:
+        if temp is not None and os.path.lexists(temp):
+            os.unlink(temp)
+
+def _unchanged(path,entry,digest):
+    if entry is None or entry[0]!=digest: return False
+    try:
+        stat=os.stat(path)
+    except FileNotFoundError:
+        return False
+    return (stat.st_size,stat.st_mtime_ns)==entry[1:]
+
+def write_files(directory,files,workers=1):
+    """!Writes files, a dict from path relative to directory to the
+    text of the file, below directory.  Files whose text is unchanged
+    since the last call for this directory are skipped.  Uses up to
+    workers threads; 0 or None means one per CPU.  Returns a
+    WriteStats."""
+    use_manifest=_use_manifest()
+    manifest_path=os.path.join(directory,MANIFEST_NAME)
+    manifest=_read_manifest(manifest_path) if use_manifest else dict()
+
+    # Decide what to write, and make each directory once.
+    todo=list()
+    skipped=0
+    for relpath,text in files.items():
+        data=text.encode('utf-8')
+        digest=hashlib.sha256(data).hexdigest()
+        path=os.path.join(directory,relpath)
+        if use_manifest and _unchanged(path,manifest.get(relpath),digest):
+            skipped+=1
+        else:
+            todo.append((relpath,path,data,digest))
+    for dirname in sorted(set([ os.path.dirname(item[1]) for item in todo ])):
+        os.makedirs(dirname,exist_ok=True)
+
+    def write(item):
+        relpath,path,data,digest=item
+        _logger.debug(f'{path}: write {len(data)} bytes')
+        stat=_write_atomically(path,data)
+        return relpath,(digest,stat.st_size,stat.st_mtime_ns)
+
+    if workers is None or workers<1:
+        workers=os.cpu_count() or 1
+    if workers>1 and len(todo)>1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(min(workers,len(todo))) as pool:
+            entries=list(pool.map(write,todo))
+    else:
+        entries=[ write(item) for item in todo ]
+
+    if use_manifest and entries:
+        manifest.update(entries)
+        os.makedirs(directory,exist_ok=True)
+        _write_atomically(manifest_path,''.join([
+            f'{digest} {size} {mtime} {relpath}\n'
+            for relpath,(digest,size,mtime) in sorted(manifest.items())
+        ]).encode('utf-8'))
+
+    stats=WriteStats(len(todo),skipped,sum([ len(item[2]) for item in todo ]))
+    _logger.info(f'{directory}: wrote {stats.written} files '
+                 f'({stats.bytes} bytes), skipped {stats.skipped} unchanged')
+    return stats
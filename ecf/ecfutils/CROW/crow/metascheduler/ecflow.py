@@ -1,4 +1,4 @@
-import collections, datetime, re, logging
+import collections, datetime, re, logging, os, multiprocessing
 from collections import OrderedDict
 
 from io import StringIO
@@ -8,6 +8,7 @@ from copy import copy
 from crow.tools import to_timedelta, typecheck, ZERO_DT
 from crow.metascheduler.algebra import simplify, assume
 from crow.metascheduler.graph import Graph
+from crow.config.tools import start_probe_log, stop_probe_log
 from crow.config import SuiteView, Suite, Depend, LogicalDependency, \
           AndDependency, OrDependency, NotDependency, \
           StateDependency, Dependable, Taskable, Task, \
@@ -20,6 +21,10 @@ f'This module requires python 3.6 or newer.'
 
 _logger=logging.getLogger('to_ecflow')
 
+## The ToEcflow whose suite definitions are being made by forked
+## worker processes; see ToEcflow._make_suite_defs_in_parallel
+_forked=None
+
 ECFLOW_STATE_MAP={ COMPLETED:'complete',
                    RUNNING:'active',
                    FAILED:'aborted' }
@@ -115,7 +120,7 @@ def dep_to_ecflow(fd,task,dep,clock,time_format,undated):
                           dep.event.path[-1],clock,time_format,False,undated)
 
 class ToEcflow(object):
-    def __init__(self,suite):
+    def __init__(self,suite,store=None):
         if not isinstance(suite,Suite):
             raise TypeError('The suite argument must be a Suite, '
                             'not a '+type(suite).__name__)
@@ -151,6 +156,9 @@ class ToEcflow(object):
         self.undated=OrderedDict()
         self.graph=Graph(self.suite,self.suite.Clock)
         self.type='ecflow'
+        self.__cycle=None
+        self.store=store
+        self.__restored=set()
 
     def datestring(self,format):
         def replacer(m):
@@ -172,10 +180,28 @@ class ToEcflow(object):
     def _cycles_to_analyze(self):
         return self.suite.ecFlow.get('analyze_cycles',self.suite.Clock)
 
+    def _cycles_to_simplify(self):
+        # With a graph store, every analyzed cycle is simplified as if
+        # it was written, so that it can be stored for later calls.
+        if self.store is not None:
+            return self._cycles_to_analyze()
+        return self._cycles_to_write()
+
     def _select_cycle(self,cycle):
-        invalidate_cache(self.suite,recurse=True)
-        validate(self.suite,stage='suite',recurse=True)
+        """!Sets up self.suite to handle the given cycle.  The suite is
+        invalidated and validated only once.  After that, only the
+        Clock and the values calculated from it are discarded, so the
+        suite views and everything that does not depend on the cycle
+        stay cached from one cycle to the next."""
+        if self.__cycle is None:
+            invalidate_cache(self.suite,recurse=True)
+            validate(self.suite,stage='suite',recurse=True)
+        elif cycle==self.__cycle:
+            return
+        else:
+            invalidate_cache(self.suite,'Clock')
         self.suite.Clock.now = cycle
+        self.__cycle=cycle
 
     def _foreach_cycle(self,clock):
         """!Iterates over all cycles in the clock, ensuring self.suite is
@@ -184,8 +210,8 @@ class ToEcflow(object):
         clock=copy(clock)
         # Cannot iterate over self.suite.Clock because
         # self.suite.Clock is not a Clock. It is an object that
-        # generates a Clock.  Hence, invalidate_cache causes a new
-        # clock to be generated.
+        # generates a Clock.  Hence, invalidating the suite's Clock
+        # causes a new clock to be generated.
         for clock in clock.iternow():
             self._select_cycle(clock.now)
             yield clock.now
@@ -193,25 +219,58 @@ class ToEcflow(object):
     def _remove_final_task(self):
         if 'final' not in self.suite: return
         assert('final' in self.suite)
-        for cycle in self._foreach_cycle(self._cycles_to_write()):
+        for cycle in self._foreach_cycle(self._cycles_to_simplify()):
+            if cycle in self.__restored: continue
             dt=cycle-self.clock.start
             self.graph.force_never_run(self.suite.final.at(dt).path)
 
     def _initialize_graph(self):
-        _logger.info('populate job graph...')
-        self._populate_job_graph()
-        _logger.info('simplify job graph...')
-        self._remove_final_task()
-        self._simplify_job_graph()
+        # The environment and filesystem queries made while analyzing
+        # are stored with each analyzed cycle, if there is a store.
+        log,old=start_probe_log()
+        try:
+            _logger.info('populate job graph...')
+            self._populate_job_graph()
+            _logger.info('simplify job graph...')
+            self._remove_final_task()
+            simplified=self._simplify_job_graph()
+        finally:
+            stop_probe_log(log,old)
+        if self.store is not None:
+            for cycle in simplified:
+                self.store.save(self.clock,cycle,
+                                self.graph.node_states(cycle),log)
+
+    def _restore_cycle(self,cycle):
+        """!Adds a cycle analyzed by an earlier call from the graph store,
+        if it has one.  Returns True on success."""
+        if self.store is None: return False
+        states=self.store.load(self.suite,self.clock,cycle)
+        if states is None: return False
+        try:
+            self.graph.add_cycle(cycle,states)
+        except KeyError as ke:
+            _logger.debug(f'{cycle:%Y%m%d%H%M}: stored graph has no {ke}')
+            return False
+        _logger.info(f'{cycle:%Y%m%d%H%M}: restored analyzed job graph')
+        self.__restored.add(cycle)
+        return True
 
     def _populate_job_graph(self):
         for cycle in self._foreach_cycle(self._cycles_to_analyze()):
+            if self._restore_cycle(cycle): continue
             _logger.info(f'{cycle:%Y%m%d%H%M}: populate job graph...')
             self.graph.add_cycle(cycle)
 
     def _simplify_job_graph(self):
-        for cycle in self._foreach_cycle(self._cycles_to_write()):
-            self.graph.simplify_cycle(cycle)
+        """!Simplifies the cycles that were not restored from the graph
+        store, and returns a list of them."""
+        simplified=list()
+        for cycle in self._foreach_cycle(self._cycles_to_simplify()):
+            if cycle not in self.__restored:
+                self.graph.simplify_cycle(cycle)
+                simplified.append(cycle)
+        return simplified
 
     def _walk_job_graph(self,cycle,skip_fun=None,enter_fun=None,exit_fun=None):
         self._select_cycle(cycle)
@@ -306,10 +365,14 @@ class ToEcflow(object):
 
     # ecf file generation
 
+    def _node_at(self,view,dt):
+        """!Returns the graph node of view.at(dt) without making the view."""
+        return self.graph.get_node(SuitePath([view.path[0]+dt]+view.path[1:]))
+
     def _make_task_ecf_files(self,ecf_files,ecf_file_set,
                                ecf_file_path,task):
         dt=self.suite.Clock.now-self.suite.Clock.start
-        if skip_fun(self.graph.get_node(task.at(dt).path)):
+        if skip_fun(self._node_at(task,dt)):
             return
         ecf_file_set=task.get('ecf_file_set',ecf_file_set)
         ecf_file_path=ecf_file_path+[task.path[-1]]
@@ -321,7 +384,7 @@ class ToEcflow(object):
     def _make_family_ecf_files(self,ecf_files,ecf_file_set,
                                ecf_file_path,family):
         dt=self.suite.Clock.now-self.suite.Clock.start
-        if skip_fun(self.graph.get_node(family.at(dt).path)):
+        if skip_fun(self._node_at(family,dt)):
             return
         ecf_file_set=family.get('ecf_file_set',ecf_file_set)
         ecf_file_path=ecf_file_path+[family.path[-1]]
@@ -344,27 +407,87 @@ class ToEcflow(object):
 
     ####################################################################
 
-    def to_ecflow(self):
-        suite_def_files=dict()
-        ecf_files=collections.defaultdict(dict)
-        self._initialize_graph()
+    def _cycles_with_suite_defs(self):
+        """!Returns a list of (cycle, filename) for the cycles to write,
+        skipping cycles whose suite definition file is the same as an
+        earlier cycle's."""
+        cycles=list()
+        filenames=set()
         for cycle in self._foreach_cycle(self._cycles_to_write()):
-            _logger.info(f'{cycle:%Y%m%d%H%M}: make suite definition in memory...')
             # Figure our where we are making the suite definition file:
             filename=cycle.strftime(self.suite.ecFlow.suite_def_filename)
-            if filename in suite_def_files:
-                # We already processed a cycle whose suite definition
+            if filename in filenames:
+                # We already have a cycle whose suite definition
                 # is the same as this one's.  Skip.
                 continue
+            filenames.add(filename)
+            cycles.append((cycle,filename))
+        return cycles
+
+    def _make_suite_defs(self,cycles):
+        """!Makes the suite definitions and ecf files for a list of
+        (cycle, filename), in order.  An ecf file is taken from the
+        first cycle that has it."""
+        suite_def_files=dict()
+        ecf_files=collections.defaultdict(dict)
+        for cycle,filename in cycles:
+            _logger.info(f'{cycle:%Y%m%d%H%M}: make suite definition in memory...')
             suite_name, suite_def = self._make_suite_def(cycle)
             assert(isinstance(suite_name,str))
             assert(isinstance(suite_def,str))
             suite_def_files[filename]={ 'name':suite_name, 'def':suite_def }
             _logger.info(f'{cycle:%Y%m%d%H%M}: make ecf files in memory...')
             self._make_ecf_files_for_one_cycle(ecf_files)
-        del self.suite
         return suite_def_files,ecf_files
 
-def to_ecflow(suite):
+    def _make_suite_defs_in_parallel(self,cycles,workers):
+        """!Same as _make_suite_defs, but splits the cycles into
+        contiguous chunks, one per worker process.  The workers are
+        forked after the job graph is made, so they share it and the
+        suite instead of receiving copies.  The chunks' results are
+        merged in cycle order, so the result is the same as that of
+        _make_suite_defs."""
+        global _forked
+        chunks=[ cycles[i*len(cycles)//workers:(i+1)*len(cycles)//workers]
+                 for i in range(workers) ]
+        _logger.info(f'make {len(cycles)} suite definitions in '
+                     f'{workers} processes...')
+        _forked=self
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results=pool.map(_make_suite_defs_in_worker,chunks)
+        finally:
+            _forked=None
+        suite_def_files=dict()
+        ecf_files=collections.defaultdict(dict)
+        for chunk_suite_defs,chunk_ecf_files in results:
+            suite_def_files.update(chunk_suite_defs)
+            for setname,files in chunk_ecf_files.items():
+                merged=ecf_files[setname]
+                for path_string,contents in files.items():
+                    merged.setdefault(path_string,contents)
+        return suite_def_files,ecf_files
+
+    def to_ecflow(self,workers=1):
+        """!Makes the suite definitions and ecf files.  If workers is
+        more than 1, they are made in that many processes, after the
+        job graph is made.  If workers is 0 or None, one process per
+        CPU is used."""
+        self._initialize_graph()
+        cycles=self._cycles_with_suite_defs()
+        if not workers:
+            workers=os.cpu_count() or 1
+        workers=min(workers,len(cycles))
+        if workers>1:
+            result=self._make_suite_defs_in_parallel(cycles,workers)
+        else:
+            result=self._make_suite_defs(cycles)
+        del self.suite
+        return result
+
+def _make_suite_defs_in_worker(cycles):
+    return _forked._make_suite_defs(cycles)
+
+def to_ecflow(suite,workers=1,store=None):
     typecheck('suite',suite,Suite)
-    return ToEcflow(suite).to_ecflow()
+    return ToEcflow(suite,store).to_ecflow(workers)
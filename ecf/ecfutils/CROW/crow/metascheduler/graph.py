@@ -10,7 +10,9 @@ from collections import OrderedDict
 
 from .algebra import simplify as algebra_simplify
 from .algebra import assume as algebra_assume
-from crow.config import TRUE_DEPENDENCY,FALSE_DEPENDENCY,Suite
+from .algebra import intern as algebra_intern
+from crow.config import TRUE_DEPENDENCY,FALSE_DEPENDENCY,Suite, \
+    StateDependency,EventDependency,TaskExistsDependency
 from crow.tools import NamedConstant,Clock,typecheck,MISSING,ZERO_DT
 
 def depth_first_traversal(tree,skip_fun=None,enter_fun=None,
@@ -31,16 +33,33 @@ def depth_first_traversal(tree,skip_fun=None,enter_fun=None,
     if exit_fun is not None:
         exit_fun(tree)
 
+def referenced_paths(tree):
+    """!Iterates over the paths of the tasks and families whose state a
+    dependency tree refers to.  These are the paths that
+    crow.metascheduler.algebra.assume() looks up in its
+    assume_complete and assume_never_run functions."""
+    if isinstance(tree,EventDependency):
+        yield tree.event.parent.path
+    elif isinstance(tree,StateDependency) or \
+         isinstance(tree,TaskExistsDependency):
+        yield tree.path
+    for dep in tree:
+        for path in referenced_paths(dep):
+            yield path
+
 class Node(object):
-    def __init__(self,view,cycle):
+    def __init__(self,view,cycle,dependencies=None):
         self.view=view
         self.trigger=TRUE_DEPENDENCY
         self.complete=FALSE_DEPENDENCY
         self.time=ZERO_DT
         self.cycle=cycle
         self.alarm=view.get_alarm()
-        self.trigger=view.get_trigger_dep().copy_dependencies()
-        self.complete=view.get_complete_dep().copy_dependencies()
+        if dependencies is not None:
+            self.trigger,self.complete=dependencies
+        else:
+            self.trigger=algebra_intern(view.get_trigger_dep())
+            self.complete=algebra_intern(view.get_complete_dep())
         if 'Time' in view and view.Time is not None:
             typecheck('Time',view.Time,datetime.timedelta)
             self.time=copy.copy(view.Time)
@@ -124,7 +143,6 @@ class Graph(object):
         if cycle not in self.__cycles:
             raise KeyError(
                 f'{cycle:%F %T}: have not called add_cycle for this cycle yet.')
-        changed=True
         always_complete=set()
         never_run=set()
         def fun_assume_complete(path):
@@ -134,53 +152,90 @@ class Graph(object):
 
         self.__clock.now=cycle
 
-        while changed:
-            changed=False
-            for node in self.__nodes[cycle].values():
-                if node.is_always_complete():
-                    continue
-                if node.can_never_complete():
-                    continue
-                if node.has_no_dependencies() and node.is_task():
-                    continue
-                if node.assume(self.__clock,fun_assume_complete,
-                               fun_assume_never_run):
-                    changed=True
-                if node.can_never_complete():
-                    never_run.add(node.path)
-                    for descendent in depth_first_traversal(node):
-                        never_run.add(descendent.path)
-                        descendent.force_never_run()
-                    changed=True
-                    assert(not node.might_complete())
-                elif node.is_always_complete():
-                    always_complete.add(node.path)
-                    for descendent in depth_first_traversal(node):
-                        always_complete.add(descendent.path)
-                        descendent.force_always_complete()
-                    changed=True
-                elif node.is_family():
-                    n_always_complete=0
-                    n_never_complete=0
-                    n=0
-                    for child in node:
-                        n+=1
-                        if child.can_never_complete():
-                            n_never_complete+=1
-                        if child.is_always_complete():
-                            n_always_complete+=1
-
-                    if n==n_always_complete:
-                        # entirety of family is always complete so
-                        # family is always complete
-                        changed=True
-                        node.force_always_complete()
-                    elif n==n_never_complete:
-                        # entirety of family is always complete so
-                        # family is always complete
-                        changed=True
-                        node.force_never_run()
-                        
+        # A node's simplification only depends on whether the paths
+        # its dependencies refer to are always complete or never run,
+        # and a family's also depends on the states of its children.
+        # Hence, a node only needs another look when one of those
+        # changes, or when its last look changed it.  The nodes are
+        # first examined in the same order as in the graph.
+        dependents, parents = self._simplification_index(cycle)
+        worklist=collections.deque(self.__nodes[cycle].values())
+        queued=set([ id(node) for node in worklist ])
+
+        def requeue(node):
+            if node is not None and id(node) not in queued:
+                queued.add(id(node))
+                worklist.append(node)
+
+        def add_to(paths,path):
+            if path not in paths:
+                paths.add(path)
+                for dependent in dependents.get(path,()):
+                    requeue(dependent)
+
+        while worklist:
+            node=worklist.popleft()
+            queued.discard(id(node))
+            if node.is_always_complete():
+                continue
+            if node.can_never_complete():
+                continue
+            if node.has_no_dependencies() and node.is_task():
+                continue
+            if node.assume(self.__clock,fun_assume_complete,
+                           fun_assume_never_run):
+                requeue(node)
+            if node.can_never_complete():
+                for descendent in depth_first_traversal(node):
+                    add_to(never_run,descendent.path)
+                    descendent.force_never_run()
+                requeue(parents.get(id(node),None))
+                assert(not node.might_complete())
+            elif node.is_always_complete():
+                for descendent in depth_first_traversal(node):
+                    add_to(always_complete,descendent.path)
+                    descendent.force_always_complete()
+                requeue(parents.get(id(node),None))
+            elif node.is_family():
+                n_always_complete=0
+                n_never_complete=0
+                n=0
+                for child in node:
+                    n+=1
+                    if child.can_never_complete():
+                        n_never_complete+=1
+                    if child.is_always_complete():
+                        n_always_complete+=1
+
+                if n==n_always_complete:
+                    # entirety of family is always complete so
+                    # family is always complete
+                    node.force_always_complete()
+                    requeue(parents.get(id(node),None))
+                elif n==n_never_complete:
+                    # entirety of family can never complete so
+                    # family can never complete
+                    node.force_never_run()
+                    requeue(parents.get(id(node),None))
+
+    def _simplification_index(self,cycle):
+        """!Returns two dicts for simplify_cycle.  The first maps each
+        path to the list of nodes whose trigger or complete
+        dependencies refer to it.  The second maps the id of each node
+        to its parent node."""
+        dependents=collections.defaultdict(list)
+        parents=dict()
+        for node in self.__nodes[cycle].values():
+            referenced=set()
+            for tree in [ node.trigger, node.complete ]:
+                for path in referenced_paths(tree):
+                    if path not in referenced:
+                        referenced.add(path)
+                        dependents[path].append(node)
+            for child in node:
+                parents[id(child)]=node
+        return dependents, parents
+
     def depth_first_traversal(self,cycle,skip_fun,enter_fun,exit_fun):
         if cycle not in self.__cycles:
             raise KeyError(f'{cycle}: have not added this '
@@ -204,18 +259,36 @@ class Graph(object):
     def might_complete(self,path):
         return self.get_node(path).might_complete()
 
-    def add_cycle(self,cycle):
+    def node_states(self,cycle):
+        """!Returns a dict from the path of each node of the cycle, as a
+        tuple, to its (trigger, complete) dependencies.  After
+        simplify_cycle(), this is everything the analysis of the cycle
+        found, and add_cycle() can restore it."""
+        if cycle not in self.__cycles:
+            raise KeyError(
+                f'{cycle:%F %T}: have not called add_cycle for this cycle yet.')
+        return { tuple(path):(node.trigger,node.complete)
+                 for path,node in self.__nodes[cycle].items() }
+
+    def add_cycle(self,cycle,states=None):
+        """!Adds the nodes of the suite for this cycle.  If states is
+        given, it is a dict like the one from node_states(), and the
+        nodes' dependencies are taken from it instead of the suite.
+        Raises KeyError if a node is missing from states."""
         self.__clock.now=cycle
         memo=set()
         for child_view in self.__suite.child_iter():
             if child_view.is_family() or child_view.is_task():
                 child_name=child_view.path[-1]
                 self.__cycles[cycle][child_name] = \
-                    self._add_child(cycle,child_view,None,memo)
+                    self._add_child(cycle,child_view,None,memo,states)
 
-    def _add_child(self,cycle,child_view,parent_node,memo):
+    def _add_child(self,cycle,child_view,parent_node,memo,states=None):
         if child_view.path in memo: return
-        child_node=Node(child_view,self.__clock.now)
+        dependencies=None
+        if states is not None:
+            dependencies=states[tuple(child_view.path)]
+        child_node=Node(child_view,self.__clock.now,dependencies)
         if parent_node is not None:
             parent_node.children[child_node.path]=child_node
         child_cycle=cycle+child_node.path[0]
@@ -224,6 +297,7 @@ class Graph(object):
             for grandchild_view in child_view.child_iter():
                 if grandchild_view.is_family() or\
                    grandchild_view.is_task():
-                    self._add_child(cycle,grandchild_view,child_node,memo)
+                    self._add_child(cycle,grandchild_view,child_node,
+                                    memo,states)
         return child_node
                     
@@ -0,0 +1,193 @@
+"""!An on-disk store of the analyzed cycles of a suite's job graph.
+
+Making an ecFlow suite for some cycles populates the job graph for
+those cycles and the ones around them, and simplifies it.  When
+cycles are added to a running workflow a few at a time, most of them
+were already analyzed by the previous call.  A GraphStore keeps the
+trigger and complete dependencies of every node of each simplified
+cycle, so that later calls can restore them instead of evaluating
+and simplifying them again.
+
+A stored cycle is only used if the suite hash, the suite clock and
+the crow source files are unchanged, and if every environment
+variable and filesystem query made while analyzing gives the same
+answer as before.  The suite hash identifies the configuration the
+suite was read from; see suite_hash().
+
+The store is off unless $CROW_GRAPH_STORE_DIR names the directory
+to keep it in.  Nothing is written next to the suite.  Callers pass
+the store to crow.metascheduler.to_ecflow().
+
+Stored cycles are pickles; only keep them where the YAML itself could
+be kept.  """
+
+import os, pickle, hashlib, logging
+from crow.config import TRUE_DEPENDENCY, FALSE_DEPENDENCY, AndDependency, \
+    OrDependency, NotDependency, StateDependency, EventDependency, \
+    COMPLETED, RUNNING, FAILED
+from crow.config.tools import probes_unchanged, add_probes
+from crow.config.snapshot import code_stamp
+
+__all__=[ 'GraphStore', 'graph_store_for', 'suite_hash' ]
+_logger=logging.getLogger('crow.metascheduler')
+
+## Version of the store file layout.  Increment when it changes.
+STORE_FORMAT=1
+
+_STATES={ str(state):state for state in [ COMPLETED, RUNNING, FAILED ] }
+
+class _NotStorable(Exception): pass
+
+def _encode(dep):
+    """!Converts a simplified dependency tree to nested tuples that
+    name tasks and events by path instead of referring to views."""
+    if dep==TRUE_DEPENDENCY: return True
+    if dep==FALSE_DEPENDENCY: return False
+    if isinstance(dep,AndDependency):
+        return ('and',)+tuple([ _encode(d) for d in dep ])
+    if isinstance(dep,OrDependency):
+        return ('or',)+tuple([ _encode(d) for d in dep ])
+    if isinstance(dep,NotDependency):
+        return ('not',_encode(dep.depend))
+    if isinstance(dep,StateDependency):
+        return ('state',str(dep.state),tuple(dep.view.path))
+    if isinstance(dep,EventDependency):
+        return ('event',tuple(dep.event.path))
+    raise _NotStorable(f'cannot store a {type(dep).__name__}')
+
+def _view_at(suite,path,views):
+    view=views.get(path,None)
+    if view is None:
+        view=suite
+        for name in path[1:]:
+            view=view[name]
+        if path[0]:
+            view=view.at(path[0])
+        views[path]=view
+    return view
+
+def _decode(code,suite,views):
+    """!Inverse of _encode.  Views are looked up in the suite, and
+    those in views are reused."""
+    if code is True: return TRUE_DEPENDENCY
+    if code is False: return FALSE_DEPENDENCY
+    kind=code[0]
+    if kind=='and':
+        return AndDependency(*[ _decode(c,suite,views) for c in code[1:] ])
+    if kind=='or':
+        return OrDependency(*[ _decode(c,suite,views) for c in code[1:] ])
+    if kind=='not':
+        return NotDependency(_decode(code[1],suite,views))
+    if kind=='state':
+        return StateDependency(_view_at(suite,code[2],views),_STATES[code[1]])
+    if kind=='event':
+        return EventDependency(_view_at(suite,code[1],views))
+    raise ValueError(f'{kind!r}: unknown dependency in graph store')
+
+def suite_hash(text,probes=None):
+    """!Returns a hash that identifies the suite read from this YAML
+    text, when the environment and filesystem queries in probes, a
+    log from crow.config.tools.start_probe_log(), gave these answers.
+    Returns None if some query cannot be repeated."""
+    probes=probes or {}
+    if (None,()) in probes: return None
+    digest=hashlib.sha256(text.encode('utf-8'))
+    for item in sorted(probes.items(),key=repr):
+        digest.update(repr(item).encode('utf-8'))
+    return digest.hexdigest()
+
+class GraphStore(object):
+    """!A directory with one file per analyzed cycle.  Each file holds
+    two pickles: a header with the key and the environment and
+    filesystem queries made while analyzing, then a dict from node
+    path to the node's encoded trigger and complete dependencies."""
+    def __init__(self,directory,suite_hash):
+        self.directory=directory
+        self.suite_hash=suite_hash
+
+    def path(self,cycle):
+        return os.path.join(self.directory,f'{cycle:%Y%m%d%H%M}.pickle')
+
+    def key(self,clock,cycle):
+        """!Returns the key of the analysis of this cycle of the suite,
+        whose clock is given."""
+        return hashlib.sha256(
+            f'{STORE_FORMAT} {code_stamp()} {self.suite_hash} '
+            f'{clock.start:%FT%T} {clock.end:%FT%T} {clock.step} '
+            f'{cycle:%FT%T}'.encode('utf-8')).hexdigest()
+
+    def load(self,suite,clock,cycle):
+        """!Returns the node states stored for this cycle, as a dict
+        from node path (a tuple) to (trigger, complete), with views of
+        the suite.  Returns None if there are none, or if they cannot
+        be used."""
+        path=self.path(cycle)
+        try:
+            with open(path,'rb') as fd:
+                header=pickle.load(fd)
+                if header[:2]!=(STORE_FORMAT,self.key(clock,cycle)):
+                    _logger.debug(f'{path}: suite changed')
+                    return None
+                if not probes_unchanged(header[2]):
+                    _logger.debug(f'{path}: environment changed')
+                    return None
+                codes=pickle.load(fd)
+            views=dict()
+            states={ node_path:( _decode(trigger,suite,views),
+                                 _decode(complete,suite,views) )
+                     for node_path,(trigger,complete) in codes.items() }
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _logger.debug(f'{path}: cannot load analyzed cycle: {e}')
+            return None
+        add_probes(header[2])
+        return states
+
+    def save(self,clock,cycle,states,probes):
+        """!Atomically replaces the file for this cycle with one that
+        stores these node states, as returned by
+        crow.metascheduler.graph.Graph.node_states().  Failures are
+        logged and otherwise ignored, since the store is only an
+        optimization."""
+        import tempfile
+        path=self.path(cycle)
+        try:
+            codes={ tuple(node_path):(_encode(trigger),_encode(complete))
+                    for node_path,(trigger,complete) in states.items() }
+        except _NotStorable as e:
+            _logger.debug(f'{path}: {e}')
+            return
+        try:
+            os.makedirs(self.directory,exist_ok=True)
+            fd,temp=tempfile.mkstemp(dir=self.directory,prefix='.',
+                                     suffix='.tmp')
+        except OSError as e:
+            _logger.debug(f'{self.directory}: cannot write: {e}')
+            return
+        try:
+            with open(fd,'wb') as fopen:
+                pickle.dump((STORE_FORMAT,self.key(clock,cycle),probes),
+                            fopen,pickle.HIGHEST_PROTOCOL)
+                pickle.dump(codes,fopen,pickle.HIGHEST_PROTOCOL)
+            os.replace(temp,path)
+            _logger.debug(f'{path}: saved analyzed cycle')
+        except Exception as e:
+            _logger.debug(f'{path}: cannot save analyzed cycle: {e}')
+            try:
+                os.unlink(temp)
+            except OSError: pass
+
+def graph_store_for(source,text,probes=None):
+    """!Returns the GraphStore in $CROW_GRAPH_STORE_DIR for the suite
+    read from source, a file or directory, whose YAML text is given,
+    while making the queries in probes.  Returns None if that variable
+    is unset or empty, or if the suite hash is unknown."""
+    directory=os.environ.get('CROW_GRAPH_STORE_DIR','')
+    if not directory: return None
+    digest=suite_hash(text,probes)
+    if digest is None: return None
+    name=hashlib.sha1(os.path.abspath(source).encode('utf-8')) \
+        .hexdigest()[:20]
+    return GraphStore(os.path.join(directory,f'.crow-graph-store-{name}'),
+                      digest)
@@ -16,9 +16,10 @@ from crow.config import SuiteView, Suite, Depend, LogicalDependency, \
           TRUE_DEPENDENCY, FALSE_DEPENDENCY, SuitePath, TaskExistsDependency, \
           CycleExistsDependency, DataEvent, ShellEvent, EventDependency, \
           document_root, update_globals
+from crow.config.eval_tools import _record_read
 from crow.metascheduler.algebra import simplify
 
-__all__=['to_rocoto','RocotoConfigError','ToRocoto',
+__all__=['to_rocoto','write_rocoto','RocotoConfigError','ToRocoto',
          'SelfReferentialDependency' ]
 
 class RocotoConfigError(Exception): pass
@@ -75,39 +76,6 @@ def _has_alarms(self,item):
             if _has_alarms(subitem): return True
         return False
 
-def _entirely_in_alarm(item,desired_alarm,recursed_alarm):
-    if 'AlarmName' in item:
-        recursed_alarm=item.AlarmName
-
-    if desired_alarm!=recursed_alarm: return False
-
-    if item.is_family():
-        for subitem in item.child_iter():
-            if item.is_family() or item.is_task():
-                if not _entirely_in_alarm(
-                        subitem,desired_alarm,recursed_alarm):
-                    return False
-    return True
-
-
-def _none_are_in_alarm(item,desired_alarm,recursed_alarm):
-    if 'AlarmName' in item:
-        recursed_alarm=item.AlarmName
-
-    if desired_alarm==recursed_alarm:
-        #print(f'NAIA: {item.path}: alarm {recursed_alarm} is in alarm {desired_alarm}')
-        return False
-
-    if item.is_family() or item.is_cycle():
-        for subitem in item.child_iter():
-            if subitem.is_family() or subitem.is_task():
-                if not _none_are_in_alarm(
-                        subitem,desired_alarm,recursed_alarm):
-                    #print(f'NAIA: {item.path}: subitem {subitem.path} in alarm {desired_alarm}')
-                    return False
-    #print(f'NAIA: {item.path}: self and children not in {desired_alarm}')
-    return True
-
 def stringify_clock(name,clock,indent):
     start_time=clock.start.strftime('%Y%m%d%H%M')
     end_time=clock.end.strftime('%Y%m%d%H%M')
@@ -236,8 +204,11 @@ class ToRocoto(object):
 
         self.__families_with_completes=set()
         self.__families_with_alarms=set()
+        self.__tree_alarms=dict()
 
         self.__alarms_used=set()
+        self.__deferred=None
+        self.__marked=dict()
 
     def defenvar(self,name,value):
         return f'<envar><name>{name}</name><value>{value!s}</value></envar>'
@@ -267,7 +238,20 @@ class ToRocoto(object):
             return sio.getvalue()
 
     def make_task_xml(self,indent=1):
-        fd=StringIO()
+        if self.__deferred is not None:
+            # write_xml() is expanding the workflow_xml.  Leave a
+            # marker where the tasks go, and write them later.  The
+            # values calculated from the marker are recorded, through
+            # _add_dependent(), so write_xml() can discard them.
+            marker=f'\0crow-task-xml-{len(self.__deferred)}\0'
+            self.__deferred.append(indent)
+            _record_read(self,'task_xml')
+            return marker
+        return ''.join(self.iter_task_xml(indent))
+
+    def iter_task_xml(self,indent=1):
+        """!Generates the text of make_task_xml() in small pieces: the
+        metatask tags, and the text of one task at a time."""
         self._record_item(self.suite,FALSE_DEPENDENCY,'')
 
         # Find all families that have tasks with completes:
@@ -282,12 +266,40 @@ class ToRocoto(object):
                 family_path=SuitePath(path[1:i])
                 self.__families_with_alarms.add(family_path)
 
-        self._convert_item(fd,max(0,indent-1),self.suite,TRUE_DEPENDENCY,
-                           FALSE_DEPENDENCY,timedelta.min,'')
-        self._handle_final_task(fd,indent)
-        result=fd.getvalue()
-        fd.close()
-        return result
+        yield from self._convert_item(max(0,indent-1),self.suite,
+            TRUE_DEPENDENCY,FALSE_DEPENDENCY,timedelta.min,'')
+        with StringIO() as fd:
+            self._handle_final_task(fd,indent)
+            yield fd.getvalue()
+
+    def _add_dependent(self,key,obj,obj_key):
+        """!Records that obj[obj_key] was calculated from a marker
+        returned by make_task_xml()."""
+        self.__marked[id(obj),obj_key]=(obj,obj_key)
+
+    def write_xml(self,fd):
+        """!Writes the Rocoto XML document to the file-like object fd.
+        Unlike to_rocoto(), the task definitions are written as they
+        are generated, instead of being assembled into one string."""
+        self.__deferred=list()
+        try:
+            text=self._expand_workflow_xml()
+            indents=self.__deferred
+        finally:
+            self.__deferred=None
+            # Do not keep the markers in any cached value: discard
+            # everything calculated from them, and everything
+            # calculated from those.
+            marked, self.__marked = self.__marked, dict()
+            for obj,obj_key in marked.values():
+                obj._invalidate_value(obj_key)
+        pieces=re.split('\0crow-task-xml-([0-9]+)\0',text)
+        for i,piece in enumerate(pieces):
+            if i%2:
+                for chunk in self.iter_task_xml(indents[int(piece)]):
+                    fd.write(chunk)
+            else:
+                fd.write(piece)
 
     # ----------------------------------------------------------------
 
@@ -431,7 +443,7 @@ class ToRocoto(object):
             else:
                 self._record_item(child,complete,alarm_name)
 
-    def _convert_item(self,fd,indent,view,trigger,complete,time,alarm_name):
+    def _convert_item(self,indent,view,trigger,complete,time,alarm_name):
         if view.get('Disable',False):          return
         if view.get('Dummy',False):            return
         trigger=trigger & view.get_trigger_dep()
@@ -452,7 +464,9 @@ class ToRocoto(object):
             maxtries=int(view.get(
                 'max_tries',self.suite.Rocoto.get('max_tries',0)))
             attr = f' maxtries="{maxtries}"' if maxtries else ''
-            self._write_task_text(fd,attr,indent,view,dep,time,alarm_name)
+            with StringIO() as fd:
+                self._write_task_text(fd,attr,indent,view,dep,time,alarm_name)
+                yield fd.getvalue()
             return
 
         self.__dummy_var_count+=1
@@ -473,14 +487,15 @@ class ToRocoto(object):
             else:
                 if not wrote_top:
                     if not isinstance(view,Suite):
-                        fd.write(f'''{space*indent}<metatask name="{path}">
+                        yield f'''{space*indent}<metatask name="{path}">
 {space*indent}  <var name="{dummy_var}">DUMMY_VALUE</var>
-''')
+'''
                     wrote_top=True
-                self._convert_item(fd,indent+1,child,trigger,complete,time,alarm_name)
+                yield from self._convert_item(
+                    indent+1,child,trigger,complete,time,alarm_name)
 
         if not isinstance(view,Suite) and wrote_top:
-            fd.write(f'{space*indent}</metatask>\n')
+            yield f'{space*indent}</metatask>\n'
 
     def _write_task_text(self,fd,attr,indent,view,dependency,time,alarm_name,
                          manual_dependency=None):
@@ -614,7 +629,8 @@ class ToRocoto(object):
             return TRUE_DEPENDENCY
         
         # If nothing in the entire tree is in the alarm, then we're done.
-        if _none_are_in_alarm(item,for_alarm,alarm_name):
+        tree_alarms=self._alarms_in_tree(item,alarm_name)
+        if for_alarm not in tree_alarms:
             #print(f'{path}: entire tree is not in alarm')
             return TRUE_DEPENDENCY
 
@@ -634,7 +650,7 @@ class ToRocoto(object):
             # This is a suite.
             dep=FALSE_DEPENDENCY
 
-        if path and _entirely_in_alarm(item,for_alarm,alarm_name) and \
+        if path and tree_alarms=={for_alarm} and \
            path not in with_completes:
             # Families with no "complete" dependency in their entire
             # tree have no further dependencies to identify.  Their
@@ -657,6 +673,24 @@ class ToRocoto(object):
         #print(f'{path}: family or suite dep {dep}')
         return dep
 
+    def _alarms_in_tree(self,item,alarm_name=''):
+        """!Returns the set of alarms that item or any task or family
+        below it is in, given that item is within the alarm named
+        alarm_name.  The sets are calculated once per family or task;
+        the suite's is not kept because final tasks are added to it."""
+        path=tuple(item.path[1:])
+        if path in self.__tree_alarms:
+            return self.__tree_alarms[path]
+        if 'AlarmName' in item:
+            alarm_name=item.AlarmName
+        alarms={alarm_name}
+        if item.is_family() or item.is_cycle():
+            for subitem in item.child_iter():
+                alarms|=self._alarms_in_tree(subitem,alarm_name)
+        if path:
+            self.__tree_alarms[path]=alarms
+        return alarms
+
     def _handle_final_task(self,fd,indent):
         # Find and validate the "final" task:
         final=None
@@ -725,6 +759,13 @@ def to_rocoto(suite):
     typecheck('suite',suite,Suite)
     return ToRocoto(suite)._expand_workflow_xml()
 
+def write_rocoto(suite,fd):
+    """!Writes the Rocoto XML document for the suite to the file-like
+    object fd, a piece at a time.  The result is the same as
+    fd.write(to_rocoto(suite))."""
+    typecheck('suite',suite,Suite)
+    ToRocoto(suite).write_xml(fd)
+
 def test():
     def to_string(action):
         sio=StringIO()
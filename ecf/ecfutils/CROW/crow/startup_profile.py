@@ -0,0 +1,129 @@
+"""!Measures where the startup time of a CROW program goes.
+
+start() installs an import hook that times the execution of every
+module imported after it, and phase() times named steps of the
+program, such as loading its configuration and evaluating the first
+expressions.  report() formats both, most expensive imports first.
+For example, this prints the report for one to_sh.py call to stderr:
+
+    to_sh.py --profile-startup FILE scope:platform import:.*
+
+Only the standard library is imported here, so that the imports of
+the rest of CROW can be measured."""
+
+import sys, time
+from contextlib import contextmanager
+
+__all__=[ 'StartupProfile', 'start', 'stop', 'active', 'phase', 'report' ]
+
+## The StartupProfile being recorded, or None
+_profile=None
+
+class _TimedLoader(object):
+    """!Wraps a module loader so that the StartupProfile can time the
+    execution of the module."""
+    def __init__(self,loader,profile):
+        self._loader=loader
+        self._profile=profile
+    def __getattr__(self,name):
+        return getattr(self._loader,name)
+    def create_module(self,spec):
+        return self._loader.create_module(spec)
+    def exec_module(self,module):
+        self._profile._exec_module(self._loader,module)
+
+class StartupProfile(object):
+    """!Records module import times and phase times.  Import times are
+    kept both inclusive and exclusive of the modules each one imports,
+    like python -X importtime."""
+    def __init__(self):
+        self.started=time.perf_counter()
+        self.imports=dict() # module name -> (inclusive, self) seconds
+        self.phases=list() # (depth, name, seconds), in order of start
+        self._children=list()
+        self._depth=0
+
+    def find_spec(self,fullname,path=None,target=None):
+        """!Finds the module with the other meta path finders, and wraps
+        its loader in a _TimedLoader."""
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder,'find_spec'): continue
+            spec=finder.find_spec(fullname,path,target)
+            if spec is not None: break
+        else:
+            return None
+        if hasattr(spec.loader,'exec_module'):
+            spec.loader=_TimedLoader(spec.loader,self)
+        return spec
+
+    def _exec_module(self,loader,module):
+        self._children.append(0.0)
+        start=time.perf_counter()
+        try:
+            loader.exec_module(module)
+        finally:
+            inclusive=time.perf_counter()-start
+            children=self._children.pop()
+            if self._children: self._children[-1]+=inclusive
+            self.imports[module.__name__]=(inclusive,inclusive-children)
+
+    @contextmanager
+    def phase(self,name):
+        index=len(self.phases)
+        self.phases.append((self._depth,name,None))
+        self._depth+=1
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth-=1
+            self.phases[index]=(self._depth,name,time.perf_counter()-start)
+
+    def report(self,limit=25):
+        """!Returns a table of the slowest imports, sorted by the time
+        spent in each module itself, followed by the phase times."""
+        total=time.perf_counter()-self.started
+        names=sorted(self.imports,key=lambda n: self.imports[n][1],reverse=True)
+        lines=[ f'startup profile: {total:.4f}s since start, '
+                f'{len(self.imports)} modules imported',
+                f'{"SELF(s)":>9s} {"TOTAL(s)":>9s}  MODULE' ]
+        for name in names[:limit]:
+            inclusive,own=self.imports[name]
+            lines.append(f'{own:9.4f} {inclusive:9.4f}  {name}')
+        lines.append(f'{"SECONDS":>9s}  PHASE')
+        for depth,name,seconds in self.phases:
+            seconds=float('nan') if seconds is None else seconds
+            lines.append(f'{seconds:9.4f}  {"  "*depth}{name}')
+        return '\n'.join(lines)
+
+def start():
+    """!Starts timing imports and phases.  Returns the StartupProfile."""
+    global _profile
+    if _profile is None:
+        _profile=StartupProfile()
+        sys.meta_path.insert(0,_profile)
+    return _profile
+
+def stop():
+    """!Stops timing, and returns the StartupProfile, or None if none
+    was being recorded."""
+    global _profile
+    profile, _profile = _profile, None
+    if profile is not None: sys.meta_path.remove(profile)
+    return profile
+
+def active():
+    return _profile is not None
+
+@contextmanager
+def phase(name):
+    """!Times the enclosed code as a phase, if a profile is being
+    recorded.  Otherwise, does nothing."""
+    if _profile is None:
+        yield
+    else:
+        with _profile.phase(name):
+            yield
+
+def report(limit=25):
+    return _profile.report(limit) if _profile is not None else ''
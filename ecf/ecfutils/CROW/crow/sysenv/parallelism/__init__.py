@@ -1,21 +1,19 @@
+import importlib
 from crow.sysenv.exceptions import UnknownParallelismError
-import crow.sysenv.parallelism.HydraIMPI
-import crow.sysenv.parallelism.AprunCrayMPI
-from crow.sysenv.parallelism.HydraIMPI \
-    import Parallelism as HydraIMPIParallelism
-from crow.sysenv.parallelism.AprunCrayMPI \
-    import Parallelism as AprunCrayMPIParallelism
 
+## Maps each parallelism name to the module with its Parallelism
+## class.  The modules are only imported when their parallelism is
+## requested.
 KNOWN_PARALLELISM={
-    'HydraIMPI': HydraIMPIParallelism,
-    'AprunCrayMPI': AprunCrayMPIParallelism
+    'HydraIMPI': 'crow.sysenv.parallelism.HydraIMPI',
+    'AprunCrayMPI': 'crow.sysenv.parallelism.AprunCrayMPI'
     }
 
 
 def get_parallelism(name,settings):
     if name not in KNOWN_PARALLELISM:
         raise UnknownParallelismError(name)
-    cls=KNOWN_PARALLELISM[name]
+    cls=importlib.import_module(KNOWN_PARALLELISM[name]).Parallelism
     return cls(settings)
 
 def has_parallelism(name):
@@ -1,18 +1,18 @@
+import importlib
 from crow.sysenv.exceptions import UnknownSchedulerError
-from crow.sysenv.schedulers.MoabTorque import Scheduler as MoabTorqueScheduler
-from crow.sysenv.schedulers.MoabAlps import Scheduler as MoabAlpsScheduler
-from crow.sysenv.schedulers.LSFAlps import Scheduler as LSFAlpsScheduler
 
+## Maps each scheduler name to the module with its Scheduler class.
+## The modules are only imported when their scheduler is requested.
 KNOWN_SCHEDULERS={
-    'MoabTorque': MoabTorqueScheduler,
-    'MoabAlps': MoabAlpsScheduler,
-    'LSFAlps': LSFAlpsScheduler
+    'MoabTorque': 'crow.sysenv.schedulers.MoabTorque',
+    'MoabAlps': 'crow.sysenv.schedulers.MoabAlps',
+    'LSFAlps': 'crow.sysenv.schedulers.LSFAlps'
     }
 
 def get_scheduler(name,settings):
     if name not in KNOWN_SCHEDULERS:
         raise UnknownSchedulerError(name)
-    cls=KNOWN_SCHEDULERS[name]
+    cls=importlib.import_module(KNOWN_SCHEDULERS[name]).Scheduler
     return cls(settings)
 
 def has_scheduler(name):
@@ -1,16 +1,51 @@
-import subprocess, os, re, logging, tempfile, datetime, shutil, math
+import subprocess, os, re, logging, datetime, math
+import functools
 from datetime import timedelta
 from copy import deepcopy, copy
 from contextlib import suppress, contextmanager
 from collections.abc import Mapping
 
-__all__=['panasas_gb','gpfs_gb','to_timedelta','deliver_file','NamedConstant',
+__all__=['panasas_gb','gpfs_gb','to_timedelta','deliver_file','deliver_files',
+         'NamedConstant',
          'Clock','str_timedelta','memory_in_bytes','to_printf_octal',
          'str_to_posix_sh','typecheck','ZER_DT','shell_to_python_type',
-         'MISSING','chdir']
+         'MISSING','chdir','compile_expression','compile_fstring',
+         'set_expression_cache_size','expression_cache_info']
 
 _logger=logging.getLogger('crow.tools')
 
+## Maximum number of compiled expressions kept by compile_expression()
+EXPRESSION_CACHE_SIZE=4096
+
+def _compile(source,mode):
+    if mode=='eval':
+        source=source.lstrip(' \t') # as eval() does for strings
+    return compile(source,'<string>',mode)
+
+_compile_cached=functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)(_compile)
+
+def compile_expression(source: str,mode: str='eval'):
+    """!Compiles python source code for eval() or exec().  The code
+    objects of the most recently used expressions are kept in a
+    process-wide LRU cache, so each distinct string is only tokenized
+    and compiled once."""
+    return _compile_cached(source,mode)
+
+def compile_fstring(text: str):
+    """!Compiles text as the body of an f'''...''' string."""
+    return _compile_cached("f'''"+text+"'''",'eval')
+
+def set_expression_cache_size(size: int) -> None:
+    """!Replaces the compiled expression cache with an empty one that
+    holds up to size entries.  A size of 0 disables caching."""
+    global _compile_cached
+    _compile_cached=functools.lru_cache(maxsize=size)(_compile)
+
+def expression_cache_info():
+    """!Returns the hits, misses, maxsize and currsize of the compiled
+    expression cache, as a functools cache_info() tuple."""
+    return _compile_cached.cache_info()
+
 @contextmanager
 def chdir(dir):
     olddir=os.getcwd()
@@ -18,6 +53,30 @@ def chdir(dir):
     yield
     os.chdir(olddir)
 
+_KERNEL_COPY_CHUNK=1<<30
+
+def _kernel_copy(in_fd: int,out_fd: int) -> bool:
+    """!Copies the rest of in_fd to out_fd with os.copy_file_range or
+    os.sendfile, so the data does not pass through Python.  Returns
+    False, having copied nothing, if neither works for these files."""
+    import errno
+    unsupported=(errno.ENOSYS,errno.EXDEV,errno.EINVAL,errno.EOPNOTSUPP,
+                 errno.EBADF)
+    for name in [ 'copy_file_range', 'sendfile' ]:
+        if not hasattr(os,name): continue
+        copied=0
+        try:
+            while True:
+                if name=='sendfile':
+                    count=os.sendfile(out_fd,in_fd,None,_KERNEL_COPY_CHUNK)
+                else:
+                    count=os.copy_file_range(in_fd,out_fd,_KERNEL_COPY_CHUNK)
+                if not count: return True
+                copied+=count
+        except OSError as e:
+            if copied or e.errno not in unsupported: raise
+    return False
+
 def deliver_file(from_file: str,to_file: str,*,blocksize: int=1048576,
                  permmask: int=2,preserve_perms: bool=True,
                  preserve_times: bool=True,preserve_group: bool=True,
@@ -26,7 +85,8 @@ def deliver_file(from_file: str,to_file: str,*,blocksize: int=1048576,
     to_base=os.path.basename(to_file)
     if mkdir and to_dir and not os.path.isdir(to_dir):
         _logger.info(f'{to_dir}: makedirs')
-        os.makedirs(to_dir)
+        os.makedirs(to_dir,exist_ok=True)
+    import tempfile, shutil # only needed here; slow to import
     temppath=None # type: str
     _logger.info(f'{to_file}: deliver from {from_file}')
     try:
@@ -36,7 +96,8 @@ def deliver_file(from_file: str,to_file: str,*,blocksize: int=1048576,
                     prefix=f"_tmp_{to_base}.part.",
                     delete=False,dir=to_dir) as out_fd:
                 temppath=out_fd.name
-                shutil.copyfileobj(in_fd,out_fd,length=blocksize)
+                if not _kernel_copy(in_fd.fileno(),out_fd.fileno()):
+                    shutil.copyfileobj(in_fd,out_fd,length=blocksize)
         assert(temppath)
         assert(os.path.exists(temppath))
         if preserve_perms:
@@ -53,6 +114,32 @@ def deliver_file(from_file: str,to_file: str,*,blocksize: int=1048576,
     finally: # Delete file on error
         if temppath and os.path.exists(temppath): os.unlink(temppath)
 
+def deliver_files(pairs,*,workers: int=None,**kwargs) -> None:
+    """!Calls deliver_file(from_file,to_file,**kwargs) for each
+    (from_file,to_file) pair, from a pool of up to workers threads
+    (default: 8).  Every delivery is attempted.  The first exception,
+    if any, is raised once all deliveries are done."""
+    pairs=list(pairs)
+    if workers is None: workers=8
+    workers=max(1,min(workers,len(pairs)))
+    if workers==1:
+        results=[ _deliver_or_error(a,b,kwargs) for a,b in pairs ]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as pool:
+            results=list(pool.map(lambda ab: _deliver_or_error(
+                ab[0],ab[1],kwargs),pairs))
+    errors=[ e for e in results if e is not None ]
+    if errors:
+        _logger.warning(f'{len(errors)} of {len(pairs)} deliveries failed')
+        raise errors[0]
+
+def _deliver_or_error(from_file,to_file,kwargs):
+    try:
+        deliver_file(from_file,to_file,**kwargs)
+    except Exception as e:
+        return e
+
 def panasas_gb(dir,pan_df='pan_df'):
     rdir=os.path.realpath(dir)
     stdout=subprocess.check_output([pan_df,'-B','1G','-P',rdir])
@@ -221,15 +308,27 @@ def typecheck(name,obj,cls,tname=None,print_contents=False):
 ########################################################################
 
 ZERO_DT=timedelta()
+
+def _microseconds(dt):
+    """!Returns the timedelta dt as an exact integer number of
+    microseconds."""
+    return (dt.days*86400+dt.seconds)*1000000+dt.microseconds
+
 class Clock(object):
+    """!A sequence of times from start to end, inclusive, every step.
+    The end may be None, for a clock that never ends.  Internally,
+    times are integer microsecond offsets from the start, so that
+    membership tests, alarm intersections and iteration are integer
+    arithmetic rather than repeated datetime arithmetic."""
     def __init__(self,start,step,end=None,now=None):
         typecheck('start',start,datetime.datetime)
         typecheck('step',step,datetime.timedelta)
         if end is not None:
             typecheck('end',end,datetime.datetime)
-        self.start=copy(start)
-        self.end=end
-        self.step=step
+        self.__start=copy(start)
+        self.__end=end
+        self.__step=step
+        self.__cache_offsets()
         self.__now=start
         if self.step<=ZERO_DT:
             raise ValueError(f'Time step must be positive and non-zero: {self.step}')
@@ -237,18 +336,48 @@ class Clock(object):
             raise ValueError(f'End time must be at or after start time: {self.end}<{self.start}.')
         self.now=now
 
+    def __cache_offsets(self):
+        self.__step_us=_microseconds(self.__step)
+        if self.__end is None:
+            self.__end_us=None
+        else:
+            self.__end_us=_microseconds(self.__end-self.__start)
+
+    def getstart(self): return self.__start
+    def setstart(self,start):
+        typecheck('start',start,datetime.datetime)
+        self.__start=copy(start)
+        self.__cache_offsets()
+    start=property(getstart,setstart,None,'First time on this clock.')
+
+    def getend(self): return self.__end
+    def setend(self,end):
+        if end is not None:
+            typecheck('end',end,datetime.datetime)
+        self.__end=end
+        self.__cache_offsets()
+    end=property(getend,setend,None,'Last possible time on this clock, '
+                 'or None if it never ends.')
+
+    def getstep(self): return self.__step
+    def setstep(self,step):
+        typecheck('step',step,datetime.timedelta)
+        self.__step=step
+        self.__cache_offsets()
+    step=property(getstep,setstep,None,'Time between clock ticks.')
+
     def __repr__(self):
         return f'Clock(start={self.start!r},step={self.step!r},'\
                f'end={self.end!r},now={self.now!r})'
 
     def for_alarm(self,alarm):
         typecheck('alarm',alarm,Clock)
-        if alarm.step<self.step or alarm.step%self.step:
+        step_us=self.__step_us
+        alarm_step_us=alarm.__step_us
+        if alarm_step_us<step_us or alarm_step_us%step_us:
             raise ValueError(f"In for_alarm, the alarm's step must be a multiple of the clock's step (clock: {self.step}, alarm: {alarm.step}).")
-        if (alarm.start-self.start)%self.step:
+        if _microseconds(alarm.start-self.start)%step_us:
             raise ValueError(f"In for_alarm, the alarm start must reside on a clock step (clock: {self}, alarm: {alarm}).")
-        start=alarm.start + alarm.step * math.ceil(
-            (self.start-alarm.start)/alarm.step)
 
         if self.end is None:
             # Clock is unbounded, so use the alarm's bound
@@ -263,23 +392,32 @@ class Clock(object):
         # If the resulting alarm is bounded, make sur its end lies on
         # an alarm step:
         if end is not None:
-            end=alarm.start + alarm.step * math.floor(
-                max(ZERO_DT,end-alarm.start)/alarm.step)
+            end=alarm.start + alarm.step * (
+                max(0,_microseconds(end-alarm.start))//alarm_step_us)
 
         # Start is the first alarm step at or after clock start:
-        start=alarm.start + alarm.step * math.ceil(
-            max(ZERO_DT,self.start-alarm.start)/alarm.step)
+        start=alarm.start + alarm.step * (
+            -(-max(0,_microseconds(self.start-alarm.start))//alarm_step_us))
 
         return Clock(start,alarm.step,end) # No "now" in new alarm.
 
     def __contains__(self,when):
-        if isinstance(when,datetime.timedelta):
-            return not when%self.step
+        if isinstance(when,datetime.datetime):
+            dt=when-self.__start
+            offset=(dt.days*86400+dt.seconds)*1000000+dt.microseconds
+            if offset<0: return False
+            if self.__end_us is not None and offset>self.__end_us:
+                return False
+            return not offset%self.__step_us # lies on a time step?
+        elif isinstance(when,datetime.timedelta):
+            return not _microseconds(when)%self.__step_us
         elif isinstance(when,Clock):
             # Are the other clock's times a subset of my times?
             if when.start<self.start: return False # starts before me
-            if when.step<self.step: return False # ticks more frequently
-            if when.step%self.step: return False # ticks don't line up
+            if when.__step_us<self.__step_us:
+                return False # ticks more frequently
+            if when.__step_us%self.__step_us:
+                return False # ticks don't line up
             if when.end is None and self.end is not None:
                 return False # is eternal, but I have an end time
             if self.end is None:
@@ -287,20 +425,29 @@ class Clock(object):
                             # stop before or during my time
             if when.end>self.end: return False # other clock stops after me
             return True
-        elif isinstance(when,datetime.datetime):
-            if self.end and when>self.end: return False
-            if when<self.start: return False
-            dt=when-self.start
-            if not dt: return True
-            if dt%self.step: return False # does not lie on a time step
-            return True
         raise TypeError(f'{type(self).__name__}.__contains__ only understands Clock, datetime, and timedelta objects.  You passed type f{type(when).__name__}.')
 
+    def offsets(self):
+        """!Returns a range of the integer microsecond offsets of all
+        times on this clock from its start.  Raises TypeError if the
+        clock never ends."""
+        if self.__end_us is None:
+            raise TypeError(f'{self}: cannot list the times of a clock '
+                            'with no end')
+        return range(0,self.__end_us+1,self.__step_us)
+
+    def times(self):
+        """!Returns a list of all times on this clock, in order.
+        Raises TypeError if the clock never ends."""
+        times=list()
+        time, step = self.__start, self.__step
+        for offset in self.offsets():
+            times.append(time)
+            time+=step
+        return times
+
     def __iter__(self):
-        time=self.start
-        while time<=self.end:
-            yield time
-            time+=self.step
+        return iter(self.times())
     def __str__(self):
         ret='Clock'
         if self.now is not None:
@@ -316,14 +463,15 @@ class Clock(object):
             self.__now=self.start
             return
         typecheck('time',time,datetime.datetime)
-        if (time-self.start) % self.step:
+        offset=_microseconds(time-self.__start)
+        if offset%self.__step_us:
             raise ValueError(
                 f'{time} must be an integer multiple of {self.step} '
                 f'after {self.start}')
-        if self.end is not None and time>self.end:
+        if self.__end_us is not None and offset>self.__end_us:
             raise ValueError(
                 f'{time} is after clock end time {self.end}')
-        if time<self.start:
+        if offset<0:
             raise ValueError(f'{time} is before clock start time {self.start}')
         self.__now=time
     def getnow(self):
@@ -333,11 +481,9 @@ class Clock(object):
     def iternow(self):
         """!Sents the current time (self.now) to the start time, and
         iterates it over each possible time, yielding this object."""
-        now=self.start
-        while now<=self.end:
-            self.now=now
+        for now in self.times():
+            self.__now=now # already known to be a valid time
             yield self
-            now+=self.step
 
     def next(self,mul=1):
         return self.__now+self.step*mul
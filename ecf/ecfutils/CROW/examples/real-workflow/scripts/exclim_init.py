@@ -18,6 +18,6 @@ def main():
 if __name__=='__main__':
     import trace, sys
     tracer=trace.Trace(ignoredirs=[sys.prefix,sys.exec_prefix],
-                       ignoremods=['yaml','eval_tools','from_yaml','to_yaml'],
+                       ignoremods=['yaml','eval_tools','from_yaml','_to_yaml'],
                        timing=1)
     tracer.run('main()')
@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+"""!Times crow.metascheduler.Graph construction and simplification,
+and the memory it holds, for suites with large trigger expressions.
+
+Each task in the suite is triggered by the same large expression of
+the tasks in a "gate" family, and by one task of the previous family,
+so the trees that crow.metascheduler.algebra simplifies share most of
+their subtrees:
+
+    bench_algebra.py --families 20 --tasks 20 --cycles 4"""
+
+import time, argparse, tracemalloc
+from context import crow
+from crow.config import from_string, Suite
+from crow.metascheduler.graph import Graph
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Time dependency simplification.')
+    parser.add_argument('--families',type=int,default=20,help='number of families')
+    parser.add_argument('--tasks',type=int,default=20,help='number of tasks per family')
+    parser.add_argument('--gate',type=int,default=12,
+                        help='number of tasks in the gate family')
+    parser.add_argument('--cycles',type=int,default=4,help='number of cycles')
+    return parser.parse_args()
+
+def suite_yaml(nfamilies,ntasks,ngate):
+    gate=[ f'suite.gate.g{i}' for i in range(ngate) ]
+    terms=[ f'( {gate[i]} | {gate[(i+1)%ngate]} | ~{gate[(i+2)%ngate]} )'
+            for i in range(ngate) ]
+    expression=' & '.join(terms)
+    lines=[ 'suite: !Cycle',
+            '  Clock: !Clock',
+            '    start: 2017-08-15t00:00:00',
+            '    end: 2017-08-20t00:00:00',
+            '    step: !timedelta 06:00',
+            '  gate: !Family' ]
+    for i in range(ngate):
+        lines.append(f'    g{i}: !Task')
+        lines.append(f'      Trigger: !Depend suite.has_cycle("-06:00")')
+    for f in range(nfamilies):
+        lines.append(f'  fam{f}: !Family')
+        for t in range(ntasks):
+            lines.append(f'    t{t}: !Task')
+            previous=f' & suite.fam{f-1}.t{t}' if f else ''
+            lines.append(f'      Trigger: !Depend ( {expression} ){previous}')
+    return '\n'.join(lines)+'\n'
+
+def main():
+    args=get_args()
+    suite=Suite(from_string(suite_yaml(
+        args.families,args.tasks,args.gate)).suite)
+    cycles=[ suite.Clock.start+i*suite.Clock.step for i in range(args.cycles) ]
+    tracemalloc.start()
+    start=time.time()
+    graph=Graph(suite,suite.Clock)
+    for cycle in cycles:
+        graph.add_cycle(cycle)
+    built=time.time()
+    for cycle in cycles:
+        graph.simplify_cycle(cycle)
+    simplified=time.time()
+    current,peak=tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ntasks=args.families*args.tasks+args.gate
+    print(f'{ntasks} tasks, {len(cycles)} cycles')
+    print(f'add_cycle:      {built-start:8.3f}s')
+    print(f'simplify_cycle: {simplified-built:8.3f}s')
+    print(f'memory held:    {current/2**20:8.1f} MiB (peak {peak/2**20:.1f} MiB)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+"""!Times Rocoto XML generation, and the memory it needs, for suites
+with large metatasks.
+
+The suite has families of tasks, most of which are in a "gdas" or
+"gfs" alarm, and some of which have complete conditions, so the final
+tasks for each alarm have large dependencies.  The XML is made with to_rocoto(),
+which returns one string, and with write_rocoto(), which writes it to
+a file a task at a time:
+
+    bench_rocoto_xml.py --families 50 --tasks 100"""
+
+import time, argparse, tempfile, tracemalloc
+from context import crow
+from crow.config import from_string, Suite
+from crow.metascheduler.rocoto import to_rocoto, write_rocoto
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Time Rocoto XML generation.')
+    parser.add_argument('--families',type=int,default=50,help='number of families')
+    parser.add_argument('--tasks',type=int,default=100,help='number of tasks per family')
+    return parser.parse_args()
+
+def suite_yaml(nfamilies,ntasks):
+    lines=[ 'suite: !Cycle',
+            '  Rocoto:',
+            '    scheduler: none',
+            '    workflow_install: .',
+            '    workflow_xml: !expand |',
+            '      <workflow>',
+            '      {to_rocoto.make_time_xml(indent=1)}',
+            '      {to_rocoto.make_task_xml(indent=1)}',
+            '      </workflow>',
+            '  Clock: !Clock',
+            '    start: 2017-08-15t00:00:00',
+            '    end: 2017-08-20t00:00:00',
+            '    step: !timedelta 06:00',
+            '  Alarms:',
+            '    gdas: !Clock',
+            '      start: 2017-08-15t06:00:00',
+            '      end: 2017-08-20t00:00:00',
+            '      step: !timedelta 12:00',
+            '    gfs: !Clock',
+            '      start: 2017-08-15t00:00:00',
+            '      end: 2017-08-20t00:00:00',
+            '      step: !timedelta 24:00' ]
+    for f in range(nfamilies):
+        lines.append(f'  fam{f}: !Family')
+        if f%3:
+            lines.append(f'    AlarmName: {"gdas" if f%3==1 else "gfs"}')
+        if f%5==0:
+            lines.append(f'    Complete: !Depend suite.has_cycle("-06:00")')
+        for t in range(ntasks):
+            lines.append(f'    t{t}: !Task')
+            lines.append(f'      Rocoto: !expand "<command>true</command>"')
+            if t:
+                lines.append(f'      Trigger: !Depend t{t-1}')
+            elif f:
+                lines.append(f'      Trigger: !Depend up.fam{f-1}')
+    lines.append('  final: !Task')
+    lines.append('    Rocoto: !expand "<command>true</command>"')
+    return '\n'.join(lines)+'\n'
+
+def measure(what,action):
+    tracemalloc.start()
+    start=time.time()
+    action()
+    seconds=time.time()-start
+    current,peak=tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{what:14s} {seconds:8.3f}s  peak {peak/2**20:8.1f} MiB')
+
+def main():
+    args=get_args()
+    text=suite_yaml(args.families,args.tasks)
+    print(f'{args.families*args.tasks} tasks')
+    suite=Suite(from_string(text).suite)
+    measure('to_rocoto',lambda: to_rocoto(suite))
+    suite=Suite(from_string(text).suite)
+    with tempfile.TemporaryFile('w+t') as fd:
+        measure('write_rocoto',lambda: write_rocoto(suite,fd))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+"""!Times crow.metascheduler.graph.Graph.simplify_cycle on synthetic
+suites of increasing size.
+
+Each suite has families of tasks in which every task is triggered by
+the one after it, and the last task of each family by the first task
+of the next family.  The last task of the suite only runs if there is
+a prior cycle, so in the first cycle nothing can run, and that fact
+has to propagate back through the whole chain:
+
+    bench_simplify_cycle.py --tasks 250,500,1000,2000 --family-size 20"""
+
+import time, argparse
+from context import crow
+from crow.config import from_string, Suite
+from crow.metascheduler.graph import Graph
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Time job graph simplification.')
+    parser.add_argument('--tasks',default='250,500,1000,2000',
+                        help='comma-separated numbers of tasks in the suites')
+    parser.add_argument('--family-size',type=int,default=20,
+                        help='number of tasks per family')
+    parser.add_argument('--repeat',type=int,default=1,help='number of repetitions')
+    return parser.parse_args()
+
+def suite_yaml(ntasks,family_size):
+    nfamilies=max(1,(ntasks+family_size-1)//family_size)
+    lines=[ 'suite: !Cycle',
+            '  Clock: !Clock',
+            '    start: 2017-08-15t00:00:00',
+            '    end: 2017-08-16t00:00:00',
+            '    step: !timedelta 06:00' ]
+    for f in range(nfamilies):
+        lines.append(f'  fam{f}: !Family')
+        size=min(family_size,ntasks-f*family_size)
+        for t in range(size):
+            lines.append(f'    t{t}: !Task')
+            if t+1<size:
+                lines.append(f'      Trigger: !Depend t{t+1}')
+            elif f+1<nfamilies:
+                lines.append(f'      Trigger: !Depend up.fam{f+1}.t0')
+            else:
+                lines.append(f"      Trigger: !Depend suite.has_cycle('-06:00')")
+    return '\n'.join(lines)+'\n'
+
+def time_simplify(ntasks,family_size):
+    suite=Suite(from_string(suite_yaml(ntasks,family_size)).suite)
+    cycle=suite.Clock.start
+    graph=Graph(suite,suite.Clock)
+    graph.add_cycle(cycle)
+    start=time.time()
+    graph.simplify_cycle(cycle)
+    seconds=time.time()-start
+    assert(not graph.might_complete(suite.fam0.t0.path))
+    return seconds
+
+def main():
+    args=get_args()
+    print(f'{"TASKS":>8s} {"SECONDS":>10s} {"US/TASK":>10s}')
+    for ntasks in [ int(n) for n in args.tasks.split(',') ]:
+        seconds=min(time_simplify(ntasks,args.family_size)
+                    for i in range(args.repeat))
+        print(f'{ntasks:8d} {seconds:10.4f} {1e6*seconds/ntasks:10.1f}')
+
+if __name__ == '__main__':
+    main()
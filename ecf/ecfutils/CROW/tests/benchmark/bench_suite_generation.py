@@ -0,0 +1,233 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+"""!Benchmarks the stages of CROW suite generation on a synthetic
+suite, to give a performance baseline to compare CROW versions with.
+
+The suite is made with crow.config.from_string.  It has families of
+tasks, each triggered by the one before it, a metatask (a family of
+ensemble member tasks), alarms that some families are in, and data
+slots that connect each task to the one before it.  Each stage gets a
+freshly loaded suite, and is timed:
+
+ * from_string        - parse the YAML and make the Suite
+ * to_rocoto          - make the Rocoto XML
+ * to_ecflow          - make the ecFlow suite definitions and ecf files
+ * graph_add_cycle    - populate a job graph for every cycle
+ * simplify_cycle     - simplify the job graph of every cycle
+ * to_sh_export       - export a scope of variables like to_sh.py
+ * dataflow_add_cycle - make a dataflow database and add every cycle
+
+Results go to stdout as JSON, and to a file with --json.  The
+--profile option writes a cProfile dump of each stage to a directory,
+for use with pstats or snakeviz:
+
+    bench_suite_generation.py --families 20 --tasks 20 --members 40 \\
+        --cycles 4 --alarms 2 --json baseline.json --profile prof/"""
+
+import os, sys, json, time, logging, argparse, tempfile, platform
+from context import crow
+from crow.config import from_string, Suite
+from crow.metascheduler.graph import Graph
+
+STAGES=[ 'from_string', 'to_rocoto', 'to_ecflow', 'graph_add_cycle',
+         'simplify_cycle', 'to_sh_export', 'dataflow_add_cycle' ]
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmark CROW suite generation.')
+    parser.add_argument('--families',type=int,default=10,help='number of families')
+    parser.add_argument('--tasks',type=int,default=10,help='number of tasks per family')
+    parser.add_argument('--members',type=int,default=20,
+                        help='number of tasks in the ensemble metatask')
+    parser.add_argument('--cycles',type=int,default=4,help='number of cycles')
+    parser.add_argument('--alarms',type=int,default=2,
+                        help='number of alarms that families are in')
+    parser.add_argument('--variables',type=int,default=200,
+                        help='number of variables exported by to_sh_export')
+    parser.add_argument('--repeat',type=int,default=1,
+                        help='number of repetitions; the fastest is reported')
+    parser.add_argument('--stages',default=','.join(STAGES),
+                        help='comma-separated stages to run')
+    parser.add_argument('--json',default=None,metavar='FILE',
+                        help='also write the results to this file')
+    parser.add_argument('--profile',default=None,metavar='DIR',
+                        help='write a cProfile dump of each stage to DIR/STAGE.prof')
+    return parser.parse_args()
+
+def suite_yaml(args):
+    """!Returns the YAML text of the synthetic suite, with the
+    "exports" scope of variables used by stage_to_sh_export."""
+    lines=[ 'task_defaults: &task_defaults',
+            '  Rocoto: !expand "<command>run {task_path_var}</command>"',
+            '  ecf_file: !expand "run {task_path_var}"',
+            'exports:',
+            '  base: 10' ]
+    for i in range(args.variables):
+        if i%3==0:
+            lines.append(f'  var{i}: !calc base*{i}')
+        elif i%3==1:
+            lines.append(f'  var{i}: !expand "{{base}}/var{i}"')
+        else:
+            lines.append(f'  var{i}: value{i}')
+    lines.extend([
+        'suite: !Cycle',
+        '  Clock: !Clock',
+        '    start: 2017-08-15t00:00:00',
+        f'    end: !calc "tools.to_timedelta(\'{6*(args.cycles-1)}:00\')+start"',
+        '    step: !timedelta 06:00',
+        '  Rocoto:',
+        '    scheduler: none',
+        '    workflow_install: .',
+        '    workflow_xml: !expand |',
+        '      <workflow>',
+        '      {to_rocoto.make_time_xml(indent=1)}',
+        '      {to_rocoto.make_task_xml(indent=1)}',
+        '      </workflow>',
+        '  ecFlow:',
+        '    scheduler: none',
+        '    suite_name: "bench_%Y%m%d%H"',
+        '    suite_def_filename: "bench_%Y%m%d%H.def"',
+        '    dates_in_time_dependencies: false' ])
+    if args.alarms:
+        lines.append('  Alarms:')
+        for a in range(args.alarms):
+            lines.extend([ f'    alarm{a}: !Clock',
+                           '      start: 2017-08-15t00:00:00',
+                           '      end: !calc doc.suite.Clock.end',
+                           f'      step: !timedelta {12*(a+1)}:00' ])
+    for f in range(args.families):
+        lines.append(f'  fam{f}: !Family')
+        if args.alarms and f%(args.alarms+1):
+            lines.append(f'    AlarmName: alarm{f%(args.alarms+1)-1}')
+        if f%5==4:
+            lines.append(f'    Complete: !Depend suite.has_cycle("-06:00")')
+        for t in range(args.tasks):
+            lines.extend([ f'    t{t}: !Task',
+                           '      <<: *task_defaults',
+                           f'      out: !OutputSlot {{ Loc: com/fam{f}/t{t} }}' ])
+            if t:
+                lines.extend([
+                    f'      Trigger: !Depend t{t-1}',
+                    f'      inp: !InputSlot {{ Out: !Message "up.t{t-1}.out" }}' ])
+            elif f:
+                lines.append(f'      Trigger: !Depend up.fam{f-1}')
+    if args.members:
+        lines.append('  ens: !Family')
+        for m in range(args.members):
+            lines.extend([ f'    mem{m:03d}: !Task',
+                           '      <<: *task_defaults' ])
+            if args.families:
+                lines.append('      Trigger: !Depend up.fam0')
+    lines.extend([ '  final: !Task',
+                   '    <<: *task_defaults' ])
+    return '\n'.join(lines)+'\n'
+
+def load_suite(text):
+    return Suite(from_string(text).suite)
+
+def cycles_of(suite):
+    return list(suite.Clock)
+
+def stage_from_string(text,tempdir):
+    start=time.time()
+    load_suite(text)
+    return time.time()-start
+
+def stage_to_rocoto(text,tempdir):
+    from crow.metascheduler import to_rocoto
+    suite=load_suite(text)
+    start=time.time()
+    to_rocoto(suite)
+    return time.time()-start
+
+def stage_to_ecflow(text,tempdir):
+    from crow.metascheduler import to_ecflow
+    suite=load_suite(text)
+    start=time.time()
+    to_ecflow(suite)
+    return time.time()-start
+
+def stage_graph_add_cycle(text,tempdir):
+    suite=load_suite(text)
+    graph=Graph(suite,suite.Clock)
+    start=time.time()
+    for cycle in cycles_of(suite):
+        graph.add_cycle(cycle)
+    return time.time()-start
+
+def stage_simplify_cycle(text,tempdir):
+    suite=load_suite(text)
+    graph=Graph(suite,suite.Clock)
+    cycles=cycles_of(suite)
+    for cycle in cycles:
+        graph.add_cycle(cycle)
+    start=time.time()
+    for cycle in cycles:
+        graph.simplify_cycle(cycle)
+    return time.time()-start
+
+def stage_to_sh_export(text,tempdir):
+    from bench_to_sh_export import export_scopes
+    filename=os.path.join(tempdir,'exports.yaml')
+    if not os.path.exists(filename):
+        with open(filename,'wt') as fd:
+            fd.write(text)
+    start=time.time()
+    export_scopes([ filename ],[ 'exports' ])
+    return time.time()-start
+
+def stage_dataflow_add_cycle(text,tempdir):
+    import crow.dataflow
+    suite=load_suite(text)
+    filename=os.path.join(tempdir,'dataflow.db')
+    if os.path.exists(filename):
+        os.unlink(filename)
+    start=time.time()
+    df=crow.dataflow.from_suite(suite,filename)
+    df.add_cycles(cycles_of(suite))
+    return time.time()-start
+
+def run_stage(stage,text,tempdir,profile_dir):
+    function=globals()[f'stage_{stage}']
+    if not profile_dir:
+        return function(text,tempdir)
+    import cProfile
+    profile=cProfile.Profile()
+    result=profile.runcall(function,text,tempdir)
+    profile.dump_stats(os.path.join(profile_dir,f'{stage}.prof'))
+    return result
+
+def main():
+    args=get_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+    stages=args.stages.split(',')
+    for stage in stages:
+        if stage not in STAGES:
+            sys.exit(f'{stage}: unknown stage; known stages are {", ".join(STAGES)}')
+    if args.profile:
+        os.makedirs(args.profile,exist_ok=True)
+    text=suite_yaml(args)
+    suite=load_suite(text)
+    ntasks=sum([ 1 for item in suite.walk_task_tree() if item.is_task() ])
+    results={ 'parameters':{
+                  key:getattr(args,key) for key in [
+                      'families', 'tasks', 'members', 'cycles', 'alarms',
+                      'variables', 'repeat' ] },
+              'tasks':ntasks,
+              'python':platform.python_version(),
+              'seconds':dict() }
+    with tempfile.TemporaryDirectory(prefix='bench_suite_generation.') as tempdir:
+        for stage in stages:
+            results['seconds'][stage]=min([
+                run_stage(stage,text,tempdir,args.profile)
+                for i in range(args.repeat) ])
+            print(f'{stage:20s} {results["seconds"][stage]:9.3f}s',
+                  file=sys.stderr)
+    output=json.dumps(results,indent=2)
+    print(output)
+    if args.json:
+        with open(args.json,'wt') as fd:
+            fd.write(output+'\n')
+
+if __name__ == '__main__':
+    main()
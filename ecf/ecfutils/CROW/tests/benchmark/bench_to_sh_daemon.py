@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+"""!Compares the per-call latency of to_sh.py with and without a
+"to_sh.py --serve" daemon.
+
+Runs "to_sh.py FILE scope:SCOPE import:.*" for each requested scope
+as separate processes, the way job scripts do, first without and then
+with $CROW_TO_SH_SOCKET pointing to a daemon that serves the same
+files.  Also checks that both give the same output.  The document can
+be a list of YAML files, or an experiment directory with a _main.yaml
+such as the one made by ecf/ecfutils/setup_case.sh:
+
+    bench_to_sh_daemon.py --calls 10 /path/to/expdir/EXPNAME"""
+
+import os, sys, time, socket, argparse, tempfile, subprocess, statistics
+from context import crow
+import crow.config, crow.config_daemon
+from collections.abc import Mapping
+
+TO_SH=os.path.abspath(os.path.join(os.path.dirname(__file__),'../../to_sh.py'))
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Time to_sh.py calls with and without a daemon.')
+    parser.add_argument('inputs',nargs='+',metavar='YAML_OR_EXPDIR',
+                        help='YAML files, or one directory with a _main.yaml')
+    parser.add_argument('--scopes',default=None,
+                        help='comma-separated scopes to export (default: every top-level map)')
+    parser.add_argument('--calls',type=int,default=5,help='number of calls per scope')
+    return parser.parse_args()
+
+def yaml_file_for(inputs,tempdir):
+    if len(inputs)==1 and os.path.isdir(inputs[0]):
+        filename=os.path.join(tempdir,'config.yaml')
+        with open(filename,'wt') as fd:
+            crow.config.follow_main(fd,inputs[0])
+        return [ filename ]
+    return inputs
+
+def time_calls(files,scopes,calls,env):
+    times=list()
+    outputs=dict()
+    for scope in scopes:
+        for i in range(calls):
+            start=time.time()
+            result=subprocess.run(
+                [ sys.executable, TO_SH ] + files + [ f'scope:{scope}', 'import:.*' ],
+                env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            times.append(time.time()-start)
+            outputs[scope]=(result.returncode,result.stdout)
+    return times, outputs
+
+def wait_for_daemon(path,daemon,timeout=600):
+    start=time.time()
+    while time.time()-start<timeout:
+        if daemon.poll() is not None:
+            sys.exit(f'{path}: daemon exited with status {daemon.returncode}')
+        with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(path)
+                return time.time()-start
+            except OSError:
+                time.sleep(0.05)
+    sys.exit(f'{path}: daemon did not start')
+
+def report(label,times):
+    print(f'{label:>10s} {len(times):6d} {statistics.mean(times):9.4f} '
+          f'{statistics.median(times):9.4f} {min(times):9.4f} {max(times):9.4f}')
+
+def main():
+    args=get_args()
+    with tempfile.TemporaryDirectory(prefix='bench_to_sh_daemon.') as tempdir:
+        files=yaml_file_for(args.inputs,tempdir)
+        if args.scopes:
+            scopes=args.scopes.split(',')
+        else:
+            config=crow.config.from_file(*files)
+            scopes=[ k for k in config.keys()
+                     if isinstance(config._raw(k),Mapping) ]
+        env=dict(os.environ)
+        env.pop(crow.config_daemon.SOCKET_VAR,None)
+        local_times, local_outputs = time_calls(files,scopes,args.calls,env)
+
+        path=os.path.join(tempdir,'to_sh.sock')
+        daemon=subprocess.Popen([ sys.executable, TO_SH, '--serve', path,
+                                  '--idle-timeout', '600' ] + files,
+                                stderr=subprocess.DEVNULL)
+        try:
+            startup=wait_for_daemon(path,daemon)
+            env[crow.config_daemon.SOCKET_VAR]=path
+            daemon_times, daemon_outputs = time_calls(files,scopes,args.calls,env)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    print(f'daemon startup: {startup:.3f}s')
+    print(f'{"MODE":>10s} {"CALLS":>6s} {"MEAN(s)":>9s} {"MEDIAN(s)":>9s} {"MIN(s)":>9s} {"MAX(s)":>9s}')
+    report('local',local_times)
+    report('daemon',daemon_times)
+    differ=[ s for s in scopes if local_outputs[s]!=daemon_outputs[s] ]
+    if differ:
+        sys.exit(f'output differs for scopes: {", ".join(differ)}')
+    print(f'output identical for {len(scopes)} scopes')
+
+if __name__ == '__main__':
+    main()
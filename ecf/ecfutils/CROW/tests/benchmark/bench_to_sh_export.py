@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+"""!Times the variable exports that job scripts make through to_sh.py.
+
+Loads a CROW YAML document, then exports every variable of the
+requested scopes the same way as "to_sh.py FILE scope:SCOPE
+import:.*", with a freshly loaded document for each repetition so
+that every expression is evaluated again.  The document can be a
+list of YAML files, or an experiment directory with a _main.yaml such
+as the one made by ecf/ecfutils/setup_case.sh:
+
+    bench_to_sh_export.py --repeat 5 /path/to/expdir/EXPNAME
+
+Run with --no-compile-cache to measure the same exports with the
+expression compile cache disabled."""
+
+import os, sys, io, time, logging, argparse, tempfile
+from context import crow
+import crow.config, crow.tools
+from collections.abc import Mapping
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import to_sh
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Time to_sh.py variable exports.')
+    parser.add_argument('inputs',nargs='+',metavar='YAML_OR_EXPDIR',
+                        help='YAML files, or one directory with a _main.yaml')
+    parser.add_argument('--scopes',default=None,
+                        help='comma-separated scopes to export (default: every top-level map)')
+    parser.add_argument('--repeat',type=int,default=3,help='number of repetitions')
+    parser.add_argument('--no-compile-cache',action='store_true',
+                        help='disable the compiled expression cache')
+    return parser.parse_args()
+
+def yaml_file_for(inputs,tempdir):
+    if len(inputs)==1 and os.path.isdir(inputs[0]):
+        filename=os.path.join(tempdir,'config.yaml')
+        with open(filename,'wt') as fd:
+            crow.config.follow_main(fd,inputs[0])
+        return [ filename ]
+    return inputs
+
+def export_scopes(files,scopes):
+    pa=to_sh.ProcessArgs(True,[])
+    pa.files=list(files)
+    start=time.time()
+    pa.read_files()
+    loaded=time.time()
+    if scopes is None:
+        scopes=[ k for k in pa.config.keys()
+                 if isinstance(pa.config._raw(k),Mapping) ]
+    count=0
+    for scope in scopes:
+        for arg in [ f'scope:{scope}', 'import:.*' ]:
+            try:
+                for var,value in pa.process_arg(arg):
+                    if isinstance(pa.to_shell(var,value),str):
+                        count+=1
+            except Exception:
+                break # same as a to_sh.py failure; skip the scope
+    return loaded-start, time.time()-loaded, count, scopes
+
+def main():
+    args=get_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+    if args.no_compile_cache:
+        crow.tools.set_expression_cache_size(0)
+    scopes=args.scopes.split(',') if args.scopes else None
+    with tempfile.TemporaryDirectory(prefix='bench_to_sh_export.') as tempdir:
+        files=yaml_file_for(args.inputs,tempdir)
+        print(f'{"REPEAT":>6s} {"LOAD(s)":>9s} {"EXPORT(s)":>10s} {"VARS":>6s}')
+        for i in range(args.repeat):
+            load, export, count, scopes = export_scopes(files,scopes)
+            print(f'{i:6d} {load:9.3f} {export:10.3f} {count:6d}')
+    info=crow.tools.expression_cache_info()
+    print(f'compile cache: {info.hits} hits, {info.misses} misses, {info.currsize} entries')
+
+if __name__ == '__main__':
+    main()
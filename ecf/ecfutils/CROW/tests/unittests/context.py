@@ -3,3 +3,8 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 #print(sys.path)
 import crow
+
+# Snapshots and graph stores are tested in test_snapshot and
+# test_graph_store; do not make them elsewhere.
+os.environ.pop('CROW_CONFIG_SNAPSHOT_DIR',None)
+os.environ.pop('CROW_GRAPH_STORE_DIR',None)
@@ -0,0 +1,32 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import unittest
+from datetime import timedelta
+from context import crow
+from crow.metascheduler.algebra import intern, simplify, complexity
+from crow.config import CycleExistsDependency, TRUE_DEPENDENCY
+
+class TestAlgebraIntern(unittest.TestCase):
+
+    def dep(self,hours):
+        return CycleExistsDependency(timedelta(seconds=3600*hours))
+
+    def test_identical_trees_are_shared(self):
+        a=intern((self.dep(1)|self.dep(2)) & ~self.dep(3))
+        b=intern((self.dep(1)|self.dep(2)) & ~self.dep(3))
+        self.assertIs(a,b)
+        self.assertIs(a.depends[0],intern(self.dep(1)|self.dep(2)))
+        self.assertIsNot(a,intern((self.dep(1)|self.dep(2)) & ~self.dep(4)))
+        self.assertAlmostEqual(complexity(a),4.32,places=3)
+
+    def test_simplify_does_not_modify_input(self):
+        tree=~(~self.dep(1) | ~self.dep(2)) & (self.dep(3) | TRUE_DEPENDENCY)
+        text=repr(tree)
+        result=simplify(tree)
+        self.assertEqual(repr(tree),text)
+        self.assertEqual(result,self.dep(1)&self.dep(2))
+        self.assertIs(simplify(tree.copy_dependencies()),result)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import unittest
+from datetime import datetime, timedelta
+from context import crow
+from crow.tools import Clock
+
+HOUR=timedelta(hours=1)
+START=datetime(2017,8,15)
+
+class TestClock(unittest.TestCase):
+
+    def test_membership(self):
+        clock=Clock(start=START,step=6*HOUR,end=START+48*HOUR)
+        self.assertIn(START+18*HOUR,clock)
+        self.assertNotIn(START+19*HOUR,clock)
+        self.assertNotIn(START-6*HOUR,clock)
+        self.assertNotIn(START+54*HOUR,clock)
+        self.assertIn(-12*HOUR,clock)
+        self.assertNotIn(3*HOUR,clock)
+        self.assertIn(Clock(START+6*HOUR,12*HOUR,START+30*HOUR),clock)
+        self.assertNotIn(Clock(START+6*HOUR,12*HOUR),clock)
+        clock.end=START+96*HOUR
+        self.assertIn(START+90*HOUR,clock)
+
+    def test_times(self):
+        clock=Clock(start=START,step=6*HOUR,end=START+20*HOUR)
+        times=[ START+i*6*HOUR for i in range(4) ]
+        self.assertEqual(clock.times(),times)
+        self.assertEqual(list(clock),times)
+        self.assertEqual(list(clock.offsets()),
+                         [ i*6*3600*1000000 for i in range(4) ])
+        self.assertEqual([ c.now for c in clock.iternow() ],times)
+        with self.assertRaises(TypeError):
+            Clock(start=START,step=6*HOUR).times()
+
+    def test_for_alarm(self):
+        clock=Clock(start=START+6*HOUR,step=6*HOUR,end=START+120*HOUR)
+        alarm=Clock(start=START,step=24*HOUR)
+        gfs=clock.for_alarm(alarm)
+        self.assertEqual((gfs.start,gfs.step,gfs.end),
+                         (START+24*HOUR,24*HOUR,START+120*HOUR))
+        with self.assertRaises(ValueError):
+            clock.for_alarm(Clock(start=START,step=9*HOUR))
+
+if __name__ == '__main__':
+    unittest.main()
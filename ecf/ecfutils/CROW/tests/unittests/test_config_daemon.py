@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import os, sys, time, shutil, socket, tempfile, unittest, subprocess
+from context import crow
+import crow.config_daemon
+from crow.config_daemon import request
+
+TO_SH=os.path.abspath(os.path.join(os.path.dirname(__file__),'../../to_sh.py'))
+
+class TestConfigDaemon(unittest.TestCase):
+
+    YAML='''
+scope:
+  a: 2
+  b: !calc a*21
+  c: !calc tools.env('CROW_DAEMON_TEST','unset')
+'''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir=tempfile.mkdtemp(prefix='crow_daemon.')
+        cls.file=os.path.join(cls.dir,'test.yaml')
+        with open(cls.file,'wt') as fd:
+            fd.write(cls.YAML)
+        cls.path=os.path.join(cls.dir,'sock')
+        cls.daemon=subprocess.Popen(
+            [ sys.executable, TO_SH, '--serve', cls.path,
+              '--idle-timeout', '60', cls.file ],
+            stderr=subprocess.DEVNULL)
+        for i in range(600):
+            with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(cls.path)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.daemon.terminate()
+        cls.daemon.wait()
+        shutil.rmtree(cls.dir)
+
+    def test_export(self):
+        status, stdout, stderr = request(
+            [ self.file, 'export:y', 'scope:scope', 'import:[ab]' ],self.path)
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout, 'export a=2 ; export b=42')
+
+    def test_caller_environment(self):
+        os.environ['CROW_DAEMON_TEST']='from caller'
+        try:
+            reply=request([ self.file, 'scope:scope', 'C=c' ],self.path)
+        finally:
+            del os.environ['CROW_DAEMON_TEST']
+        self.assertEqual(reply[1], 'C="from caller"')
+        reply=request([ self.file, 'scope:scope', 'C=c' ],self.path)
+        self.assertEqual(reply[1], 'C=unset')
+
+    def test_failure(self):
+        status, stdout, stderr = request(
+            [ self.file, 'scope:nothere', 'import:.*' ],self.path)
+        self.assertEqual(status, 1)
+        self.assertIn('/bin/false', stdout)
+
+    def defunct_children(self):
+        defunct=list()
+        for pid in os.listdir('/proc'):
+            try:
+                with open(f'/proc/{pid}/stat','rt') as fd:
+                    fields=fd.read().rsplit(')',1)[1].split()
+            except (OSError,IndexError):
+                continue
+            if fields[0]=='Z' and int(fields[1])==self.daemon.pid:
+                defunct.append(int(pid))
+        return defunct
+
+    def test_reaps_children(self):
+        for i in range(5):
+            reply=request([ self.file, 'scope:scope', 'A=a' ],self.path)
+            self.assertEqual(reply[1], 'A=2')
+        time.sleep(3*crow.config_daemon.REAP_INTERVAL)
+        self.assertEqual(self.defunct_children(), [])
+
+    def test_fallback(self):
+        self.assertIsNone(request([ self.file, 'run:"true"' ],self.path))
+        self.assertIsNone(request([ TO_SH, 'scope:scope' ],self.path))
+        self.assertIsNone(request([ self.file, 'scope:scope' ],
+                                  os.path.join(self.dir,'nothere')))
+
+if __name__ == '__main__':
+    unittest.main()
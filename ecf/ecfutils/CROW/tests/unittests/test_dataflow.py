@@ -0,0 +1,61 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import os, shutil, tempfile, unittest
+from datetime import datetime, timedelta
+from context import crow
+from crow.dataflow import Dataflow
+
+PRE='com/{cycle:%Y%m%d%H}/{actor}/{slot}.t{cycle:%H}z'
+CYCLES=[ datetime(2017,8,15)+i*timedelta(hours=6) for i in range(3) ]
+
+class TestDataflow(unittest.TestCase):
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='crow_dataflow.')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make(self,name):
+        df=Dataflow(os.path.join(self.dir,name))
+        df.add_output_slot('fam.job1','oslot',PRE+'.x')
+        df.add_output_slot('fam.job1','bad',PRE+'.{nosuch}')
+        df.add_output_slot('fam.job2','oslot',PRE+'.{letter}{slotnum}',
+                           { 'slotnum':[1,2], 'letter':'A', 'flag':True,
+                             'when':datetime(2017,1,1) })
+        return df
+
+    def data(self,df):
+        return df._con.execute(
+            'SELECT pid,cycle,loc FROM Data ORDER BY pid,cycle').fetchall()
+
+    def test_add_cycles(self):
+        one=self.make('one.db')
+        with self.assertLogs('crow.dataflow','ERROR'):
+            for cycle in CYCLES:
+                one.add_cycle(cycle)
+        many=self.make('many.db')
+        with self.assertLogs('crow.dataflow','ERROR') as logs:
+            many.add_cycles(CYCLES)
+        self.assertEqual(len(logs.output),3)
+        self.assertEqual(self.data(one),self.data(many))
+        self.assertEqual(len(self.data(many)),9)
+        self.assertIn('com/2017081506/fam.job2/oslot.t06z.A2',
+                      [ row[2] for row in self.data(many) ])
+
+        with self.assertLogs('crow.dataflow','ERROR'):
+            many.add_cycles(CYCLES)
+        self.assertEqual(len(self.data(many)),9)
+        many.del_cycle(CYCLES[0])
+        self.assertEqual(len(self.data(many)),6)
+
+    def test_indexes(self):
+        df=self.make('index.db')
+        indexes=[ row[0] for row in df._con.execute(
+            'SELECT name FROM sqlite_master WHERE type="index"') ]
+        for index in [ 'Slot_actor_slot_flow', 'Data_cycle', 'Meta_pid' ]:
+            self.assertIn(index,indexes)
+
+if __name__ == '__main__':
+    unittest.main()
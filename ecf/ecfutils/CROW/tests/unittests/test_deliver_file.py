@@ -0,0 +1,50 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import os, shutil, tempfile, unittest
+from context import crow
+from crow.tools import deliver_file, deliver_files
+
+class TestDeliverFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='crow_deliver_file.')
+        self.sources=list()
+        for i in range(5):
+            path=os.path.join(self.dir,f'src{i}')
+            with open(path,'wb') as fd:
+                fd.write(os.urandom(100000+i))
+            os.chmod(path,0o640)
+            os.utime(path,(1000000,2000000+i))
+            self.sources.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertDelivered(self,from_file,to_file):
+        with open(from_file,'rb') as a, open(to_file,'rb') as b:
+            self.assertEqual(a.read(),b.read())
+        astat, bstat = os.stat(from_file), os.stat(to_file)
+        self.assertEqual(astat.st_mode,bstat.st_mode)
+        self.assertEqual(astat.st_mtime,bstat.st_mtime)
+
+    def test_deliver_file(self):
+        to_file=os.path.join(self.dir,'com','one','out')
+        deliver_file(self.sources[0],to_file)
+        self.assertDelivered(self.sources[0],to_file)
+        self.assertEqual(os.listdir(os.path.dirname(to_file)),['out'])
+
+    def test_deliver_files(self):
+        pairs=[ (src,os.path.join(self.dir,'com',os.path.basename(src)))
+                for src in self.sources ]
+        deliver_files(pairs,workers=3)
+        for from_file,to_file in pairs:
+            self.assertDelivered(from_file,to_file)
+
+        missing=os.path.join(self.dir,'missing')
+        with self.assertRaises(FileNotFoundError):
+            deliver_files([(missing,os.path.join(self.dir,'x'))]+pairs)
+        self.assertEqual(len(os.listdir(os.path.join(self.dir,'com'))),5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import os, shutil, tempfile, unittest
+from context import crow
+from crow.metascheduler.ecf_writer import write_files, WriteStats, \
+    MANIFEST_NAME
+
+class TestEcfWriter(unittest.TestCase):
+
+    FILES={ 'defs/suite_2017081500.def':'suite suite_2017081500\nendsuite\n',
+            'suite_2017081500/gfs/jgfs_forecast.ecf':'forecast\n',
+            'suite_2017081500/gfs/post/jgfs_post.ecf':'post\n' }
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='crow_ecf_writer.')
+        os.environ.pop('CROW_ECF_MANIFEST',None)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self,relpath):
+        with open(os.path.join(self.dir,relpath),'rt') as fd:
+            return fd.read()
+
+    def test_writes_only_changes(self):
+        self.assertEqual(write_files(self.dir,self.FILES,workers=3),
+                         WriteStats(3,0,46))
+        for relpath,text in self.FILES.items():
+            self.assertEqual(self.read(relpath),text)
+        self.assertTrue(os.path.exists(os.path.join(self.dir,MANIFEST_NAME)))
+        self.assertEqual(write_files(self.dir,self.FILES),WriteStats(0,3,0))
+
+        files=dict(self.FILES)
+        files['suite_2017081500/gfs/jgfs_forecast.ecf']='forecast 2\n'
+        self.assertEqual(write_files(self.dir,files),WriteStats(1,2,11))
+        self.assertEqual(self.read('suite_2017081500/gfs/jgfs_forecast.ecf'),
+                         'forecast 2\n')
+
+    def test_rewrites_files_changed_on_disk(self):
+        write_files(self.dir,self.FILES)
+        os.unlink(os.path.join(self.dir,'suite_2017081500/gfs/post/jgfs_post.ecf'))
+        with open(os.path.join(self.dir,'defs/suite_2017081500.def'),'wt') as fd:
+            fd.write('edited\n')
+        self.assertEqual(write_files(self.dir,self.FILES),WriteStats(2,1,37))
+        for relpath,text in self.FILES.items():
+            self.assertEqual(self.read(relpath),text)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir,'defs'))),
+                         [ 'suite_2017081500.def' ])
+
+    def test_without_manifest(self):
+        os.environ['CROW_ECF_MANIFEST']='NO'
+        try:
+            write_files(self.dir,self.FILES)
+            self.assertEqual(write_files(self.dir,self.FILES),WriteStats(3,0,46))
+        finally:
+            del os.environ['CROW_ECF_MANIFEST']
+        self.assertFalse(os.path.exists(os.path.join(self.dir,MANIFEST_NAME)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import os, shutil, tempfile, unittest
+from context import crow
+from crow.config import from_string, Suite
+from crow.metascheduler import to_ecflow
+from crow.metascheduler.graph_store import GraphStore, suite_hash
+
+class TestToEcflow(unittest.TestCase):
+
+    YAML='''
+task_defaults: &task_defaults
+  ecf_file: !expand "run {task_path_var} at {suite.Clock.now:%Y%m%d%H}"
+suite: !Cycle
+  Clock: !Clock
+    start: 2017-08-15t00:00:00
+    end: 2017-08-16t18:00:00
+    step: !timedelta 06:00
+  Alarms:
+    gfs: !Clock
+      start: 2017-08-15t00:00:00
+      end: 2017-08-16t18:00:00
+      step: !timedelta 12:00
+  ecFlow:
+    scheduler: none
+    suite_name: "test_%Y%m%d%H"
+    suite_def_filename: "test_%Y%m%d%H.def"
+    dates_in_time_dependencies: false
+  gdas: !Family
+    prep: !Task
+      <<: *task_defaults
+    anal: !Task
+      <<: *task_defaults
+      Trigger: !Depend prep
+    fcst: !Task
+      <<: *task_defaults
+      Trigger: !Depend anal & suite.has_cycle("-06:00")
+  gfs: !Family
+    AlarmName: gfs
+    fcst: !Task
+      <<: *task_defaults
+      Trigger: !Depend up.gdas.anal
+    post: !Task
+      <<: *task_defaults
+      Trigger: !Depend fcst
+  final: !Task
+    <<: *task_defaults
+'''
+
+    def to_ecflow(self,workers,store=None):
+        return to_ecflow(Suite(from_string(self.YAML).suite),workers,store)
+
+    def test_workers_give_same_result(self):
+        serial_defs,serial_files=self.to_ecflow(1)
+        self.assertEqual(len(serial_defs), 8)
+        for workers in [ 2, 3 ]:
+            defs,files=self.to_ecflow(workers)
+            self.assertEqual(defs, serial_defs)
+            self.assertEqual(dict(files), dict(serial_files))
+
+    def test_graph_store_gives_same_result(self):
+        expected_defs,expected_files=self.to_ecflow(1)
+        directory=tempfile.mkdtemp(prefix='crow_graph_store.')
+        try:
+            store=GraphStore(directory,suite_hash(self.YAML))
+            # The first call analyzes and stores, the second restores.
+            for i in range(2):
+                defs,files=self.to_ecflow(1,store)
+                self.assertEqual(defs, expected_defs)
+                self.assertEqual(dict(files), dict(expected_files))
+                self.assertEqual(len(os.listdir(directory)), 8)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import unittest
+from copy import deepcopy
+from context import crow
+import crow.config, crow.tools
+from crow.config import from_string, invalidate_cache
+
+class TestEvalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.config=from_string('''
+scope:
+  a: 1
+  b: !calc a+1
+  c: !calc b*10
+  d: !calc 5
+  e: !expand "{c}-{d}"
+  f: [ !calc a*100, 3 ]
+other:
+  g: !calc doc.scope.c+1
+''')
+
+    def tearDown(self):
+        crow.config.stop_eval_stats()
+
+    def test_setitem_invalidates_dependents(self):
+        self.assertEqual(self.config.scope.e, '20-5')
+        self.assertEqual(self.config.other.g, 21)
+        self.config.scope.a=2
+        self.assertEqual(self.config.scope.c, 30)
+        self.assertEqual(self.config.scope.e, '30-5')
+        self.assertEqual(self.config.other.g, 31)
+
+    def test_list_dependents(self):
+        self.assertEqual(self.config.scope.f[0], 100)
+        self.config.scope.a=3
+        self.assertEqual(self.config.scope.f[0], 300)
+
+    def test_independent_values_are_kept(self):
+        self.assertEqual(self.config.scope.e, '20-5')
+        stats=crow.config.start_eval_stats()
+        self.config.scope.a=2
+        self.assertEqual(self.config.scope.e, '30-5')
+        self.assertEqual(stats.count['doc.scope.e'], 1)
+        self.assertEqual(stats.count['doc.scope.c'], 1)
+        self.assertEqual(stats.count['doc.scope.b'], 1)
+        self.assertNotIn('doc.scope.d', stats.count)
+
+    def test_invalidate_key(self):
+        self.assertEqual(self.config.scope.c, 20)
+        self.assertEqual(self.config.scope.d, 5)
+        stats=crow.config.start_eval_stats()
+        invalidate_cache(self.config.scope,'b')
+        self.assertEqual(self.config.scope.c, 20)
+        self.assertEqual(self.config.scope.d, 5)
+        self.assertEqual(stats.count['doc.scope.b'], 1)
+        self.assertEqual(stats.count['doc.scope.c'], 1)
+        self.assertNotIn('doc.scope.d', stats.count)
+
+    def test_deepcopy_dependents(self):
+        self.assertEqual(self.config.scope.e, '20-5')
+        self.assertEqual(self.config.scope.f[0], 100)
+        scope=deepcopy(self.config.scope)
+        scope.a=2
+        self.assertEqual(scope.c, 30)
+        self.assertEqual(scope.e, '30-5')
+        self.assertEqual(scope.f[0], 200)
+        self.assertEqual(self.config.scope.e, '20-5')
+        self.assertEqual(self.config.scope.f[0], 100)
+
+    def test_stats_report(self):
+        stats=crow.config.start_eval_stats()
+        self.config.other.g
+        self.assertIs(crow.config.stop_eval_stats(), stats)
+        self.assertEqual(stats.total_count(), 3)
+        self.assertIn('doc.other.g', stats.report())
+        self.config.scope.a=5
+        self.config.other.g
+        self.assertEqual(stats.total_count(), 3)
+
+class TestCompileCache(unittest.TestCase):
+
+    YAML='''
+scope:
+  a: 2
+  b: !calc a*21
+  c: !expand "{a}-{b}"
+'''
+
+    def tearDown(self):
+        crow.tools.set_expression_cache_size(crow.tools.EXPRESSION_CACHE_SIZE)
+
+    def test_shared_between_documents(self):
+        crow.tools.set_expression_cache_size(16)
+        self.assertEqual(from_string(self.YAML).scope.c, '2-42')
+        misses=crow.tools.expression_cache_info().misses
+        self.assertEqual(from_string(self.YAML).scope.c, '2-42')
+        info=crow.tools.expression_cache_info()
+        self.assertEqual(info.misses, misses)
+        self.assertGreaterEqual(info.hits, 2)
+
+    def test_leading_blanks(self):
+        self.assertEqual(eval(crow.tools.compile_expression(' \t1+2')), 3)
+
+    def test_disabled(self):
+        crow.tools.set_expression_cache_size(0)
+        self.assertEqual(from_string(self.YAML).scope.c, '2-42')
+        self.assertEqual(crow.tools.expression_cache_info().currsize, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import os, shutil, tempfile, unittest
+from context import crow
+from crow.config import from_string, Suite
+from crow.metascheduler.graph import Graph
+from crow.metascheduler.graph_store import GraphStore, graph_store_for, \
+    suite_hash
+
+class TestGraphStore(unittest.TestCase):
+
+    YAML='''
+suite: !Cycle
+  Clock: !Clock
+    start: 2017-08-15t00:00:00
+    end: 2017-08-16t00:00:00
+    step: !timedelta 06:00
+  fam: !Family
+    a: !Task
+      Trigger: !Depend suite.has_cycle('-06:00')
+    b: !Task
+      Trigger: !Depend a | ~ a.is_running()
+      Complete: !Depend a.is_completed()
+    c: !Task
+      Trigger: !Depend b & up.fam.at('-06:00')
+'''
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='crow_graph_store.')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def suite(self):
+        return Suite(from_string(self.YAML).suite)
+
+    def analyze(self,suite,cycle,store=None):
+        graph=Graph(suite,suite.Clock)
+        states=store.load(suite,suite.Clock,cycle) if store else None
+        graph.add_cycle(cycle,states)
+        if states is None:
+            graph.simplify_cycle(cycle)
+        return graph.node_states(cycle)
+
+    def test_round_trip(self):
+        store=GraphStore(self.dir,suite_hash(self.YAML))
+        suite=self.suite()
+        for cycle in [ suite.Clock.start, suite.Clock.start+suite.Clock.step ]:
+            expected=self.analyze(suite,cycle)
+            store.save(suite.Clock,cycle,expected,{})
+            restored=self.analyze(self.suite(),cycle,store)
+            self.assertEqual(repr(restored),repr(expected))
+
+    def test_changes_miss(self):
+        suite=self.suite()
+        cycle=suite.Clock.start
+        store=GraphStore(self.dir,suite_hash(self.YAML))
+        store.save(suite.Clock,cycle,self.analyze(suite,cycle),
+                   {('have_env',('CROW_GRAPH_STORE_TEST',)):('return',False)})
+        self.assertIsNotNone(store.load(suite,suite.Clock,cycle))
+        other=GraphStore(self.dir,suite_hash(self.YAML+'\n'))
+        self.assertIsNone(other.load(suite,suite.Clock,cycle))
+        os.environ['CROW_GRAPH_STORE_TEST']='changed'
+        try:
+            self.assertIsNone(store.load(suite,suite.Clock,cycle))
+        finally:
+            del os.environ['CROW_GRAPH_STORE_TEST']
+        self.assertIsNone(suite_hash(self.YAML,{(None,()):None}))
+
+    def test_opt_in(self):
+        self.assertIsNone(graph_store_for(self.dir,self.YAML))
+        os.environ['CROW_GRAPH_STORE_DIR']=self.dir
+        try:
+            store=graph_store_for('expdir',self.YAML)
+            self.assertIsNone(graph_store_for('expdir',self.YAML,
+                                              {(None,()):None}))
+        finally:
+            del os.environ['CROW_GRAPH_STORE_DIR']
+        self.assertEqual(os.path.dirname(store.directory),self.dir)
+        self.assertEqual(store.suite_hash,suite_hash(self.YAML))
+        self.assertEqual(os.listdir(self.dir),[])
+
+if __name__ == '__main__':
+    unittest.main()
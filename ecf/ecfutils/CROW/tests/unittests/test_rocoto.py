@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import unittest
+from io import StringIO
+from context import crow
+from crow.config import from_string, Suite
+from crow.metascheduler.rocoto import to_rocoto, write_rocoto
+
+class TestWriteRocoto(unittest.TestCase):
+
+    YAML='''
+task_defaults: &task_defaults
+  Rocoto: !expand "<command>run {task_path_var}</command>"
+suite: !Cycle
+  Rocoto:
+    scheduler: none
+    workflow_install: .
+    tasks: !expand "{to_rocoto.make_task_xml(indent=1)}"
+    task_section: !expand "<!-- tasks -->\\n{tasks}"
+    workflow_xml: !expand |
+      <workflow>
+      {to_rocoto.make_time_xml(indent=1)}
+      {task_section}
+      </workflow>
+  Clock: !Clock
+    start: 2017-08-15t00:00:00
+    end: 2017-08-16t18:00:00
+    step: !timedelta 06:00
+  Alarms:
+    gfs: !Clock
+      start: 2017-08-15t00:00:00
+      end: 2017-08-16t18:00:00
+      step: !timedelta 12:00
+  gdas: !Family
+    prep: !Task
+      <<: *task_defaults
+    anal: !Task
+      <<: *task_defaults
+      Trigger: !Depend prep
+  gfs: !Family
+    AlarmName: gfs
+    Complete: !Depend suite.has_cycle("-06:00")
+    fcst: !Task
+      <<: *task_defaults
+      Trigger: !Depend up.gdas.anal
+  final: !Task
+    <<: *task_defaults
+'''
+
+    def suite(self):
+        return Suite(from_string(self.YAML).suite)
+
+    def test_same_as_to_rocoto(self):
+        expected=to_rocoto(self.suite())
+        self.assertIn('<!-- tasks -->',expected)
+        self.assertIn('<task name="final" final="true">',expected)
+        sio=StringIO()
+        write_rocoto(self.suite(),sio)
+        self.assertEqual(sio.getvalue().encode('utf-8'),
+                         expected.encode('utf-8'))
+
+    def test_no_markers_are_cached(self):
+        suite=self.suite()
+        write_rocoto(suite,StringIO())
+        for key in [ 'tasks', 'task_section', 'workflow_xml' ]:
+            self.assertNotIn('\0',suite.Rocoto[key])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import os, shutil, tempfile, unittest
+from context import crow
+import crow.config
+from crow.config import from_file, from_dir
+
+class TestSnapshot(unittest.TestCase):
+
+    YAML='''
+scope:
+  a: 2
+  b: !calc a*21
+  c: !Immediate [ !calc b+1 ]
+  home: !Immediate [ !calc "tools.isdir(tools.env('CROW_SNAPSHOT_TEST_DIR'))" ]
+'''
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='crow_snapshot.')
+        self.snapdir=os.path.join(self.dir,'snapshots')
+        os.mkdir(self.snapdir)
+        self.file=os.path.join(self.dir,'test.yaml')
+        self.write(self.YAML)
+        os.environ['CROW_SNAPSHOT_TEST_DIR']=self.dir
+        os.environ['CROW_CONFIG_SNAPSHOT_DIR']=self.snapdir
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        del os.environ['CROW_SNAPSHOT_TEST_DIR']
+        del os.environ['CROW_CONFIG_SNAPSHOT_DIR']
+
+    def write(self,text):
+        with open(self.file,'wt') as fd:
+            fd.write(text)
+
+    def snapshots(self,directory=None):
+        return [ f for f in os.listdir(directory or self.snapdir)
+                 if f.startswith('.crow-snapshot-') ]
+
+    def loads_snapshot(self,text):
+        snapshot=crow.config.snapshot_for(self.file,
+                                          evaluate_immediates=True,
+                                          validation_stage=None)
+        key=snapshot.key(text,evaluate_immediates=True,
+                         validation_stage=None)
+        return snapshot.load(key) is not None
+
+    def test_round_trip(self):
+        first=from_file(self.file)
+        self.assertEqual(len(self.snapshots()), 1)
+        self.assertEqual(self.snapshots(self.dir), [])
+        self.assertTrue(self.loads_snapshot(self.YAML))
+        second=from_file(self.file)
+        self.assertEqual(second.scope.b, 42)
+        self.assertEqual(second.scope._raw('c'), 43)
+        self.assertIs(second.scope._raw('home'), True)
+        self.assertIs(second._globals()['doc'], second)
+        self.assertIs(second._globals()['tools'], crow.config.CONFIG_TOOLS)
+        second.scope.a=3
+        self.assertEqual(second.scope.b, 63)
+
+    def test_input_changed(self):
+        from_file(self.file)
+        text=self.YAML.replace('a: 2','a: 3')
+        self.write(text)
+        self.assertFalse(self.loads_snapshot(text))
+        self.assertEqual(from_file(self.file).scope.b, 63)
+        self.assertTrue(self.loads_snapshot(text))
+        self.assertEqual(len(self.snapshots()), 1)
+
+    def test_environment_changed(self):
+        from_file(self.file)
+        os.environ['CROW_SNAPSHOT_TEST_DIR']=os.path.join(self.dir,'missing')
+        self.assertFalse(self.loads_snapshot(self.YAML))
+
+    def test_environment_get_and_iteration(self):
+        from crow.config.tools import ENV
+        for expr in [ "ENV.get('CROW_SNAPSHOT_TEST_VAR','unset')",
+                      "len([ k for k in ENV if k.startswith('CROW_') ])" ]:
+            text=f'scope:\n  v: !Immediate [ !calc "{expr}" ]\n'
+            self.write(text)
+            from_file(self.file)
+            self.assertTrue(self.loads_snapshot(text))
+            ENV['CROW_SNAPSHOT_TEST_VAR']='set'
+            try:
+                self.assertFalse(self.loads_snapshot(text))
+            finally:
+                del ENV['CROW_SNAPSHOT_TEST_VAR']
+
+    def test_unrepeatable_tools(self):
+        from crow.config.tools import start_probe_log, stop_probe_log, \
+            probes_unchanged, CONFIG_TOOLS
+        log,old=start_probe_log()
+        try:
+            with self.assertRaises(Exception):
+                CONFIG_TOOLS['get_scheduler']('no such scheduler',{})
+        finally:
+            stop_probe_log(log,old)
+        self.assertFalse(probes_unchanged(log))
+
+    def test_from_dir(self):
+        from_dir(self.dir)
+        self.assertEqual(from_dir(self.dir).scope.b, 42)
+        self.assertEqual(len(self.snapshots()), 1)
+        self.assertEqual(self.snapshots(self.dir), [])
+
+    def test_disabled(self):
+        del os.environ['CROW_CONFIG_SNAPSHOT_DIR']
+        try:
+            self.assertIsNone(crow.config.snapshot_for(self.file))
+            self.assertEqual(from_file(self.file).scope.b, 42)
+        finally:
+            os.environ['CROW_CONFIG_SNAPSHOT_DIR']=self.snapdir
+        self.assertEqual(self.snapshots(), [])
+        self.assertEqual(self.snapshots(self.dir), [])
+
+if __name__ == '__main__':
+    unittest.main()
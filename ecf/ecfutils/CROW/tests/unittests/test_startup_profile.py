@@ -0,0 +1,45 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import os, sys, shutil, tempfile, unittest
+from context import crow
+import crow.startup_profile as startup_profile
+
+class TestStartupProfile(unittest.TestCase):
+
+    MODULE='crow_startup_profile_test_module'
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='crow_startup_profile.')
+        with open(os.path.join(self.dir,self.MODULE+'.py'),'wt') as fd:
+            fd.write('import json\nVALUE=1\n')
+        sys.path.insert(0,self.dir)
+
+    def tearDown(self):
+        startup_profile.stop()
+        sys.path.remove(self.dir)
+        sys.modules.pop(self.MODULE,None)
+        shutil.rmtree(self.dir)
+
+    def test_inactive_phase(self):
+        self.assertFalse(startup_profile.active())
+        with startup_profile.phase('nothing'):
+            pass
+        self.assertEqual(startup_profile.report(), '')
+
+    def test_imports_and_phases(self):
+        profile=startup_profile.start()
+        with startup_profile.phase('outer'):
+            with startup_profile.phase('inner'):
+                __import__(self.MODULE)
+        self.assertIn(self.MODULE, profile.imports)
+        inclusive,own=profile.imports[self.MODULE]
+        self.assertLessEqual(own, inclusive)
+        self.assertEqual([ (d,n) for d,n,s in profile.phases ],
+                         [ (0,'outer'), (1,'inner') ])
+        self.assertIn(self.MODULE, startup_profile.report())
+        self.assertIs(startup_profile.stop(), profile)
+        self.assertNotIn(profile, sys.meta_path)
+
+if __name__ == '__main__':
+    unittest.main()
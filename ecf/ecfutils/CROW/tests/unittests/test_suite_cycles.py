@@ -0,0 +1,61 @@
+#! /usr/bin/env python3
+f'This script requires python 3.6 or later'
+
+import unittest
+from datetime import datetime
+from context import crow
+import crow.config
+from crow.config import from_string, invalidate_cache, Suite
+
+class TestSuiteCycles(unittest.TestCase):
+
+    def setUp(self):
+        config=from_string('''
+workflow: !Cycle
+  Clock: !Clock
+    start: 2017-08-15t00:00:00
+    end: 2017-08-16t00:00:00
+    step: !timedelta 06:00
+  fam: !Family
+    task: !Task
+      hour: !calc suite.Clock.now.hour
+      label: !expand "cycle {hour:02d}"
+      fixed: !calc 2+3
+      Trigger: !Depend other
+    other: !Task
+      fixed: 7
+''')
+        self.suite=Suite(config.workflow)
+
+    def tearDown(self):
+        crow.config.stop_eval_stats()
+
+    def select(self,hour):
+        invalidate_cache(self.suite,'Clock')
+        self.suite.Clock.now=datetime(2017,8,15,hour)
+
+    def test_only_clock_values_change(self):
+        self.select(0)
+        task=self.suite.fam.task
+        trigger=task.Trigger
+        self.assertEqual(task.label, 'cycle 00')
+        self.assertEqual(task.fixed, 5)
+        stats=crow.config.start_eval_stats()
+        self.select(6)
+        self.assertIs(self.suite.fam.task, task)
+        self.assertIs(task.Trigger, trigger)
+        self.assertEqual(task.label, 'cycle 06')
+        self.assertEqual(task.fixed, 5)
+        self.assertEqual(stats.count['fam.task.label'], 1)
+        self.assertNotIn('fam.task.fixed', stats.count)
+
+    def test_full_invalidation(self):
+        self.select(12)
+        task=self.suite.fam.task
+        self.assertEqual(task.hour, 12)
+        invalidate_cache(self.suite,recurse=True)
+        self.suite.Clock.now=datetime(2017,8,15,18)
+        self.assertEqual(self.suite.fam.task.hour, 18)
+
+if __name__ == '__main__':
+    unittest.main()
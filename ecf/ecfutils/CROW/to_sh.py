@@ -1,8 +1,29 @@
 #! /usr/bin/env python3.6
 
+import sys
+import crow.startup_profile
+
+PROFILE_STARTUP = __name__ == '__main__' and \
+                  sys.argv[1:2]==['--profile-startup']
+if PROFILE_STARTUP:
+    # Report the import and evaluation times of this call to stderr.
+    del sys.argv[1]
+    crow.startup_profile.start()
+
+import crow.config_daemon
+
+if __name__ == '__main__' and not PROFILE_STARTUP and \
+   sys.argv[1:2]!=['--serve']:
+    # A "to_sh.py --serve" daemon answers without the imports below.
+    reply=crow.config_daemon.request(sys.argv[1:])
+    if reply is not None:
+        status, stdout, stderr = reply
+        sys.stderr.write(stderr)
+        sys.stdout.write(stdout)
+        exit(status)
+
 import subprocess
 import getopt
-import sys
 import re
 import os
 import logging
@@ -10,7 +31,8 @@ import logging
 import crow.config
 import crow.sysenv
 from crow.exceptions import CROWException
-from crow.tools import str_to_posix_sh
+from crow.tools import str_to_posix_sh, compile_expression
+from crow.startup_profile import phase
 from collections import Mapping
 from datetime import datetime
 
@@ -49,8 +71,9 @@ def shbackslash(s):
 ########################################################################
 
 class ProcessArgs(object):
-    def __init__(self,quiet,args):
+    def __init__(self,quiet,args,loaded=None):
         self.quiet=bool(quiet)
+        self.loaded=loaded # (files, config) from a to_sh.py --serve daemon
         self.args = args
         self.config = None
         self.scopes = list()
@@ -100,7 +123,7 @@ class ProcessArgs(object):
         elif hasattr(self.config,'_globals'):
             globals=self.config._globals()
         try:
-            return eval(expr,globals,self.scopes[-1])
+            return eval(compile_expression(expr),globals,self.scopes[-1])
         except Exception as e:
             logger.error(f'eval {expr}: {e}')
             raise
@@ -112,7 +135,7 @@ class ProcessArgs(object):
         elif hasattr(self.config,'_globals'):
             globals=self.config._globals()
         try:
-            exec(expr,globals,self.scopes[-1])
+            exec(compile_expression(expr,'exec'),globals,self.scopes[-1])
         except Exception as e:
             logger.error(f'exec {expr}: {e}')
             raise
@@ -168,7 +191,13 @@ class ProcessArgs(object):
         return NotImplemented
 
     def read_files(self):
-        config=crow.config.from_file(*self.files)
+        if self.loaded is None:
+            with phase(f'read {" ".join(self.files)}'):
+                config=crow.config.from_file(*self.files)
+        elif [ os.path.abspath(f) for f in self.files ] != self.loaded[0]:
+            raise crow.config_daemon.Fallback('daemon has other files')
+        else:
+            config=self.loaded[1]
         self.config = config
         self.scopes = [config]
         self.done_with_files=True
@@ -193,12 +222,13 @@ class ProcessArgs(object):
         results=list()
         fail=False
         for arg in self.args:
-            for var, value in self.process_arg(arg):
-                result=self.to_shell(var,value)
-                if result is FAILURE:
-                    fail=True
-                elif result is not SUCCESS:
-                    results.append(result)
+            with phase(arg):
+                for var, value in self.process_arg(arg):
+                    result=self.to_shell(var,value)
+                    if result is FAILURE:
+                        fail=True
+                    elif result is not SUCCESS:
+                        results.append(result)
         if fail:
             raise EpicFail()
         return results
@@ -314,17 +344,45 @@ class ProcessArgs(object):
 
 ########################################################################
 
-if __name__ == '__main__':
+def main(argv,loaded=None):
     try:
-        verbose=sys.argv[1]=='-v'
-        pa=ProcessArgs(not verbose,sys.argv[verbose+1:])
+        verbose=argv[0]=='-v'
+        pa=ProcessArgs(not verbose,argv[verbose:],loaded)
         writeme=' ; '.join([str(s) for s in pa.process_args()])
         sys.stdout.write(writeme)
     except EpicFail:
         sys.stdout.write('/bin/false failure- see prior errors.')
         sys.stderr.write('Failure; see prior errors.\n')
-        exit(1)
+        return 1
+    except crow.config_daemon.Fallback:
+        raise
     except:
         sys.stdout.write('/bin/false failure- see prior errors.')
         sys.stderr.write('Failure; see prior errors.\n')
         raise
+    return 0
+
+def serve(argv):
+    opts,files=getopt.getopt(argv,'',['serve=','idle-timeout='])
+    opts=dict(opts)
+    if not files:
+        raise ValueError('to_sh.py --serve SOCKET [--idle-timeout SECONDS] '
+                         'FILE [FILE ...]')
+    crow.config_daemon.serve(
+        opts['--serve'],files,main,
+        float(opts.get('--idle-timeout',crow.config_daemon.IDLE_TIMEOUT)))
+
+if __name__ == '__main__':
+    if sys.argv[1:2]==['--serve']:
+        serve(sys.argv[1:])
+    elif PROFILE_STARTUP:
+        stats=crow.config.start_eval_stats()
+        try:
+            status=main(sys.argv[1:])
+        finally:
+            crow.config.stop_eval_stats()
+            sys.stderr.write(f'\n{crow.startup_profile.report()}\n'
+                             f'{stats.report(10)}\n')
+        exit(status)
+    else:
+        exit(main(sys.argv[1:]))
@@ -56,7 +56,10 @@ if [[ "${WORKTOOLS_VERBOSE:-NO}" == YES ]] ; then
     set -x
 fi
 
+# Set WORKTOOLS_WORKERS to make the ecFlow files with that many
+# processes, or 0 for one per CPU.  The default is one process.
 $python36 -c "import worktools ; worktools.remake_ecflow_files_for_cycles(
   '$EXPDIR',
   '$FIRST_CYCLE',
-  '$LAST_CYCLE')"
+  '$LAST_CYCLE',
+  workers=${WORKTOOLS_WORKERS:-1})"
@@ -67,10 +67,13 @@ if ( ! ecflow_client --ping $redirect ) ; then
     exit 1
 fi
 
+# Set WORKTOOLS_WORKERS to make the ecFlow files with that many
+# processes, or 0 for one per CPU.  The default is one process.
 $python36 -c "
 import worktools ;
 worktools.add_cycles_to_running_ecflow_workflow_at(
   '$EXPDIR',
   '$FIRST_CYCLE',
-  '$LAST_CYCLE'
+  '$LAST_CYCLE',
+  workers=${WORKTOOLS_WORKERS:-1}
 )"
@@ -29,8 +29,11 @@ if os.environ.get('WORKTOOLS_VERBOSE','NO') == 'YES':
 logging.basicConfig(stream=sys.stderr,level=level)
 
 import crow.tools, crow.config
-from crow.metascheduler import to_ecflow, to_rocoto
+from crow.metascheduler import to_ecflow, write_rocoto
+from crow.metascheduler.graph_store import graph_store_for
+from crow.metascheduler.ecf_writer import write_files
 from crow.config import from_dir, Suite, from_file, to_yaml
+from crow.config.tools import start_probe_log, stop_probe_log
 from crow.tools import Clock
 
 ECFNETS_INCLUDE = "/ecf/ecfnets/include"
@@ -151,13 +154,32 @@ def find_case_yaml_file_for(case_name):
 
 def read_yaml_suite(dir):
     logger.info(f'{dir}: read yaml files specified in _main.yaml')
-    conf=from_dir(dir)
-    assert(conf.suite._path)
-    for scope_name in conf.validate_me:
-        crow.config.validate(conf[scope_name])
+    log,old=start_probe_log()
+    try:
+        conf=from_dir(dir)
+        assert(conf.suite._path)
+        for scope_name in conf.validate_me:
+            crow.config.validate(conf[scope_name])
+    finally:
+        stop_probe_log(log,old)
     suite=Suite(conf.suite)
     assert(suite.viewed._path)
-    return conf,suite
+    store=None
+    if 'ecFlow' in suite:
+        store=ecflow_graph_store_for(dir,log)
+    return conf,suite,store
+
+def ecflow_graph_store_for(dir,probes):
+    """!Returns the store of analyzed cycles for ecFlow suites made from
+    the YAML files in dir, which were read while making the queries
+    in probes, so that adding cycles to a running workflow only
+    analyzes the cycles that earlier calls did not.  Returns None
+    unless $CROW_GRAPH_STORE_DIR names a directory for the store."""
+    if not os.environ.get('CROW_GRAPH_STORE_DIR',''): return None
+    with io.StringIO() as fd:
+        crow.config.follow_main(fd,dir)
+        text=fd.getvalue()
+    return graph_store_for(dir,text,probes)
 
 def make_config_files_in_expdir(doc,expdir):
     for key in doc.keys():
@@ -290,32 +312,30 @@ def make_clocks_for_cycle_range(suite,first_cycle,last_cycle,surrounding_cycles)
     suite.ecFlow.analyze_cycles=Clock(
         start=first_analyzed,end=last_analyzed,step=SIX_HOURS)
 
-def generate_ecflow_suite_in_memory(suite,first_cycle,last_cycle,surrounding_cycles):
+def generate_ecflow_suite_in_memory(suite,first_cycle,last_cycle,surrounding_cycles,
+                                    workers=1,store=None):
     logger.info(f'make suite for cycles: {first_cycle:%Ft%T} - {last_cycle:%Ft%T}')
     make_clocks_for_cycle_range(suite,first_cycle,last_cycle,surrounding_cycles)
-    suite_defs, ecf_files = to_ecflow(suite)
+    suite_defs, ecf_files = to_ecflow(suite,workers,store)
     return suite_defs, ecf_files
 
-def write_ecflow_suite_to_disk(targetdir, suite_defs, ecf_files):
+def write_ecflow_suite_to_disk(targetdir, suite_defs, ecf_files, workers=1):
     written_suite_defs=OrderedDict()
+    files=OrderedDict()
+    targetdir=os.path.realpath(targetdir)
     logger.info(f'{targetdir}: write suite here')
     for deffile in suite_defs.keys():
         defname = suite_defs[deffile]['name']
-        defcontents = suite_defs[deffile]['def']
         filename=os.path.realpath(os.path.join(targetdir,'defs',deffile))
-        make_parent_dir(filename)
         logger.info(f'{defname}: {filename}: write suite definition')
-        with open(os.path.join(targetdir,filename),'wt') as fd:
-            fd.write(defcontents)
+        files[os.path.relpath(filename,targetdir)]=suite_defs[deffile]['def']
         written_suite_defs[defname]=filename
         for setname in ecf_files:
             logger.info(f'{defname}: write ecf file set {setname}')
             for filename in ecf_files[setname]:
-                full_fn=os.path.realpath(os.path.join(targetdir,defname,filename)+'.ecf')
-                logger.debug(f'{defname}: {setname}: write ecf file {full_fn}')
-                make_parent_dir(full_fn)
-                with open(full_fn,'wt') as fd:
-                    fd.write(ecf_files[setname][filename])
+                files[os.path.join(defname,filename)+'.ecf'] = \
+                    ecf_files[setname][filename]
+    write_files(targetdir,files,workers)
     return written_suite_defs
 
 def get_target_dir_and_check_ecflow_env():
@@ -341,24 +361,26 @@ def get_target_dir_and_check_ecflow_env():
         
     return ECF_HOME
 
-def create_new_ecflow_workflow(suite,surrounding_cycles=2):
+def create_new_ecflow_workflow(suite,surrounding_cycles=2,workers=1,
+                               store=None):
     ECF_HOME=get_target_dir_and_check_ecflow_env()
     if not ECF_HOME: return None,None,None,None
     first_cycle=suite.Clock.start
     last_cycle=min(suite.Clock.end,first_cycle+suite.Clock.step*2)
     suite_defs, ecf_files = generate_ecflow_suite_in_memory(
-        suite,first_cycle,last_cycle,surrounding_cycles)
+        suite,first_cycle,last_cycle,surrounding_cycles,workers,store)
     suite_def_files = write_ecflow_suite_to_disk(
-        ECF_HOME,suite_defs,ecf_files)
+        ECF_HOME,suite_defs,ecf_files,workers)
     return ECF_HOME, suite_def_files, first_cycle, last_cycle
 
 def update_existing_ecflow_workflow(suite,first_cycle,last_cycle,
-                                    surrounding_cycles=2):
+                                    surrounding_cycles=2,workers=1,
+                                    store=None):
     ECF_HOME=get_target_dir_and_check_ecflow_env()
     suite_defs, ecf_files = generate_ecflow_suite_in_memory(
-        suite,first_cycle,last_cycle,surrounding_cycles)
+        suite,first_cycle,last_cycle,surrounding_cycles,workers,store)
     suite_def_files = write_ecflow_suite_to_disk(
-        ECF_HOME,suite_defs,ecf_files)
+        ECF_HOME,suite_defs,ecf_files,workers)
     return ECF_HOME, suite_def_files
 
 def load_ecflow_suites(ECF_HOME,suite_def_files):
@@ -382,19 +404,21 @@ def begin_ecflow_suites(ECF_HOME,suite_def_files):
 def make_rocoto_xml(suite,filename):
     with open(filename,'wt') as fd:
         logger.info(f'{filename}: create Rocoto XML document')
-        fd.write(to_rocoto(suite))
+        write_rocoto(suite,fd)
     print(f'{filename}: Rocoto XML document created here.')
     
 ########################################################################
 
 # These functions are called directly from scripts, and can be thought
-# of as "main programs."
+# of as "main programs."  Those that make ecflow suites take a number
+# of worker processes for making the suite definitions and ecf files
+# of the cycles; 0 or None means one per CPU.
 
 def remake_ecflow_files_for_cycles(
         yamldir,first_cycle_str,last_cycle_str,
-        surrounding_cycles=2):
+        surrounding_cycles=2,workers=1):
     ECF_HOME=get_target_dir_and_check_ecflow_env()
-    conf,suite=read_yaml_suite(yamldir)
+    conf,suite,store=read_yaml_suite(yamldir)
     loudly_make_dir_if_missing(f'{conf.places.ROTDIR}/logs')
 
     first_cycle=datetime.datetime.strptime(first_cycle_str,'%Y%m%d%H')
@@ -404,9 +428,9 @@ def remake_ecflow_files_for_cycles(
     last_cycle=max(first_cycle,min(suite.Clock.end,last_cycle))
 
     suite_defs, ecf_files = generate_ecflow_suite_in_memory(
-        suite,first_cycle,last_cycle,surrounding_cycles)
+        suite,first_cycle,last_cycle,surrounding_cycles,workers,store)
     written_suite_defs = write_ecflow_suite_to_disk(
-        ECF_HOME, suite_defs, ecf_files)
+        ECF_HOME, suite_defs, ecf_files, workers)
     print(f'''Suite definition files and ecf files have been written to:
 
   {ECF_HOME}
@@ -417,11 +441,12 @@ If you want to update the suite (cycle) definitions, or add suites
 (cycles), you will need to call ecflow_client's --load, --begin,
 --replace, or --delete commands.''')
 
-def create_and_load_ecflow_workflow(yamldir,surrounding_cycles=2,begin=False):
-    conf,suite=read_yaml_suite(yamldir)
+def create_and_load_ecflow_workflow(yamldir,surrounding_cycles=2,begin=False,
+                                    workers=1):
+    conf,suite,store=read_yaml_suite(yamldir)
     loudly_make_dir_if_missing(f'{conf.places.ROTDIR}/logs')
     ECF_HOME, suite_def_files, first_cycle, last_cycle = \
-        create_new_ecflow_workflow(suite,surrounding_cycles)
+        create_new_ecflow_workflow(suite,surrounding_cycles,workers,store)
     if not ECF_HOME:
         logger.error('Could not create workflow files.  See prior errors for details.')
         return False
@@ -430,17 +455,18 @@ def create_and_load_ecflow_workflow(yamldir,surrounding_cycles=2,begin=False):
         begin_ecflow_suites(ECF_HOME,suite_def_files)
         
 def add_cycles_to_running_ecflow_workflow_at(
-        yamldir,first_cycle_str,last_cycle_str,surrounding_cycles=2): 
-    conf,suite=read_yaml_suite(yamldir)
+        yamldir,first_cycle_str,last_cycle_str,surrounding_cycles=2,
+        workers=1): 
+    conf,suite,store=read_yaml_suite(yamldir)
     first_cycle=datetime.datetime.strptime(first_cycle_str,'%Y%m%d%H')
     last_cycle=datetime.datetime.strptime(last_cycle_str,'%Y%m%d%H')
     ECF_HOME, suite_def_files = update_existing_ecflow_workflow(
-        suite,first_cycle,last_cycle,surrounding_cycles)
+        suite,first_cycle,last_cycle,surrounding_cycles,workers,store)
     load_ecflow_suites(ECF_HOME,suite_def_files)    
     begin_ecflow_suites(ECF_HOME,suite_def_files)    
 
 def make_rocoto_xml_for(yamldir):
-    conf,suite=read_yaml_suite(yamldir)
+    conf,suite,store=read_yaml_suite(yamldir)
     assert(suite.viewed._path)
     loudly_make_dir_if_missing(f'{conf.places.ROTDIR}/logs')
     make_rocoto_xml(suite,f'{yamldir}/workflow.xml')
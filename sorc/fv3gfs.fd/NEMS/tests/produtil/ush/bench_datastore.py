@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+
+"""!Measures the throughput of produtil.datastore with many threads.
+
+Each of N threads updates its share of M products: it sets the
+location and availability, sets a metadata key, and rereads the
+product from the database.  The same work is done with the locking
+Datastore and with the WALDatastore, in a new database file each
+time:
+
+    bench_datastore.py --threads 32 --products 2000 --dir /tmp"""
+
+import argparse, os, shutil, sys, tempfile, threading, time
+import produtil.datastore
+from produtil.datastore import Datastore, WALDatastore, Product
+
+def get_args():
+    parser=argparse.ArgumentParser(description='Time produtil.datastore '
+                                   'updates from many threads.')
+    parser.add_argument('--threads',type=int,default=16,
+                        help='number of threads')
+    parser.add_argument('--products',type=int,default=1000,
+                        help='number of products')
+    parser.add_argument('--dir',default=None,
+                        help='directory for the database files; should be '
+                        'on a local disk')
+    return parser.parse_args()
+
+def update_products(ds,names,errors):
+    try:
+        for name in names:
+            prod=Product(ds,name,'bench')
+            prod.set_loc_avail('/com/%s.grb2'%(name,),1)
+            prod['fhr']=name[-3:]
+            prod.update()
+            assert(prod.location=='/com/%s.grb2'%(name,))
+            assert(prod['fhr']==name[-3:])
+    except Exception as e:
+        errors.append(e)
+
+def run(cls,filename,nthreads,nproducts):
+    ds=cls(filename)
+    names=[ 'prod%06d'%(i,) for i in range(nproducts) ]
+    errors=list()
+    threads=[ threading.Thread(target=update_products,
+                               args=(ds,names[i::nthreads],errors))
+              for i in range(nthreads) ]
+    start=time.time()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    seconds=time.time()-start
+    if errors:
+        sys.exit('%s: %s'%(cls.__name__,str(errors[0])))
+    with ds.transaction() as t:
+        count=t.query('SELECT COUNT(*) FROM products WHERE available=1')[0][0]
+    assert(count==nproducts)
+    commits=getattr(ds,'commits',None)
+    print('%-13s %8.3fs %9.1f products/s%s'%(
+        cls.__name__,seconds,nproducts/seconds,
+        '' if commits is None else '  %d commits'%(commits,)))
+
+def main():
+    args=get_args()
+    tempdir=tempfile.mkdtemp(prefix='bench_datastore.',dir=args.dir)
+    try:
+        print('%d threads, %d products'%(args.threads,args.products))
+        for cls in [ Datastore, WALDatastore ]:
+            filename=os.path.join(tempdir,cls.__name__+'.db')
+            run(cls,filename,args.threads,args.products)
+    finally:
+        shutil.rmtree(tempdir)
+
+if __name__ == '__main__':
+    main()
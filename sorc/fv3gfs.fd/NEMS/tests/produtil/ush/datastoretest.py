@@ -0,0 +1,129 @@
+#! /usr/bin/env python
+
+"""!Self-test for the group commits of produtil.datastore.WALDatastore.
+
+Checks that the mutations of many threads are committed together in
+fewer sqlite3 transactions than there are WALTransactions, and that
+a mutation that fails in one thread's savepoint does not roll back
+the other transactions committed in the same group.  Also checks
+that a query commits the mutations queued before it in the same
+transaction:
+
+    datastoretest.py [-v]"""
+
+import os, shutil, sqlite3, tempfile, threading, time, unittest
+from produtil.datastore import WALDatastore, Product
+
+class TestWALDatastore(unittest.TestCase):
+    def setUp(self):
+        self.tempdir=tempfile.mkdtemp(prefix='datastoretest.')
+        self.ds=WALDatastore(os.path.join(self.tempdir,'test.db'))
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def available(self):
+        with self.ds.transaction() as t:
+            rows=t.query('SELECT id, location FROM products '
+                         'WHERE available=1')
+        return dict(rows)
+
+    def run_threads(self,target,count):
+        """!Runs target(i) in count threads, all started before any
+        of them can commit, and returns the exceptions they raised."""
+        errors=dict()
+        def run(i):
+            try:
+                target(i)
+            except Exception as e:
+                errors[i]=e
+        threads=[ threading.Thread(target=run,args=(i,))
+                  for i in range(count) ]
+        # Hold the commit so that every thread queues its mutations
+        # before the first group commit starts.
+        with self.ds._queue_cond:
+            self.ds._committing=True
+        for thread in threads: thread.start()
+        for i in range(600):
+            with self.ds._queue_cond:
+                if len(self.ds._queue)==count: break
+            time.sleep(0.01)
+        with self.ds._queue_cond:
+            self.assertEqual(len(self.ds._queue),count)
+            self.ds._committing=False
+            self.ds._queue_cond.notify_all()
+        for thread in threads: thread.join()
+        return errors
+
+    def test_group_commit(self):
+        def update(i):
+            with self.ds.transaction() as t:
+                t.mutate('INSERT INTO products VALUES (?,1,?,"Product")',
+                         ('prod%03d'%(i,),'/com/prod%03d'%(i,)))
+                t.mutate('INSERT INTO metadata VALUES (?,"fhr",?)',
+                         ('prod%03d'%(i,),i))
+        commits=self.ds.commits
+        errors=self.run_threads(update,20)
+        self.assertEqual(errors,{})
+        self.assertEqual(self.ds.commits-commits,1)
+        expect=dict( ('prod%03d'%(i,),'/com/prod%03d'%(i,))
+                     for i in range(20) )
+        self.assertEqual(self.available(),expect)
+
+    def test_failed_savepoint(self):
+        def update(i):
+            with self.ds.transaction() as t:
+                t.mutate('INSERT INTO products VALUES (?,1,?,"Product")',
+                         ('prod%d'%(i,),'/com/prod%d'%(i,)))
+                if i==2:
+                    t.mutate('INSERT INTO nosuchtable VALUES (1)')
+        commits=self.ds.commits
+        errors=self.run_threads(update,5)
+        self.assertEqual(self.ds.commits-commits,1)
+        self.assertEqual(list(errors.keys()),[2])
+        self.assertTrue(isinstance(errors[2],sqlite3.OperationalError))
+        self.assertEqual(self.available(),dict(
+                ('prod%d'%(i,),'/com/prod%d'%(i,)) for i in [0,1,3,4] ))
+
+    def test_query_commits_earlier_mutations(self):
+        # A WALTransaction is not atomic: its query commits what was
+        # queued before it, and a later failure does not undo that.
+        with self.assertRaises(sqlite3.OperationalError):
+            with self.ds.transaction() as t:
+                t.mutate('INSERT INTO products VALUES ("before",1,"/com/before","Product")')
+                t.query('SELECT COUNT(*) FROM products')
+                t.mutate('INSERT INTO products VALUES ("after",1,"/com/after","Product")')
+                t.mutate('INSERT INTO nosuchtable VALUES (1)')
+        self.assertEqual(self.available(),{'before':'/com/before'})
+
+    def test_many_threads(self):
+        def update(i):
+            for j in range(20):
+                prod=Product(self.ds,'prod%02d.%02d'%(i,j),'test')
+                prod.set_loc_avail('/com/%02d.%02d'%(i,j),1)
+                prod['fhr']=j
+                prod.update()
+                self.assertEqual(prod.location,'/com/%02d.%02d'%(i,j))
+        tickets=[0]
+        commit_batch=self.ds._commit_batch
+        def count_tickets(batch):
+            tickets[0]+=len(batch)
+            commit_batch(batch)
+        self.ds._commit_batch=count_tickets
+        commits=self.ds.commits
+        errors=dict()
+        def run(i):
+            try:
+                update(i)
+            except Exception as e:
+                errors[i]=e
+        threads=[ threading.Thread(target=run,args=(i,)) for i in range(16) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(errors,{})
+        self.assertEqual(len(self.available()),16*20)
+        self.assertTrue(self.ds.commits-commits<tickets[0],
+                        '%d commits for %d transactions'%(
+                            self.ds.commits-commits,tickets[0]))
+
+if __name__ == '__main__':
+    unittest.main()
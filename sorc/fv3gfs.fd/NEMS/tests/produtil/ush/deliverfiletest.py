@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+
+"""!Self-test for produtil.fileop.deliver_file.
+
+Checks that a copy is done in the kernel when the C library can, that
+it falls back to copying through Python when the kernel copy functions
+are missing or refuse the files, that a kernel copy failing part way
+through removes the temporary file, and that verify=True copies
+through Python and detects a copy that differs from the origin:
+
+    deliverfiletest.py [-v]"""
+
+import ctypes, errno, os, shutil, tempfile, unittest
+import produtil.fileop
+from produtil.fileop import deliver_file, VerificationFailed
+
+class TestDeliverFile(unittest.TestCase):
+    def setUp(self):
+        self.tempdir=tempfile.mkdtemp(prefix='deliverfiletest.')
+        self.infile=os.path.join(self.tempdir,'infile')
+        self.outfile=os.path.join(self.tempdir,'outfile')
+        self.data=''.join([ '%09d\n'%(i,) for i in xrange(300000) ])
+        with open(self.infile,'wb') as f:
+            f.write(self.data)
+        self.kernel_copiers=produtil.fileop._kernel_copiers
+        self.copy_data=produtil.fileop._copy_data
+        self.calls=list()
+    def tearDown(self):
+        produtil.fileop._kernel_copiers=self.kernel_copiers
+        produtil.fileop._copy_data=self.copy_data
+        shutil.rmtree(self.tempdir)
+
+    def deliver(self,**kwargs):
+        deliver_file(self.infile,self.outfile,blocksize=65536,**kwargs)
+        with open(self.outfile,'rb') as f:
+            self.assertEqual(f.read(),self.data)
+
+    def count_calls(self,name,copier):
+        """!Returns a copier that records its name in self.calls, and
+        then calls copier."""
+        def counted(infd,outfd,count):
+            self.calls.append(name)
+            return copier(infd,outfd,count)
+        return counted
+
+    def failing(self,err):
+        """!Returns a copier that fails with errno err."""
+        def fail(infd,outfd,count):
+            ctypes.set_errno(err)
+            return -1
+        return fail
+
+    def leftovers(self):
+        return [ name for name in os.listdir(self.tempdir)
+                 if name not in ('infile','outfile') ]
+
+    def test_kernel_copy(self):
+        copiers=produtil.fileop._load_kernel_copiers()
+        if not copiers:
+            self.skipTest('no kernel copy functions in %s'
+                          %(produtil.fileop.c_library,))
+        copied=list()
+        def copied_by(copier):
+            def copy(infd,outfd,count):
+                result=copier(infd,outfd,count)
+                if result>0: copied.append(result)
+                return result
+            return copy
+        produtil.fileop._kernel_copiers=[
+            (name,copied_by(copier)) for (name,copier) in copiers ]
+        self.deliver()
+        self.assertEqual(sum(copied),len(self.data))
+
+    def test_fallback(self):
+        produtil.fileop._kernel_copiers=[
+            ('missing',self.count_calls('missing',
+                                        self.failing(errno.ENOSYS))),
+            ('refuses',self.count_calls('refuses',
+                                        self.failing(errno.EXDEV))) ]
+        self.deliver()
+        self.assertEqual(self.calls,['missing','refuses'])
+        # A missing function is not tried again, but one that refused
+        # these files is.
+        self.assertEqual([ name for (name,copier)
+                           in produtil.fileop._kernel_copiers ],
+                         ['refuses'])
+        self.deliver()
+        self.assertEqual(self.calls,['missing','refuses','refuses'])
+
+    def test_no_kernel_copy(self):
+        produtil.fileop._kernel_copiers=list()
+        self.deliver()
+
+    def test_failure_after_start(self):
+        state=dict(count=0)
+        def copy_then_fail(infd,outfd,count):
+            state['count']+=1
+            if state['count']>1:
+                ctypes.set_errno(errno.EIO)
+                return -1
+            data=os.read(infd,1000)
+            return os.write(outfd,data)
+        produtil.fileop._kernel_copiers=[('broken',copy_then_fail)]
+        self.assertRaises(OSError,self.deliver)
+        self.assertFalse(os.path.exists(self.outfile))
+        self.assertEqual(self.leftovers(),[])
+
+    def test_verify(self):
+        produtil.fileop._kernel_copiers=[
+            ('kernel',self.count_calls('kernel',self.failing(errno.ENOSYS))) ]
+        self.deliver(verify=True)
+        self.assertEqual(self.calls,[])
+
+    def test_verify_detects_changes(self):
+        copy_data=self.copy_data
+        def corrupting_copy(indata,outdata,blocksize,checksum=False):
+            result=copy_data(indata,outdata,blocksize,checksum)
+            if outdata is not None: outdata.write('x')
+            return result
+        produtil.fileop._copy_data=corrupting_copy
+        self.assertRaises(VerificationFailed,self.deliver,verify=True)
+        self.assertFalse(os.path.exists(self.outfile))
+        self.assertEqual(self.leftovers(),[])
+
+    def test_verify_copier(self):
+        def bad_copier(infile,tempname,temp):
+            temp.write('not the data')
+        self.assertRaises(VerificationFailed,self.deliver,verify=True,
+                          copier=bad_copier)
+        self.assertFalse(os.path.exists(self.outfile))
+
+if __name__ == '__main__':
+    unittest.main()
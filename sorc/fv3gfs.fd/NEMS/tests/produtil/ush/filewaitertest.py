@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+
+"""!Self-test for produtil.fileop.DirectoryWaiter and FileWaiter.
+
+Checks that a DirectoryWaiter only stats files that are in its
+directory listings, that it wakes up early when inotify reports a
+missing file, that it gives up after maxwait seconds, and that a
+fast arrival rate does not make it give up early.  Also checks that
+a FileWaiter with a zero sleeptime still sleeps between checks:
+
+    filewaitertest.py [-v]"""
+
+import logging, os, shutil, tempfile, threading, time, unittest
+import produtil.inotify
+from produtil.fileop import DirectoryWaiter, FileWaiter, MIN_SLEEPTIME
+
+class TestDirectoryWaiter(unittest.TestCase):
+    def setUp(self):
+        self.tempdir=tempfile.mkdtemp(prefix='filewaitertest.')
+        self.logger=logging.getLogger('filewaitertest')
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def path(self,*names):
+        return os.path.join(self.tempdir,*names)
+
+    def make_file(self,filename):
+        """!Moves a file with an old modification time to filename."""
+        temp=filename+'.temp'
+        with open(temp,'wt') as f:
+            f.write('x')
+        then=time.time()-60
+        os.utime(temp,(then,then))
+        os.rename(temp,filename)
+
+    def make_later(self,filenames,delay):
+        """!Runs make_file on each filename after delay seconds, in a
+        new thread."""
+        def make():
+            time.sleep(delay)
+            for filename in filenames:
+                self.make_file(filename)
+        thread=threading.Thread(target=make)
+        thread.start()
+        return thread
+
+    def test_scan(self):
+        os.makedirs(self.path('com'))
+        flist=[ self.path('com','f%02d'%(i,)) for i in range(10) ] + \
+              [ self.path('nothere','f%02d'%(i,)) for i in range(5) ]
+        for filename in flist[0:3]:
+            self.make_file(filename)
+        with open(flist[3],'wt') as f:
+            f.write('too young')
+        waiter=DirectoryWaiter(flist,min_size=1,min_mtime_age=30,
+                               min_fraction=0.2)
+        self.assertTrue(waiter.checkfiles(maxwait=10,sleeptime=1,
+                                          logger=self.logger))
+        self.assertEqual(waiter.dir_scans,2)
+        self.assertEqual(waiter.stats_issued,4)
+        self.assertEqual(waiter.wakeups,0)
+
+    def test_inotify_wakeup(self):
+        if not produtil.inotify.have_inotify():
+            self.skipTest('inotify is not available')
+        os.makedirs(self.path('com'))
+        flist=[ self.path('com','f%02d'%(i,)) for i in range(3) ]
+        waiter=DirectoryWaiter(flist,min_size=1,min_mtime_age=30,
+                               min_sleeptime=20,use_inotify=True)
+        start=time.time()
+        thread=self.make_later(flist,1.0)
+        try:
+            found=waiter.checkfiles(maxwait=30,sleeptime=20,
+                                    logger=self.logger)
+        finally:
+            thread.join()
+        seconds=time.time()-start
+        self.assertTrue(found)
+        self.assertTrue(seconds<3,'found after %g seconds'%(seconds,))
+        self.assertTrue(waiter.wakeups>=1)
+
+    def test_gives_up(self):
+        os.makedirs(self.path('com'))
+        waiter=DirectoryWaiter([self.path('com','never')],min_size=1,
+                               min_mtime_age=30)
+        start=time.time()
+        found=waiter.checkfiles(maxwait=2,sleeptime=20,logger=self.logger)
+        seconds=time.time()-start
+        self.assertFalse(found)
+        self.assertTrue(seconds<3,'gave up after %g seconds'%(seconds,))
+
+    def test_fast_arrivals(self):
+        # Sixty files arriving in one check interval, with no minimum
+        # sleep time, ask for a sleep shorter than a millisecond.  The
+        # waiter must keep waiting for the last file anyway.
+        os.makedirs(self.path('com'))
+        early=[ self.path('com','f%02d'%(i,)) for i in range(60) ]
+        last=self.path('com','last')
+        waiter=DirectoryWaiter(early+[last],min_size=1,min_mtime_age=30,
+                               min_sleeptime=0)
+        threads=[ self.make_later(early,0.02), self.make_later([last],1.0) ]
+        try:
+            found=waiter.checkfiles(maxwait=10,sleeptime=0.05,
+                                    logger=self.logger)
+        finally:
+            for thread in threads: thread.join()
+        self.assertTrue(found)
+
+class TestFileWaiter(unittest.TestCase):
+    def setUp(self):
+        self.tempdir=tempfile.mkdtemp(prefix='filewaitertest.')
+        self.logger=logging.getLogger('filewaitertest')
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_zero_sleeptime(self):
+        waiter=FileWaiter([os.path.join(self.tempdir,'never')],min_size=1)
+        start=time.time()
+        found=waiter.checkfiles(maxwait=2,sleeptime=0,logger=self.logger)
+        seconds=time.time()-start
+        self.assertFalse(found)
+        self.assertTrue(seconds<3,'gave up after %g seconds'%(seconds,))
+        self.assertTrue(waiter.wakeups<=2/MIN_SLEEPTIME,
+                        '%d wakeups'%(waiter.wakeups,))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+
+"""!Self-test for produtil.inotify and the inotify wakeups in
+produtil.datastore.wait_for_products.
+
+Checks that an Inotify reports files created in a watched directory,
+that wait_for_products wakes up as soon as a product's file arrives
+instead of at its next poll, and that it falls back to polling when
+inotify is unavailable:
+
+    inotifytest.py [-v]"""
+
+import logging, os, shutil, tempfile, threading, time, unittest
+import produtil.inotify
+from produtil.datastore import Datastore, UpstreamFile, wait_for_products
+
+class TestInotify(unittest.TestCase):
+    def setUp(self):
+        self.tempdir=tempfile.mkdtemp(prefix='inotifytest.')
+        self.logger=logging.getLogger('inotifytest')
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_read_events(self):
+        if not produtil.inotify.have_inotify():
+            self.skipTest('inotify is not available')
+        with produtil.inotify.Inotify() as ino:
+            ino.add_watch(self.tempdir)
+            self.assertEqual(ino.read_events(0.1),[])
+            with open(os.path.join(self.tempdir,'file'),'wt') as f:
+                f.write('x')
+            names=[ name for (path,mask,name) in ino.read_events(5) ]
+        self.assertTrue('file' in names,repr(names))
+
+    def deliver_later(self,filename,delay):
+        """!Moves a file with an old modification time to filename
+        after delay seconds, in a new thread."""
+        def deliver():
+            time.sleep(delay)
+            temp=os.path.join(self.tempdir,'temp')
+            with open(temp,'wt') as f:
+                f.write('x')
+            then=time.time()-60
+            os.utime(temp,(then,then))
+            os.rename(temp,filename)
+        thread=threading.Thread(target=deliver)
+        thread.start()
+        return thread
+
+    def wait_for_upstream(self,delay):
+        """!Waits for an UpstreamFile delivered after delay seconds.
+        Returns the number of seconds until it was found."""
+        os.makedirs(os.path.join(self.tempdir,'com'))
+        filename=os.path.join(self.tempdir,'com','input.grb2')
+        ds=Datastore(os.path.join(self.tempdir,'test.db'))
+        prod=UpstreamFile(ds,'input','test',location=filename,
+                          meta={'minage':0})
+        found=list()
+        start=time.time()
+        thread=self.deliver_later(filename,delay)
+        try:
+            count=wait_for_products(
+                [prod],self.logger,sleeptime=20,maxtime=30,
+                action=lambda p,name,logger: found.append(time.time()))
+        finally:
+            thread.join()
+        self.assertEqual(count,1)
+        return found[0]-start
+
+    def test_wakes_waiter(self):
+        # Polls are at 0, 1 and 3 seconds, so a file delivered at 1.5
+        # seconds is only found early if inotify woke the waiter.
+        if not produtil.inotify.have_inotify():
+            self.skipTest('inotify is not available')
+        seconds=self.wait_for_upstream(1.5)
+        self.assertTrue(seconds<2.5,'found after %g seconds'%(seconds,))
+
+    def test_polling_fallback(self):
+        libc, c_library = produtil.inotify.libc, produtil.inotify.c_library
+        produtil.inotify.libc=None
+        produtil.inotify.c_library='libinotifytest-nonexistent.so'
+        try:
+            self.assertFalse(produtil.inotify.have_inotify())
+            seconds=self.wait_for_upstream(1.5)
+        finally:
+            produtil.inotify.libc=libc
+            produtil.inotify.c_library=c_library
+        self.assertTrue(seconds>=2.9 and seconds<5,
+                        'found after %g seconds'%(seconds,))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+
+"""!Self-test for produtil.pipeline.manage.
+
+Sends large inputs and outputs through pipelines, which deadlock if
+manage does not interleave its reads and writes, and checks the exit
+statuses of programs that fail or are killed.  Every test is run
+twice: once watching the processes with pidfds, if the kernel
+supports them, and once with the os.wait4 polling fallback:
+
+    pipelinetest.py [-v]"""
+
+import threading, unittest
+import produtil.pipeline
+from produtil.pipeline import Pipeline
+from produtil.run import batchexe
+
+## Seconds to wait for a pipeline before deciding it is deadlocked
+TIMEOUT=120
+
+class TestManage(unittest.TestCase):
+    def finish(self,func,*args):
+        """!Returns func(*args), which runs in another thread, and
+        fails if it does not return within TIMEOUT seconds."""
+        result=list()
+        errors=list()
+        def run():
+            try:
+                result.append(func(*args))
+            except Exception as e:
+                errors.append(e)
+        thread=threading.Thread(target=run)
+        thread.daemon=True
+        thread.start()
+        thread.join(TIMEOUT)
+        self.assertFalse(thread.isAlive(),'pipeline deadlocked')
+        if errors: raise errors[0]
+        return result[0]
+
+    def capture(self,runner):
+        """!Runs the runner, and returns its exit status and output."""
+        def run():
+            p=Pipeline(runner,capture=True)
+            s=p.to_string()
+            return (p.poll(),s)
+        return self.finish(run)
+
+    def status(self,runner):
+        """!Runs the runner, and returns its exit status."""
+        def run():
+            p=Pipeline(runner)
+            p.communicate()
+            return p.poll()
+        return self.finish(run)
+
+    def test_large_stdin_stdout(self):
+        data=''.join([ '%09d\n'%(i,) for i in xrange(2000000) ])
+        self.assertEqual(self.capture(batchexe('cat') << data),(0,data))
+        self.assertEqual(self.capture(
+                (batchexe('cat') << data) | batchexe('cat')),(0,data))
+
+    def test_large_stdout(self):
+        (status,s)=self.capture(batchexe('head')['-c','30000000',
+                                                 '/dev/zero'])
+        self.assertEqual(status,0)
+        self.assertEqual(len(s),30000000)
+
+    def test_exit_status(self):
+        self.assertEqual(self.status(batchexe('true')),0)
+        self.assertEqual(self.status(batchexe('false')),1)
+        self.assertEqual(self.status(batchexe('sh')['-c','exit 3']),3)
+        self.assertEqual(self.status(batchexe('sh')['-c','kill -9 $$']),-9)
+        self.assertEqual(self.capture(batchexe('sh')['-c','echo x; exit 5']),
+                         (5,'x\n'))
+
+class TestManageNoPidfd(TestManage):
+    def setUp(self):
+        self.pidfd_libc=produtil.pipeline._pidfd_libc
+        produtil.pipeline._pidfd_libc=False
+    def tearDown(self):
+        produtil.pipeline._pidfd_libc=self.pidfd_libc
+
+if __name__ == '__main__':
+    unittest.main()
@@ -795,15 +795,20 @@ class ProdConfig(object):
         """!returns the Datastore
 
         Returns the produtil.datastore.Datastore object for this
-        ProdConfig."""
+        ProdConfig.  If datastore_wal is true in the [config] section,
+        it is a produtil.datastore.WALDatastore."""
         d=self._datastore
         if d is not None:
             return d
         with self:
             if self._datastore is None:
                 dsfile=self.getstr('config','datastore')
-                self._datastore=produtil.datastore.Datastore(dsfile,
-                    logger=self.log('datastore'))
+                if self.getbool('config','datastore_wal',False):
+                    self._datastore=produtil.datastore.WALDatastore(
+                        dsfile,logger=self.log('datastore'))
+                else:
+                    self._datastore=produtil.datastore.Datastore(dsfile,
+                        logger=self.log('datastore'))
             return self._datastore
 
     ##@var datastore
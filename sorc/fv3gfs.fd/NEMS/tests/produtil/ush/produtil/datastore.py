@@ -8,14 +8,15 @@ Datastore."""
 
 import sqlite3, threading, collections, re, contextlib, time, random,\
     traceback, datetime, logging, os, time
-import produtil.fileop, produtil.locking, produtil.sigsafety, produtil.log
+import produtil.fileop, produtil.locking, produtil.sigsafety, produtil.log, \
+    produtil.inotify
 
 ##@var __all__
 # Symbols exported by "from produtil.datastore import *"
 __all__=['DatumException','DatumLockHeld','InvalidID','InvalidOperation',
          'UnknownLocation','FAILED','UNSTARTED','RUNNING','PARTIAL',
-         'COMPLETED','Datastore','Transaction','Datum','CallbackExceptions',
-         'Product','Task']
+         'COMPLETED','Datastore','Transaction','WALDatastore',
+         'WALTransaction','Datum','CallbackExceptions','Product','Task']
 
 class FakeException(Exception):
     """!This is a fake exception used to get a stack trace.  It will
@@ -194,9 +195,13 @@ class Datastore(object):
             if tid in self._connections:
                 return self._connections[tid]
             else:
-                c=sqlite3.connect(self.filename)
+                c=self._connect()
                 self._connections[tid]=c
                 return c
+    def _connect(self):
+        """!Opens a new connection to the database file.  Called once
+        per thread by _connection()."""
+        return sqlite3.connect(self.filename)
     @contextlib.contextmanager
     def _mystack(self):
         """!Gets the transaction stack for the current thread."""
@@ -423,6 +428,231 @@ class Transaction(object):
 
 ########################################################################
 
+class _CommitTicket(object):
+    """!The mutations of one WALTransaction, waiting in the group
+    commit queue of a WALDatastore."""
+    def __init__(self,mutations):
+        """!_CommitTicket constructor.
+        @param mutations a list of (stmt,subvals) tuples"""
+        self.mutations=mutations
+        self.done=False
+        self.error=None
+    ##@var mutations
+    # The list of (stmt,subvals) tuples to execute
+
+    ##@var done
+    # True once the mutations were committed or rolled back
+
+    ##@var error
+    # The exception raised by the mutations, or None
+
+class WALDatastore(Datastore):
+    """!A Datastore that uses SQLite write-ahead logging instead of
+    file locks, and commits the mutations of many threads at once.
+
+    Reads are done by each thread's own connection, without any lock:
+    in WAL mode, readers see the last committed state and never block
+    writers.  Mutations are queued until the end of the outermost
+    transaction, or until its next query.  The thread that commits
+    queued mutations when no commit is in progress commits those of
+    all threads in one sqlite3 transaction.  Other threads wait for
+    their mutations to be committed, so a transaction still completes
+    with its changes on disk.
+
+    A WALTransaction is weaker than a locking Transaction: it is not
+    atomic.  A query first commits the mutations queued before it, so
+    a transaction that mutates, queries and mutates again is committed
+    in several parts, and other threads' changes can be committed
+    between them.  Each part is applied inside its own savepoint, so a
+    failed statement only rolls back the mutations queued since the
+    transaction's last query.  Earlier parts stay committed, and the
+    exception is raised in that transaction's thread.  Use the locking
+    Datastore where a read-modify-write must be atomic.
+
+    Concurrency between processes is handled by sqlite3 itself.  WAL
+    mode needs shared memory between all processes that use the file,
+    so the database must be on a local disk, not a shared filesystem.
+
+    To use this class from a ProdConfig, set datastore_wal=yes in the
+    [config] section."""
+    def __init__(self,filename,logger=None,timeout=300):
+        """!WALDatastore constructor
+
+        @param filename the filename passed to sqlite3.connect
+        @param logger a logging.Logger to use for logging messages
+        @param timeout seconds to wait for another process to
+          release its write lock on the database"""
+        self._timeout=timeout
+        self._queue=list()
+        self._committing=False
+        self._queue_cond=threading.Condition(threading.Lock())
+        self._pending=collections.defaultdict(list)
+        self.commits=0
+        super(WALDatastore,self).__init__(filename,logger=logger,
+                                          locking=False)
+    ##@var commits
+    # The number of sqlite3 transactions committed so far
+
+    def _connect(self):
+        """!Opens a new connection to the database file in WAL mode.
+        Transactions are managed by the WALDatastore, not the sqlite3
+        module."""
+        con=sqlite3.connect(self.filename,timeout=self._timeout,
+                            isolation_level=None)
+        con.execute('PRAGMA journal_mode=WAL')
+        con.execute('PRAGMA synchronous=NORMAL')
+        return con
+    def transaction(self):
+        """!Starts a transaction on the database in the current thread."""
+        return WALTransaction(self)
+    def _queue_mutation(self,stmt,subvals):
+        """!Queues a mutation for the current thread's transaction.
+        @param stmt the SQL statement
+        @param subvals the substitution values"""
+        tid=threading.current_thread().ident
+        with self._map_lock:
+            self._pending[tid].append((stmt,subvals))
+    def _flush(self):
+        """!Commits the current thread's queued mutations, along with
+        those of any other threads, and waits for the commit.  Raises
+        the exception from the first failed mutation, if any."""
+        tid=threading.current_thread().ident
+        with self._map_lock:
+            mutations=self._pending.pop(tid,None)
+        if not mutations: return
+        ticket=_CommitTicket(mutations)
+        with self._queue_cond:
+            self._queue.append(ticket)
+            while not ticket.done and self._committing:
+                self._queue_cond.wait(1.0)
+            if not ticket.done:
+                self._committing=True
+                batch=self._queue
+                self._queue=list()
+        if not ticket.done:
+            try:
+                self._commit_batch(batch)
+            finally:
+                with self._queue_cond:
+                    self._committing=False
+                    self._queue_cond.notify_all()
+        if ticket.error is not None:
+            raise ticket.error
+    def _commit_batch(self,batch):
+        """!Applies the mutations of a list of _CommitTicket objects in
+        one sqlite3 transaction, and marks them as done.
+        @param batch the list of _CommitTicket objects"""
+        con=self._connection()
+        try:
+            con.execute('BEGIN IMMEDIATE')
+            for ticket in batch:
+                con.execute('SAVEPOINT ticket')
+                try:
+                    for (stmt,subvals) in ticket.mutations:
+                        con.execute(stmt,subvals)
+                except Exception as e:
+                    ticket.error=e
+                    con.execute('ROLLBACK TO SAVEPOINT ticket')
+                con.execute('RELEASE SAVEPOINT ticket')
+            con.execute('COMMIT')
+            self.commits+=1
+        except Exception as e:
+            if self._logger is not None:
+                self._logger.warning('%s: group commit of %d transactions '
+                                     'failed: %s'%(self.filename,len(batch),str(e)))
+            try:
+                con.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            for ticket in batch:
+                if ticket.error is None: ticket.error=e
+        finally:
+            for ticket in batch:
+                ticket.done=True
+
+class WALTransaction(Transaction):
+    """!Transaction for a WALDatastore.
+
+    Queries are run immediately without locking.  Mutations are queued
+    and committed at the end of the outermost transaction in this
+    thread, or before the next query, so a transaction always reads
+    its own changes.  Committing before a query means that the
+    transaction as a whole is not atomic; see WALDatastore."""
+    def __enter__(self):
+        """!Starts the transaction.  No lock is acquired."""
+        with self.ds._mystack() as s:
+            s.append(self)
+        return self
+    def __exit__(self,etype,evalue,traceback):
+        """!Commits the queued mutations if this is the last
+        Transaction released for the current thread.
+        @param etype,evalue Exception type and value, if any.
+        @param traceback Exception traceback, if any."""
+        with self.ds._mystack() as s:
+            assert(s.pop() is self)
+            commit=not s
+        if commit:
+            self.ds._flush()
+    def query(self,stmt,subvals=()):
+        """!Commits queued mutations, and then performs an SQL query
+        returning the result of cursor.fetchall()
+        @param stmt the SQL query
+        @param subvals the substitution values"""
+        self.ds._flush()
+        cursor=self.ds._connection().execute(stmt,subvals)
+        return cursor.fetchall()
+    def mutate(self,stmt,subvals=()):
+        """!Queues an SQL database modification.  Returns None, since
+        the row ID is not known until the modification is committed.
+        @param stmt the SQL query
+        @param subvals the substitution values"""
+        self.ds._queue_mutation(stmt,subvals)
+    def init_datum(self,d,meta=True):
+        """!Add a Datum to the database if it is not there already.
+
+        Same as Transaction.init_datum, but sets an empty location
+        with one conditional UPDATE, so only the final refresh_meta
+        reads the database.
+        @param d the Datum
+        @param meta If True, also initialize metadata."""
+        prodtype=type(d).__name__
+        av = d._meta['available'] if ('available' in d._meta) else 0
+        loc = d._meta['location'] if ('location' in d._meta) else ''
+        self.mutate('INSERT OR IGNORE INTO products VALUES (?,?,?,?)',(d.did,av,loc,prodtype))
+        if loc is not None and loc!='':
+            self.mutate('UPDATE products SET location=? WHERE id=? AND '
+                        '(location IS NULL OR location="")',(loc,d.did))
+        if meta and d._meta is not None and d._meta: 
+            for k,v in d._meta.iteritems():
+                if k!='location' and k!='available':
+                    self.mutate('INSERT OR IGNORE INTO metadata VALUES (?,?,?)',(d.did,k,v))
+        if meta:
+            self.refresh_meta(d,or_add=False)
+    def refresh_meta(self,d,or_add=True):
+        """!Replace Datum metadata with database values, add new metadata to database.
+
+        Same as Transaction.refresh_meta, but reads the product and
+        its metadata with one query.
+        @param d The Datum.
+        @param or_add If True, then any metadata that does not exist in the 
+          database is created from values in d."""
+        rows=self.query('SELECT products.available, products.location, '
+                        'metadata.key, metadata.value FROM products '
+                        'LEFT JOIN metadata ON metadata.id=products.id '
+                        'WHERE products.id = ?',(d.did,))
+        if not rows:
+            super(WALTransaction,self).refresh_meta(d,or_add)
+            return
+        meta=dict()
+        meta['available']=rows[0][0]
+        meta['location']=rows[0][1]
+        for (av,loc,k,v) in rows:
+            if k is not None:
+                meta[k]=v
+        d._meta=meta
+
+########################################################################
+
 class Datum(object):
     """!Superclass of anything that can be stored in a Datastore.
 
@@ -974,15 +1204,140 @@ class UpstreamFile(Product):
 
 ########################################################################
 
+class _ProductWatcher(object):
+    """!Watches the directories of FileProduct and UpstreamFile
+    locations with inotify, for wait_for_products."""
+    def __init__(self,logger):
+        """!_ProductWatcher constructor.  Raises
+        produtil.inotify.InotifyError if inotify is unavailable.
+        @param logger a logging.Logger for log messages"""
+        self._inotify=produtil.inotify.Inotify()
+        self._logger=logger
+        self._bydir=collections.defaultdict(dict)
+        self._unwatched=list()
+    def close(self):
+        """!Stops watching all directories."""
+        self._inotify.close()
+    def watch(self,p,loc):
+        """!Starts watching the directory of a product's location.  If
+        the location is unknown, or the directory does not exist, the
+        product is retried by a later call to retry().
+        @param p the Product
+        @param loc the product's location, or None if it is not
+          known yet"""
+        if not isinstance(p,FileProduct) and not isinstance(p,UpstreamFile):
+            return
+        if not loc:
+            self._unwatched.append(p)
+            return
+        (dirname,basename)=os.path.split(os.path.abspath(loc))
+        try:
+            self._inotify.add_watch(dirname)
+        except produtil.inotify.InotifyError as e:
+            self._logger.debug('%s: cannot watch: %s'%(dirname,str(e)))
+            self._unwatched.append(p)
+            return
+        self._bydir[dirname].setdefault(basename,list()).append(p)
+    def unwatch(self,p):
+        """!Stops waking up for a product.
+        @param p the Product"""
+        for names in self._bydir.itervalues():
+            for plist in names.itervalues():
+                if p in plist: plist.remove(p)
+        if p in self._unwatched: self._unwatched.remove(p)
+    def retry(self,locations):
+        """!Tries again to watch products whose directories could not
+        be watched earlier.  Only products with a location in the
+        locations dict are retried, so that no product location is
+        read from the database here.
+        @param locations a dict mapping from Product to location, as
+          filled in by _check_products"""
+        plist=[ p for p in self._unwatched if p in locations ]
+        if not plist: return
+        self._unwatched=[ p for p in self._unwatched if p not in locations ]
+        for p in plist: self.watch(p,locations[p])
+    def wait(self,timeout):
+        """!Waits up to timeout seconds for a watched file to change.
+        Returns the set of products whose files changed.
+        @param timeout the maximum number of seconds to wait"""
+        woken=set()
+        for (path,mask,name) in self._inotify.read_events(timeout):
+            if mask&produtil.inotify.IN_Q_OVERFLOW:
+                for names in self._bydir.itervalues():
+                    for plist in names.itervalues():
+                        woken.update(plist)
+            elif path in self._bydir:
+                woken.update(self._bydir[path].get(name,()))
+        return woken
+
+def _only_checks_datastore(p):
+    """!Returns True if the product's check() only rereads the
+    datastore, as Product.check does.
+    @param p the Product"""
+    check=type(p).check
+    return getattr(check,'__func__',check) is \
+        getattr(Product.check,'__func__',Product.check)
+
+def _check_products(plist,logger,locations=None):
+    """!Checks the availability of several products.
+
+    Reads the availability and location of all products from each
+    Datastore with one query.  Products that are not available in the Datastore, and
+    whose check() does more than reread the Datastore, are then
+    checked one at a time.  Returns the set of available products.
+    @param plist a list of Product objects
+    @param logger a logging.Logger for log messages
+    @param locations if not None, a dict that receives the location
+      read from the Datastore for each product"""
+    bydstore=collections.defaultdict(list)
+    for p in plist:
+        bydstore[p.dstore].append(p)
+    avail=set()
+    for (dstore,prods) in bydstore.iteritems():
+        bydid=collections.defaultdict(list)
+        for p in prods:
+            bydid[p.did].append(p)
+        dids=list(bydid.iterkeys())
+        with dstore.transaction() as t:
+            for i in xrange(0,len(dids),500):
+                chunk=dids[i:i+500]
+                for (did,av,loc) in t.query(
+                        'SELECT id, available, location FROM products '
+                        'WHERE id IN (%s)'%(','.join('?'*len(chunk)),),chunk):
+                    if av and int(av):
+                        avail.update(bydid[did])
+                    if locations is not None:
+                        for p in bydid[did]: locations[p]=loc
+    for p in plist:
+        if p in avail:
+            p.update()
+        elif not _only_checks_datastore(p):
+            p.check()
+            if p.available: avail.add(p)
+        if p not in avail:
+            logger.debug('Product %s not available (location=%s).'
+                         %(repr(p.did),repr(p.location)))
+    return avail
+
 def wait_for_products(plist,logger,renamer=None,action=None,
                       renamer_args=None,action_args=None,sleeptime=20,
-                      maxtime=1800):
+                      maxtime=1800,use_inotify=True):
     """!Waits for products to be available and performs an action on them.
 
     Waits for a specified list of products to be available, and
     performs some action on each product when it becomes available.
-    Sleeps sleeptime seconds between checks.  Returns the number of
-    products that were found before the maxtime was reached.
+    Returns the number of products that were found before the maxtime
+    was reached.
+
+    Each product is checked on its own schedule.  The first recheck
+    is one second after the first check, and the interval doubles
+    after each check that does not find the product, up to sleeptime.
+    The availability of all products due for a check is read from the
+    Datastore with one query.  If inotify is available, the
+    directories of FileProduct and UpstreamFile locations are watched,
+    and a product is rechecked as soon as its file changes.  Polling
+    continues regardless, since inotify cannot see files written by
+    other hosts to a shared filesystem.
 
     @param plist A Product or a list of Product objects.
     @param logger A logging.Logger object in which to log messages.
@@ -995,12 +1350,13 @@ def wait_for_products(plist,logger,renamer=None,action=None,
        and the contents of *action_args.  Default: perform no action.
     @param renamer_args Optional: arguments to renamer.
     @param action_args Optional: arguments to action.
-    @param sleeptime - after checking availability of all products, if
-       at least one is unavailable, the code will sleep for this much
-       time before rechecking.  Will be overridden by 0.01 if it is
-       set to something lower than that.  Default: 20
+    @param sleeptime - the maximum time between two checks of one
+       product.  Will be overridden by 0.01 if it is set to something
+       lower than that.  Default: 20
     @param maxtime - maximum amount of time to spend in this routine
        before giving up.
+    @param use_inotify - if True, and inotify is available, wake up
+       when the files of FileProduct and UpstreamFile objects change.
     @returns the number of products that became available before the
        maximum wait time was hit.    """
     if renamer is None:
@@ -1010,7 +1366,7 @@ def wait_for_products(plist,logger,renamer=None,action=None,
     if not ( isinstance(plist,tuple) or isinstance(plist,list) ):
         raise TypeError('In wait_for_products, plist must be a '
                         'list or tuple, not a '+type(plist).__name__)
-    now=int(time.time())
+    now=time.time()
     start=now
     seen=set()
     for p in plist:
@@ -1019,30 +1375,60 @@ def wait_for_products(plist,logger,renamer=None,action=None,
                             'contain Product objects.')
     if renamer_args is None: renamer_args=list()
     if action_args is None: action_args=list()
+    sleeptime=max(0.01,sleeptime)
+    firstsleep=min(1.0,sleeptime)
+    pending=list(plist)
+    interval=dict([ (id(p),firstsleep) for p in pending ])
+    nextcheck=dict([ (id(p),start) for p in pending ])
+    watcher=None
+    if use_inotify:
+        try:
+            watcher=_ProductWatcher(logger)
+            for p in pending: watcher.watch(p,None)
+        except produtil.inotify.InotifyError as e:
+            logger.debug('Not using inotify: %s'%(str(e),))
+            watcher=None
     logger.info('Waiting for %d products.'%(int(len(plist)),))
-    while len(seen)<len(plist) and now<start+maxtime:
-        now=int(time.time())
-        for p in plist:
-            if p in seen: continue
-            if not p.available: p.check()
-            if p.available:
-                logger.info('Product %s is available at location %s'
-                            %(repr(p.did),repr(p.location)))
-                seen.add(p)
-                if action is not None:
-                    name=renamer(p,logger,*renamer_args)
-                    action(p,name,logger,*action_args)
+    try:
+        while pending and now<start+maxtime:
+            due=[ p for p in pending if nextcheck[id(p)]<=now ]
+            if due:
+                locations=dict() if watcher is not None else None
+                avail=_check_products(due,logger,locations)
+                now=time.time()
+                for p in due:
+                    if p in avail:
+                        logger.info('Product %s is available at location %s'
+                                    %(repr(p.did),repr(p.location)))
+                        seen.add(p)
+                        pending.remove(p)
+                        if watcher is not None: watcher.unwatch(p)
+                        if action is not None:
+                            name=renamer(p,logger,*renamer_args)
+                            action(p,name,logger,*action_args)
+                    else:
+                        nextcheck[id(p)]=now+interval[id(p)]
+                        interval[id(p)]=min(sleeptime,2*interval[id(p)])
+                if watcher is not None: watcher.retry(locations)
+                now=time.time()
+            if not pending or now>=start+maxtime: break
+            wake=min([ nextcheck[id(p)] for p in pending ])
+            sleepnow=max(0.01,min(wake-now,start+maxtime-now-1))
+            if due:
+                logfun=logger.info if (sleepnow>=5) else logger.debug
+                logfun('Waiting for %d of %d products.  Next check in %g '
+                       'seconds.'%(len(pending),len(plist),float(sleepnow)))
+            if watcher is None:
+                time.sleep(sleepnow)
             else:
-                logger.info(
-                    'Product %s not available (available=%s location=%s).'
-                    %(repr(p.did),repr(p.available),repr(p.location)))
-        now=int(time.time())
-        if now<start+maxtime and len(seen)<len(plist):
-            sleepnow=max(0.01,min(sleeptime,start+maxtime-now-1))
-            logfun=logger.info if (sleepnow>=5) else logger.debug
-            logfun('Sleeping %g seconds...'%(float(sleepnow),))
-            time.sleep(sleepnow)
-            logfun('Done sleeping.')
+                for p in watcher.wait(sleepnow):
+                    if p in pending:
+                        logger.debug('Product %s file changed.'%(repr(p.did),))
+                        nextcheck[id(p)]=0
+                        interval[id(p)]=firstsleep
+            now=time.time()
+    finally:
+        if watcher is not None: watcher.close()
     logger.info('Done waiting for products: found %d of %d products.'
                 %(int(len(seen)),int(len(plist))))
     return len(seen)
@@ -11,14 +11,16 @@ __all__=['FileOpError','FileOpErrors','CannotLinkMulti',
          'FindExeInvalidExeName','CannotFindExe','RelativePathError',
          'DeliveryFailed','VerificationFailed','realcwd','chdir',
          'makedirs','remove_file','rmall','lstat_stat','isnonempty',
-         'check_file','deliver_file','make_symlinks_in','find_exe',
+         'check_file','deliver_file','deliver_files','make_symlinks_in',
+         'find_exe',
          'make_symlink','replace_symlink','unblock','fortcopy',
          'norm_expand_path','norm_abs_path','check_last_lines',
-         'wait_for_files','FileWaiter','call_fcntrl','gribver',
-         'netcdfver','touch']
+         'wait_for_files','FileWaiter','DirectoryWaiter','call_fcntrl',
+         'gribver','netcdfver','touch']
 
 import os,tempfile,filecmp,stat,shutil,errno,random,time,fcntl,math,logging
-import produtil.cluster, produtil.pipeline
+import ctypes,zlib
+import produtil.cluster, produtil.pipeline, produtil.inotify
 
 module_logger=logging.getLogger('produtil.fileop')
 
@@ -341,6 +343,110 @@ def isnonempty(filename):
     return ret
 
 ########################################################################    
+##@var c_library
+# The C library name for input to ctypes.CDLL, used to find the
+# copy_file_range and sendfile functions.  This is intended to be
+# modified externally from this module if needed before using the
+# produtil.fileop module.
+c_library='libc.so.6'
+
+##@var _kernel_copiers
+# List of (name,function) for the available kernel copy functions, or
+# None if the C library has not been searched for them yet.
+_kernel_copiers=None
+
+##@var _KERNEL_COPY_CHUNK
+# Maximum number of bytes to request from one kernel copy call.
+_KERNEL_COPY_CHUNK=1<<30
+
+def _load_kernel_copiers():
+    """!Finds the copy_file_range and sendfile functions in the C
+    library.  Returns a list of (name,function) pairs, where each
+    function is called as function(infd,outfd,count) and returns the
+    number of bytes copied, or -1 on error."""
+    global _kernel_copiers
+    if _kernel_copiers is not None: return _kernel_copiers
+    copiers=list()
+    try:
+        libc=ctypes.CDLL(c_library,use_errno=True)
+    except EnvironmentError as e:
+        module_logger.debug('Cannot load %s: %s'%(c_library,str(e)))
+        libc=None
+    if libc is not None and hasattr(libc,'copy_file_range'):
+        cfr=libc.copy_file_range
+        cfr.argtypes=[ ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                       ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint ]
+        cfr.restype=ctypes.c_ssize_t
+        copiers.append(('copy_file_range',
+                        lambda infd,outfd,count: cfr(infd,None,outfd,None,count,0)))
+    if libc is not None and hasattr(libc,'sendfile'):
+        sf=libc.sendfile
+        sf.argtypes=[ ctypes.c_int, ctypes.c_int, ctypes.c_void_p,
+                      ctypes.c_size_t ]
+        sf.restype=ctypes.c_ssize_t
+        copiers.append(('sendfile',
+                        lambda infd,outfd,count: sf(outfd,infd,None,count)))
+    _kernel_copiers=copiers
+    return copiers
+
+def _kernel_copy(infd,outfd):
+    """!Copies the rest of the file open on infd to outfd, starting at
+    the current offsets of both, without passing the data through
+    Python.  Returns True on success.  Returns False if no kernel copy
+    function could copy the first byte, in which case nothing was
+    copied.  Raises EnvironmentError if the copy fails after that.
+    @param infd the file descriptor to read
+    @param outfd the file descriptor to write"""
+    global _kernel_copiers
+    for (name,copier) in _load_kernel_copiers():
+        copied=0
+        while True:
+            count=copier(infd,outfd,_KERNEL_COPY_CHUNK)
+            if count>0:
+                copied+=count
+                continue
+            elif count==0:
+                return True
+            err=ctypes.get_errno()
+            if err==errno.EINTR:
+                continue
+            elif copied==0 and err in (errno.ENOSYS,errno.EXDEV,
+                    errno.EINVAL,errno.EOPNOTSUPP,errno.EBADF):
+                if err==errno.ENOSYS:
+                    _kernel_copiers=[ (n,c) for (n,c) in _kernel_copiers
+                                      if n!=name ]
+                break # try the next copier
+            else:
+                raise OSError(err,'%s: %s'%(name,os.strerror(err)))
+    return False
+
+def _copy_data(indata,outdata,blocksize,checksum=False):
+    """!Copies the rest of one open file to another.
+
+    If checksum is False, tries to copy in the kernel first, and
+    returns None.  Otherwise, copies blocksize bytes at a time through
+    Python, and returns a tuple (crc,size) of the CRC-32 and length of
+    the data.
+    @param indata the file object to read
+    @param outdata the file object to write, or None to only compute
+      the checksum
+    @param blocksize the number of bytes to read at a time
+    @param checksum if True, compute the checksum"""
+    if not checksum and outdata is not None:
+        outdata.flush()
+        if _kernel_copy(indata.fileno(),outdata.fileno()):
+            return None
+    crc=0
+    size=0
+    while True:
+        data=indata.read(blocksize)
+        if not data: break
+        if checksum:
+            crc=zlib.crc32(data,crc)
+            size+=len(data)
+        if outdata is not None: outdata.write(data)
+    return (crc,size) if checksum else None
+
 def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
                  tempprefix=None,permmask=002,removefailed=True,
                  logger=None,preserve_perms=True,preserve_times=True,
@@ -353,9 +459,14 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
     moveok=True, and the source and destination are on the same
     filesystem then the delivery is done with a simple move.
     Otherwise a copy is done to a temporary file on the same
-    filesystem as the target.  If verification is requested
-    (verify=True) then the temporary file is verified by filecmp.cmp,
-    before moving the temporary file to the final location.
+    filesystem as the target.  The copy is done in the kernel, with
+    copy_file_range or sendfile, when the C library and filesystems
+    support it.  If verification is requested (verify=True) then the
+    data is copied through Python instead, and its CRC-32 checksum is
+    computed while copying.  The temporary file is reread and its
+    checksum compared to that one before moving the temporary file to
+    the final location, so the origin is only read once.  If a copier
+    is given, the verification is done by filecmp.cmp instead.
 
     When requested, and when possible, the permissions and ownership
     are preserved.  Both copy_acl and preserve_group have defaults set
@@ -377,7 +488,8 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
       verify they are the same.  Note that providing a copier will 
       break the verification functionality if the copier changes the
       contents of the destination file (such as a copier that compresses).
-    @param blocksize block size during copy operations
+    @param blocksize block size during copy operations that are not
+      done in the kernel
     @param tempprefix Prefix for temporary files during copy operations.
       Do not include directory paths in the tempprefix.
     @param permmask Permission bits to remove Default: world write (002)
@@ -508,9 +620,10 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
         tempname=temp.name
         if logger is not None:
             logger.info('%s: copy to temporary %s'%(infile,tempname))
+        checksum=None
         if copier is None:
             with open(infile,'rb') as indata:
-                shutil.copyfileobj(indata,temp,length=blocksize)
+                checksum=_copy_data(indata,temp,blocksize,verify)
         else:
             copier(infile,tempname,temp)
         temp.close()
@@ -519,9 +632,17 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
         if verify:
             if logger is not None:
                 logger.info('%s: verify copy %s'%(infile,tempname))
-            if not filecmp.cmp(infile,tempname):
-                raise VerificationFailed('filecmp.cmp returned False',
-                                         infile,actual_outfile,tempname)
+            if checksum is None:
+                if not filecmp.cmp(infile,tempname):
+                    raise VerificationFailed('filecmp.cmp returned False',
+                                             infile,actual_outfile,tempname)
+            else:
+                with open(tempname,'rb') as tempdata:
+                    tempsum=_copy_data(tempdata,None,blocksize,True)
+                if tempsum!=checksum:
+                    raise VerificationFailed('CRC-32 or size of copy differs '
+                                             'from data read from origin',
+                                             infile,actual_outfile,tempname)
         if logger is not None:
             logger.info('%s: copy group ID and permissions to %s'
                         %(infile,tempname,))
@@ -558,6 +679,52 @@ def deliver_file(infile,outfile,keep=True,verify=False,blocksize=1048576,
         except EnvironmentError as e:
             pass
 
+def deliver_files(pairs,workers=None,logger=None,**kwargs):
+    """!Delivers many files at once, from a pool of threads.
+
+    Calls deliver_file(infile,outfile,logger=logger,**kwargs) for each
+    (infile,outfile) pair, in up to "workers" threads.  Each delivery
+    has the same atomicity as deliver_file.  Exceptions are collected,
+    and raised at the end, so later deliveries continue if earlier ones
+    failed.  If only one delivery raised an exception, that exception
+    is raised, otherwise FileOpErrors is raised.
+
+    @param pairs a list of (infile,outfile) tuples
+    @param workers the number of threads.  Default: the smaller of 8
+      and the number of files.  If 1, no threads are started.
+    @param logger a logging.Logger for log messages
+    @param kwargs Other keyword arguments are passed to deliver_file()"""
+    pairs=list(pairs)
+    if workers is None:
+        workers=min(8,len(pairs))
+    if logger is not None:
+        logger.info('Delivering %d files in %d threads...'
+                    %(len(pairs),max(1,workers)))
+    ex=list()
+    def deliver(infile,outfile):
+        try:
+            deliver_file(infile,outfile,logger=logger,**kwargs)
+        except Exception as e:
+            ex.append( (infile,outfile,e) )
+    if workers<=1 or len(pairs)<=1:
+        for (infile,outfile) in pairs:
+            deliver(infile,outfile)
+    else:
+        import produtil.workpool
+        with produtil.workpool.WorkPool(workers) as pool:
+            for (infile,outfile) in pairs:
+                pool.add_work(deliver,[infile,outfile])
+    if len(ex)==1:
+        raise ex[0][2]
+    elif len(ex)>1:
+        msg='Multiple exceptions caught while delivering files in '\
+            'deliver_files.'
+        if logger is not None: logger.warning(msg)
+        raise FileOpErrors(msg,','.join([ a for a,b in pairs ]),
+                           [ (a,b,str(c)) for a,b,c in ex ] )
+    if logger is not None:
+        logger.info('Done delivering %d files.'%(len(pairs),))
+
 ########################################################################
 def find_exe(name,dirlist=None,raise_missing=True):
     """!Searches the $PATH or a specified iterable of directory names
@@ -946,40 +1113,56 @@ def check_file(filename,min_size=None,min_mtime_age=None,
     @returns True if requirements are met, False otherwise.    """
     try:
         s=os.stat(filename)
-        if s.st_size<min_size: 
-            if logger is not None:
-                logger.info('%s: too small'%(filename,))
-            return False
-        if min_mtime_age is not None or min_atime_age is not None \
-                or min_ctime_age is not None:
-            now=int(time.time())
-            if min_mtime_age is not None:
-                if not now-s.st_mtime>min_mtime_age: 
-                    if logger is not None:
-                        logger.info('%s: not old enough (modification time)'
-                                    %(filename,))
-                    return False
-            if min_atime_age is not None:
-                if not now-s.st_atime>min_atime_age: 
-                    if logger is not None:
-                        logger.info('%s: not old enough (access time)'
-                                    %(filename,))
-                    return False
-            if min_ctime_age is not None:
-                if not now-s.st_ctime>min_ctime_age: 
-                    if logger is not None:
-                        logger.info('%s: not old enough (inode change time)'
-                                    %(filename,))
-                    return False
-        if logger is not None:
-            logger.info('%s: file meets requirements'%(filename,))
-        return True
     except EnvironmentError as e:
         if e.errno==errno.ENOENT:
             if logger is not None:
                 logger.info('%s: does not exist (ENOENT)'%(filename,))
             return False
         raise
+    return _stat_meets(filename,s,min_size,min_mtime_age,min_atime_age,
+                       min_ctime_age,logger)
+
+def _stat_meets(filename,s,min_size,min_mtime_age,min_atime_age,
+                min_ctime_age,logger):
+    """!Internal implementation function of check_file and
+    DirectoryWaiter.  Determines whether a file with the given stat
+    information meets the requirements.  The arguments have the same
+    meaning as in check_file, except:
+    @param s the result of os.stat(filename)
+    @returns True if requirements are met, False otherwise."""
+    if s.st_size<min_size: 
+        if logger is not None:
+            logger.info('%s: too small'%(filename,))
+        return False
+    if min_mtime_age is not None or min_atime_age is not None \
+            or min_ctime_age is not None:
+        now=int(time.time())
+        if min_mtime_age is not None:
+            if not now-s.st_mtime>min_mtime_age: 
+                if logger is not None:
+                    logger.info('%s: not old enough (modification time)'
+                                %(filename,))
+                return False
+        if min_atime_age is not None:
+            if not now-s.st_atime>min_atime_age: 
+                if logger is not None:
+                    logger.info('%s: not old enough (access time)'
+                                %(filename,))
+                return False
+        if min_ctime_age is not None:
+            if not now-s.st_ctime>min_ctime_age: 
+                if logger is not None:
+                    logger.info('%s: not old enough (inode change time)'
+                                %(filename,))
+                return False
+    if logger is not None:
+        logger.info('%s: file meets requirements'%(filename,))
+    return True
+
+##@var MIN_SLEEPTIME
+# The shortest time in seconds that a FileWaiter sleeps between
+# checks, even if the sleeptime sent to checkfiles is smaller.
+MIN_SLEEPTIME=0.01
 
 class FileWaiter:
     """!A class that waits for files to meet some requirements."""
@@ -1007,6 +1190,8 @@ class FileWaiter:
         self.min_atime_age=min_atime_age
         self.min_ctime_age=min_ctime_age
         self.min_fraction=float(min_fraction)
+        self.stats_issued=0
+        self.wakeups=0
         if flist is not None: self.add(flist)
     ##@var min_size
     # The minimum file size
@@ -1023,6 +1208,13 @@ class FileWaiter:
     ##@var min_fraction
     # The minimum fraction of files that must meet the requirements
 
+    ##@var stats_issued
+    # The number of file checks done so far; each is one stat(2) call
+    # unless check() is overridden
+
+    ##@var wakeups
+    # The number of times checkfiles woke up from a sleep to check again
+
     def add(self,flist):
         """!Adds a file, or iterable that iterates over files, to the
         list of files to wait for.  If the same filename is received a
@@ -1067,7 +1259,7 @@ class FileWaiter:
                    log_each_file=True):
         """!Looks for the requested files.  Will loop, checking over
         and over up to maxwait seconds, sleeping sleeptime seconds
-        between checks.
+        between checks, but never less than MIN_SLEEPTIME seconds.
         @param maxwait maximum seconds to wait
         @param sleeptime sleep time in seconds between checks
         @param logger a logging.Logger for messages
@@ -1076,6 +1268,7 @@ class FileWaiter:
         start=int(time.time())
         now=start
         first=True
+        nextsleep=sleeptime
         if log_each_file:
             flogger=logger
         else:
@@ -1101,10 +1294,11 @@ class FileWaiter:
                 return False
             
             if not first:
-                sleepnow=max(0,min(sleeptime,start+maxwait-now-1))
-                if sleepnow<1e-3:
+                timeleft=start+maxwait-now-1
+                if timeleft<1e-3:
                     logger.info('Waited too long.  Giving up.')
                     return False
+                sleepnow=max(MIN_SLEEPTIME,min(nextsleep,timeleft))
                 if logger is not None:
                     logger.info('Still need files: have %d of %d, '
                                 'but need %g%% of them (%g file%s).'
@@ -1113,31 +1307,238 @@ class FileWaiter:
                                   's' if (needfiles>1) else ''))
                     logfun=logger.info if (sleepnow>=5) else logger.debug
                     logfun('Sleeping %g seconds...'%(float(sleepnow),))
-                time.sleep(sleepnow)
+                self._sleep(sleepnow)
+                self.wakeups+=1
                 if logger is not None:
                     logfun('Done sleeping.')
 
             first=False
 
-            for filename in self._flist:
-                if filename in self._found: continue
-                if self.check(filename,logger=flogger):
-                    self._found.add(filename)
-                    if flogger is not None:
-                        flogger.info('%s: found this one (%d of %d found).'
-                                    %(filename,len(self._found),
-                                      len(self._fset)))
+            self._check_missing(flogger)
+            nextsleep=self._next_sleeptime(sleeptime)
                 
         return len(self._found)>=len(self._fset)
 
+    def _check_missing(self,logger):
+        """!Checks all files that have not been found yet, by calling
+        check() on each one.
+        @param logger a logging.Logger for messages about each file,
+            or None"""
+        for filename in self._flist:
+            if filename in self._found: continue
+            self.stats_issued+=1
+            if self.check(filename,logger=logger):
+                self._found_file(filename,logger)
+
+    def _found_file(self,filename,logger):
+        """!Records that a file meets the requirements.
+        @param filename the file
+        @param logger a logging.Logger for messages, or None"""
+        self._found.add(filename)
+        if logger is not None:
+            logger.info('%s: found this one (%d of %d found).'
+                        %(filename,len(self._found),len(self._fset)))
+
+    def _next_sleeptime(self,sleeptime):
+        """!Returns the number of seconds to sleep before the next
+        check.  This default implementation always returns sleeptime.
+        @param sleeptime the sleeptime sent to checkfiles"""
+        return sleeptime
+
+    def _sleep(self,seconds):
+        """!Sleeps between checks.  This default implementation calls
+        time.sleep.
+        @param seconds the number of seconds to sleep"""
+        time.sleep(seconds)
+
+class DirectoryWaiter(FileWaiter):
+    """!A FileWaiter that lists directories instead of checking every
+    file.
+
+    Files are grouped by directory.  Each check lists every directory
+    that has missing files once, and only files that are in the
+    listing are checked with stat(2), so files that do not exist yet
+    cost nothing.  The time between checks adapts to the rate at which
+    files arrive: it is half the average time between arrivals, but no
+    less than min_sleeptime and no more than the sleeptime sent to
+    checkfiles.  If a file is present but too young, the waiter wakes
+    up when it will be old enough.  With use_inotify=True, the waiter
+    also wakes up as soon as a missing file is written in a watched
+    directory.  Since inotify cannot see writes from other hosts, the
+    timed checks continue regardless.
+
+    The check() function is not used, so subclasses that override it
+    should derive from FileWaiter instead."""
+    def __init__(self,flist=None,min_size=None,
+                 min_mtime_age=None,min_atime_age=None,
+                 min_ctime_age=None,min_fraction=1.0,
+                 min_sleeptime=1,use_inotify=False):
+        """!Constructor for the DirectoryWaiter.  Arguments are the
+        same as for FileWaiter, except:
+        @param min_sleeptime the minimum time in seconds between checks
+        @param use_inotify if True, use produtil.inotify to wake up
+            when a missing file changes, if inotify is available"""
+        FileWaiter.__init__(self,flist,min_size,min_mtime_age,
+                            min_atime_age,min_ctime_age,min_fraction)
+        self.min_sleeptime=min_sleeptime
+        self.use_inotify=use_inotify
+        self.dir_scans=0
+        self._missing=dict()
+        self._watched=set()
+        self._ready_at=None
+        self._first_check=None
+        self._last_arrival=None
+        self._arrivals=0
+        self._inotify=None
+    ##@var min_sleeptime
+    # The minimum time in seconds between checks
+
+    ##@var use_inotify
+    # If True, use inotify to wake up when a missing file changes
+
+    ##@var dir_scans
+    # The number of directory listings done so far
+
+    def checkfiles(self,maxwait=1800,sleeptime=20,logger=None,
+                   log_each_file=True):
+        """!Looks for the requested files, like FileWaiter.checkfiles,
+        but sleeps for a time that adapts to the arrival rate of the
+        files, no more than sleeptime seconds.
+        @param maxwait maximum seconds to wait
+        @param sleeptime maximum sleep time in seconds between checks
+        @param logger a logging.Logger for messages
+        @param log_each_file log messages about each file checked"""
+        self._first_check=None
+        self._arrivals=0
+        try:
+            return FileWaiter.checkfiles(self,maxwait,sleeptime,logger,
+                                         log_each_file)
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify=None
+                self._watched=set()
+
+    def _check_missing(self,logger):
+        """!Checks all files that have not been found yet, with one
+        listing of each directory.
+        @param logger a logging.Logger for messages about each file,
+            or None"""
+        now=time.time()
+        # Files present at the first check did not arrive while
+        # waiting, so they do not count towards the arrival rate.
+        counting=self._first_check is not None
+        if not counting: self._first_check=now
+        missing=dict()
+        for filename in self._flist:
+            if filename in self._found: continue
+            (dirname,basename)=os.path.split(filename)
+            missing.setdefault(dirname,dict())[basename]=filename
+        self._missing=missing
+        self._ready_at=None
+        for (dirname,files) in missing.iteritems():
+            self.dir_scans+=1
+            try:
+                names=set(os.listdir(dirname or '.'))
+            except EnvironmentError as e:
+                if e.errno not in (errno.ENOENT,errno.ENOTDIR): raise
+                if logger is not None:
+                    logger.info('%s: directory does not exist (%s)'
+                                %(dirname,errno.errorcode[e.errno]))
+                continue
+            for (basename,filename) in files.items():
+                if basename and basename not in names:
+                    if logger is not None:
+                        logger.info('%s: does not exist (not in directory)'
+                                    %(filename,))
+                    continue
+                self.stats_issued+=1
+                try:
+                    s=os.stat(filename)
+                except EnvironmentError as e:
+                    if e.errno!=errno.ENOENT: raise
+                    if logger is not None:
+                        logger.info('%s: does not exist (ENOENT)'
+                                    %(filename,))
+                    continue
+                if _stat_meets(filename,s,self.min_size,self.min_mtime_age,
+                               self.min_atime_age,self.min_ctime_age,logger):
+                    self._found_file(filename,logger)
+                    if counting:
+                        self._arrivals+=1
+                        self._last_arrival=now
+                    del self._missing[dirname][basename]
+                else:
+                    self._note_ready_time(s)
+
+    def _note_ready_time(self,s):
+        """!Records when a file that is present, but not old enough,
+        will be old enough.
+        @param s the os.stat result for the file"""
+        if s.st_size<self.min_size: return
+        ready=None
+        for (when,age) in [ (s.st_mtime,self.min_mtime_age),
+                            (s.st_atime,self.min_atime_age),
+                            (s.st_ctime,self.min_ctime_age) ]:
+            if age is not None and (ready is None or when+age+1>ready):
+                ready=when+age+1
+        if ready is not None and (self._ready_at is None or
+                                  ready<self._ready_at):
+            self._ready_at=ready
+
+    def _next_sleeptime(self,sleeptime):
+        """!Returns the number of seconds to sleep before the next
+        check: half the average time between file arrivals, or until
+        the next present file is old enough, whichever is sooner.
+        The result is between min_sleeptime and sleeptime.
+        @param sleeptime the sleeptime sent to checkfiles"""
+        result=sleeptime
+        if self._arrivals>0:
+            interval=(self._last_arrival-self._first_check)/self._arrivals
+            result=min(result,interval/2.0)
+        if self._ready_at is not None:
+            result=min(result,self._ready_at-time.time())
+        return max(min(self.min_sleeptime,sleeptime),result)
+
+    def _sleep(self,seconds):
+        """!Sleeps between checks.  If use_inotify is True, and
+        inotify is available, the sleep ends early when a missing file
+        is written or renamed into place.
+        @param seconds the number of seconds to sleep"""
+        if not self.use_inotify or not produtil.inotify.have_inotify():
+            time.sleep(seconds)
+            return
+        if self._inotify is None:
+            self._inotify=produtil.inotify.Inotify()
+        wanted=set([ dirname or '.' for (dirname,files)
+                     in self._missing.iteritems() if files ])
+        for path in self._watched-wanted:
+            self._inotify.remove_watch(path)
+        self._watched=set()
+        for path in wanted:
+            try:
+                self._inotify.add_watch(path)
+                self._watched.add(path)
+            except produtil.inotify.InotifyError:
+                pass # directory does not exist yet
+        deadline=time.time()+seconds
+        while True:
+            left=deadline-time.time()
+            if left<=0: return
+            for (path,mask,name) in self._inotify.read_events(left):
+                if mask&produtil.inotify.IN_Q_OVERFLOW: return
+                if name in self._missing.get('' if path=='.' else path,()):
+                    return
+
 def wait_for_files(flist,logger=None,maxwait=1800,sleeptime=20,
                    min_size=1,min_mtime_age=30,min_atime_age=None,
                    min_ctime_age=None,min_fraction=1.0,
-                   log_each_file=True):
+                   log_each_file=True,scan_dirs=False,use_inotify=False):
     """!Waits for files to meet requirements.  This is a simple
     wrapper around the FileWaiter class for convenience.  It is
-    equivalent to creating a FileWaiter with the provided arguments,
-    and calling its checkfiles routine.
+    equivalent to creating a FileWaiter (or DirectoryWaiter if
+    scan_dirs or use_inotify is True) with the provided arguments, and
+    calling its checkfiles routine.
         @param flist the file or list of files to wait for.  This is simply
               sent into self.add.
         @param logger a logging.Logger for messages
@@ -1151,7 +1552,17 @@ def wait_for_files(flist,logger=None,maxwait=1800,sleeptime=20,
             that must match the above requirements in order for
             FileWaiter.wait to return True. Default is 1.0, which
             means all of them.
-        @param log_each_file log messages about each file checked  """
-    waiter=FileWaiter(flist,min_size,min_mtime_age,min_atime_age,
-                      min_ctime_age,min_fraction)
+        @param log_each_file log messages about each file checked
+        @param scan_dirs if True, use a DirectoryWaiter, which lists
+            each directory once per check, and adapts the sleep time
+            to the arrival rate of the files
+        @param use_inotify if True, use a DirectoryWaiter that also
+            wakes up early when inotify reports a change to a file  """
+    if scan_dirs or use_inotify:
+        waiter=DirectoryWaiter(flist,min_size,min_mtime_age,min_atime_age,
+                               min_ctime_age,min_fraction,
+                               use_inotify=use_inotify)
+    else:
+        waiter=FileWaiter(flist,min_size,min_mtime_age,min_atime_age,
+                          min_ctime_age,min_fraction)
     return waiter.checkfiles(maxwait,sleeptime,logger,log_each_file)
@@ -0,0 +1,219 @@
+"""!Watches directories for new files with the Linux inotify API.
+
+This module is a small wrapper around the inotify functions of the C
+library, accessed through ctypes.  It is used to wake up code that
+waits for files, instead of sleeping for a fixed time.  Note that
+inotify only sees changes made by the local kernel: files written by
+other hosts to a shared filesystem may never generate an event.  Code
+that uses this module must still poll, and treat events as a hint to
+check sooner.
+
+Example:
+@code{.py}
+  with produtil.inotify.Inotify() as watcher:
+      watcher.add_watch('/path/to/com')
+      for (path,mask,name) in watcher.read_events(timeout=30):
+          print 'File %s changed in %s'%(name,path)
+@endcode"""
+
+import ctypes, errno, os, select, struct
+
+##@var __all__
+# Symbols exported by "from produtil.inotify import *"
+__all__=['InotifyError','InotifyUnavailable','Inotify','have_inotify',
+         'IN_ATTRIB','IN_CLOSE_WRITE','IN_MOVED_TO','IN_CREATE',
+         'IN_Q_OVERFLOW','IN_IGNORED','DEFAULT_MASK']
+
+class InotifyError(EnvironmentError):
+    """!Superclass of any inotify errors"""
+    def __init__(self,message,errno):
+        """!InotifyError constructor
+        @param message the description of the error
+        @param errno the system errno from the error"""
+        super(InotifyError,self).__init__(message)
+        self.errno=errno
+    ##@var errno
+    # The errno value when the error happened.
+
+class InotifyUnavailable(InotifyError):
+    """!Raised when the C library has no inotify support."""
+
+##@var IN_ATTRIB
+# Event mask bit: metadata, such as the modification time, changed.
+IN_ATTRIB=0x4
+
+##@var IN_CLOSE_WRITE
+# Event mask bit: a file opened for writing was closed.
+IN_CLOSE_WRITE=0x8
+
+##@var IN_MOVED_TO
+# Event mask bit: a file was renamed into the watched directory.
+IN_MOVED_TO=0x80
+
+##@var IN_CREATE
+# Event mask bit: a file was created in the watched directory.
+IN_CREATE=0x100
+
+##@var IN_Q_OVERFLOW
+# Event mask bit: the kernel event queue overflowed, so events were lost.
+IN_Q_OVERFLOW=0x4000
+
+##@var IN_IGNORED
+# Event mask bit: the watch was removed, because the directory was
+# deleted or unmounted.
+IN_IGNORED=0x8000
+
+##@var IN_ONLYDIR
+# Flag for inotify_add_watch: only watch the path if it is a directory.
+IN_ONLYDIR=0x01000000
+
+##@var DEFAULT_MASK
+# Events reported by default: a file was written, renamed into place,
+# or had its modification time changed.
+DEFAULT_MASK=IN_CLOSE_WRITE|IN_MOVED_TO|IN_ATTRIB
+
+##@var c_library
+# The C library name for input to ctypes.CDLL.  This is intended to be
+# modified externally from this module if needed before using the
+# produtil.inotify module.
+c_library='libc.so.6'
+
+##@var libc
+# The loaded C library, or None if it has not been loaded yet.
+libc=None
+
+##@var _EVENT
+# The fixed-size header of a struct inotify_event: wd, mask, cookie, len
+_EVENT=struct.Struct('iIII')
+
+def load_libc():
+    """!Loads the C library and sets the inotify function prototypes.
+
+    This function is called automatically when needed; you should
+    never need to call it directly.  Raises InotifyUnavailable if the
+    library cannot be loaded or has no inotify functions."""
+    global libc
+    if libc is not None: return
+    try:
+        lib=ctypes.CDLL(c_library,use_errno=True)
+        lib.inotify_init1.argtypes=[ ctypes.c_int ]
+        lib.inotify_init1.restype=ctypes.c_int
+        lib.inotify_add_watch.argtypes=[ ctypes.c_int, ctypes.c_char_p,
+                                         ctypes.c_uint32 ]
+        lib.inotify_add_watch.restype=ctypes.c_int
+        lib.inotify_rm_watch.argtypes=[ ctypes.c_int, ctypes.c_int ]
+        lib.inotify_rm_watch.restype=ctypes.c_int
+    except (EnvironmentError,AttributeError) as e:
+        raise InotifyUnavailable('Cannot load inotify functions from %s: %s'
+                                 %(c_library,str(e)),errno.ENOSYS)
+    libc=lib
+
+def have_inotify():
+    """!Returns True if inotify is available, and False otherwise."""
+    try:
+        load_libc()
+        return True
+    except InotifyError:
+        return False
+
+class Inotify(object):
+    """!An inotify instance, which watches a set of directories.
+
+    The instance holds a non-blocking file descriptor, which can be
+    passed to select.  Close it with close(), or use the Inotify in a
+    "with" block."""
+    def __init__(self):
+        """!Inotify constructor.  Raises InotifyUnavailable if the C
+        library has no inotify support, or InotifyError if the kernel
+        refuses to create an instance."""
+        load_libc()
+        fd=libc.inotify_init1(os.O_NONBLOCK|getattr(os,'O_CLOEXEC',0o2000000))
+        if fd<0:
+            err=ctypes.get_errno()
+            raise InotifyError('inotify_init1: '+os.strerror(err),err)
+        self._fd=fd
+        self._paths=dict()
+        self._wds=dict()
+    def fileno(self):
+        """!Returns the file descriptor, for use with select."""
+        return self._fd
+    def close(self):
+        """!Closes the file descriptor, removing all watches."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd=None
+            self._paths.clear()
+            self._wds.clear()
+    def __enter__(self):
+        """!Returns self."""
+        return self
+    def __exit__(self,etype,evalue,traceback):
+        """!Calls close().
+        @param etype,evalue,traceback Exception information."""
+        self.close()
+    def watching(self,path):
+        """!Returns True if the directory is being watched.
+        @param path the directory"""
+        return path in self._wds
+    def add_watch(self,path,mask=DEFAULT_MASK):
+        """!Watches a directory, if it is not watched already.  Raises
+        InotifyError if the directory cannot be watched, for example
+        because it does not exist.
+        @param path the directory to watch
+        @param mask the events to report, such as DEFAULT_MASK"""
+        if path in self._wds: return
+        bpath=path if isinstance(path,bytes) else path.encode('utf-8')
+        wd=libc.inotify_add_watch(self._fd,bpath,mask|IN_ONLYDIR)
+        if wd<0:
+            err=ctypes.get_errno()
+            raise InotifyError('%s: inotify_add_watch: %s'
+                               %(path,os.strerror(err)),err)
+        self._paths[wd]=path
+        self._wds[path]=wd
+    def remove_watch(self,path):
+        """!Stops watching a directory.
+        @param path the directory"""
+        wd=self._wds.pop(path,None)
+        if wd is None: return
+        del self._paths[wd]
+        libc.inotify_rm_watch(self._fd,wd)
+    def read_events(self,timeout=None):
+        """!Waits for events, and returns them.
+
+        Waits up to timeout seconds (forever if None) for at least one
+        event, then returns a list of (path,mask,name) tuples, one per
+        event.  The path is the watched directory, mask is the event
+        mask and name is the name of the file in the directory.  An
+        IN_Q_OVERFLOW event has a path and name of None.  Returns an
+        empty list if the timeout is reached, or a signal interrupted
+        the wait.
+        @param timeout the maximum number of seconds to wait"""
+        try:
+            (ready,_,_)=select.select([self._fd],[],[],timeout)
+        except select.error as e:
+            if e.args[0]==errno.EINTR: return []
+            raise
+        if not ready: return []
+        events=list()
+        while True:
+            try:
+                data=os.read(self._fd,65536)
+            except EnvironmentError as e:
+                if e.errno in (errno.EAGAIN,errno.EINTR): break
+                raise
+            if not data: break
+            offset=0
+            while offset+_EVENT.size<=len(data):
+                (wd,mask,cookie,namelen)=_EVENT.unpack_from(data,offset)
+                offset+=_EVENT.size
+                name=data[offset:offset+namelen].rstrip(b'\0')
+                offset+=namelen
+                path=self._paths.get(wd,None)
+                if mask&IN_IGNORED:
+                    if path is not None:
+                        del self._paths[wd]
+                        del self._wds[path]
+                    continue
+                if not isinstance(name,str): name=name.decode('utf-8')
+                events.append((path,mask,name or None))
+        return events
@@ -16,8 +16,8 @@ class NoMoreProcesses(KeyboardInterrupt):
     """!Raised when the produtil.sigsafety package catches a fatal
     signal.  Indicates to callers that the thread should exit."""
 
-import os, signal, select, logging, sys, StringIO, time, errno, \
-    fcntl, threading, weakref, collections
+import os, signal, select, logging, sys, time, errno, math, \
+    fcntl, threading, weakref, collections, ctypes
 import stat,errno,fcntl
 
 class Constant(object):
@@ -65,7 +65,7 @@ def unblock(stream,logger=None):
     @param stream the stream to unblock
     @param logger a logging.Logger for log messages
     @returns True on success, False otherwise."""
-    call_fcntrl(os.O_NONBLOCK,0,logger)
+    return call_fcntrl(stream,os.O_NONBLOCK,0,logger)
 
 def call_fcntrl(stream,on,off,logger=None):
     """!Internal function that implements unblock()
@@ -326,11 +326,64 @@ def kill_all():
 
 ########################################################################
 
+##@var c_library
+# The C library name for input to ctypes.CDLL, used to find the
+# syscall function for pidfd_open.  This is intended to be modified
+# externally from this module if needed before calling manage().
+c_library='libc.so.6'
+
+##@var _SYS_pidfd_open
+# The Linux system call number of pidfd_open(2), which is the same on
+# every architecture except alpha.
+_SYS_pidfd_open=434
+
+##@var _pidfd_libc
+# The C library used to call pidfd_open, None if it has not been
+# loaded yet, or False if pidfd_open is unavailable.
+_pidfd_libc=None
+
+def _pidfd_open(pid,logger=None):
+    """!Returns a file descriptor that becomes readable when the
+    specified child process exits, or None if the kernel cannot
+    provide one.  This uses pidfd_open(2), which needs Linux 5.3 or
+    later.
+    @param pid the child process id
+    @param logger a logging.Logger for debug messages"""
+    global _pidfd_libc
+    if _pidfd_libc is None:
+        try:
+            libc=ctypes.CDLL(c_library,use_errno=True)
+            libc.syscall.restype=ctypes.c_long
+            _pidfd_libc=libc
+        except (EnvironmentError,AttributeError) as e:
+            if logger is not None:
+                logger.debug('Cannot load %s: %s'%(c_library,str(e)))
+            _pidfd_libc=False
+    if _pidfd_libc is False: return None
+    fd=_pidfd_libc.syscall(ctypes.c_long(_SYS_pidfd_open),
+                           ctypes.c_int(pid),ctypes.c_uint(0))
+    if fd<0:
+        err=ctypes.get_errno()
+        if err==errno.ENOSYS or err==errno.EPERM:
+            # Kernel is too old, or a seccomp filter forbids the call.
+            _pidfd_libc=False
+        if logger is not None:
+            logger.debug('pidfd_open(%d): %s'%(pid,os.strerror(err)))
+        return None
+    return int(fd)
+
 def manage(proclist,inf=None,outf=None,errf=None,instr=None,logger=None,
            childset=None,sleeptime=None):
     """!Watches a list of processes, handles their I/O, returns when
     all processes have exited and all I/O is complete.  
 
+    The function sleeps in select.poll until a stream is ready or a
+    process exits.  Each process is watched with a pidfd (see
+    pidfd_open(2)) where the kernel supports it.  Other processes are
+    checked with os.wait4 at intervals that start at a millisecond
+    and double up to the sleeptime.  Input is written in blocks of
+    at most bufsize bytes, and only when the pipe has room.
+
     @warning You should not be calling this function unless you are
       modifying the implementation of Pipeline.  Use the produtil.run
       module instead of calling launch() and manage().
@@ -341,7 +394,8 @@ def manage(proclist,inf=None,outf=None,errf=None,instr=None,logger=None,
     @param errf the error file
     @param instr the input string, instead of an input file
     @param childset the set of child process ids
-    @param sleeptime sleep time between checks of child processes
+    @param sleeptime maximum sleep time between checks of child
+      processes that cannot be watched with a pidfd
     @param logger Logs to the specified object, at level DEBUG, if a logger is
     specified.  
     @returns a tuple containing the stdout string (or None), the
@@ -355,188 +409,197 @@ def manage(proclist,inf=None,outf=None,errf=None,instr=None,logger=None,
     assert(ms)
 
     bufsize=1048576
-    work=list()
     done=dict() # mapping from pid to wait4 return value
     outio=None
     errio=None
-    haveio=False
+    poller=select.poll()
+    streams=dict() # mapping from fd to bytearray, or None for input
+    pidfds=dict() # mapping from pidfd to pid
+    unwatched=list() # processes with no pidfd
+    running=set(proclist)
+    maxsleep=sleeptime if sleeptime else 0.2
 
     inf=filenoify(inf)
     outf=filenoify(outf)
     errf=filenoify(errf)
 
+    nin=0
     if inf is not None:
         if instr is None: 
             instr=""
         if logger is not None:
             logger.debug("Will write instr (%d bytes) to %d."
                          %(len(instr),inf))
-        work.append([0,inf])
         unblock(inf,logger=logger)
-        haveio=True
+        if instr:
+            streams[inf]=None
+            poller.register(inf,select.POLLOUT)
+        else:
+            if logger is not None:
+                logger.debug("No input to write; close %d."%inf)
+            pclose(inf)
 
     if outf is not None:
         if logger is not None:
             logger.debug("Will read outstr from %d."%outf)
-        work.append([1,outf])
-        outio=StringIO.StringIO()
+        outio=bytearray()
+        streams[outf]=outio
         unblock(outf,logger=logger)
-        haveio=True
+        poller.register(outf,select.POLLIN)
 
     if errf is not None:
         if logger is not None:
             logger.debug("Will read errstr from %d."%errf)
-        work.append([1,errf])
-        errio=StringIO.StringIO()
+        errio=bytearray()
+        streams[errf]=errio
         unblock(errf,logger=logger)
-        haveio=True
+        poller.register(errf,select.POLLIN)
 
     for proc in proclist:
         if logger is not None:
             logger.debug("Monitor process %d."%proc)
-        work.append([2,proc])
+        fd=_pidfd_open(proc,logger)
+        if fd is None:
+            unwatched.append(proc)
+        else:
+            pidfds[fd]=proc
+            poller.register(fd,select.POLLIN)
 
-    nin=0
-    lastproc=time.time()
-    forceclose=False
-    while work:
-        i=0
-        didproc=False
-        if _kill_all is not None:
+    def close_stream(fd,why):
+        if logger is not None:
+            logger.debug("%s; close %d."%(why,fd))
+        poller.unregister(fd)
+        del streams[fd]
+        pclose(fd)
+
+    def reap(proc,options):
+        r=os.wait4(proc,options)
+        if not r or ( r[0]==0 and r[1]==0 ):
             if logger is not None:
-                logger.debug("Kill all processes.")
-            for (job,tgt) in work:
-                if job==2:
-                    os.kill(tgt,SIGTERM)
-        while i<len(work):
-            (job,tgt)=work[i]
-            assert(job==0 or job==1 or job==2)
-            if job==0:
-                if logger is not None:
-                    logger.debug("Attempt a write of %d bytes to %d"
-                                 %(len(instr)-nin,tgt))
-                try:
-                    n=os.write(tgt,instr[nin:])
-                except EnvironmentError as e:
-                    if e.errno==errno.EAGAIN or e.errno==errno.EWOULDBLOCK:
-                        n=None
-                    else:
-                        raise
-                if n: 
-                    if logger is not None:
-                        logger.debug("Wrote %d bytes to %d."%(n,tgt))
-                    nin+=n
-                if nin>=len(instr):
-                    if logger is not None:
-                        logger.debug("Done writing all %d bytes; close %d."
-                                     %(nin,tgt))
-                    pclose(tgt)
-                    work.pop(i)
-                    continue # do not increment i
-                if forceclose:
-                    if logger is not None:
-                        logger.debug("Force close of in %d due to timeout."
-                                     %tgt)
-                    pclose(tgt)
-                    work.pop(i)
-                    continue # do not increment i
-            elif job==1:
-                try:
-                    if logger is not None:
-                        logger.debug("Attempt a read from %d"%tgt)
-                    s=os.read(tgt,bufsize)
-                except EnvironmentError as e:
-                    if e.errno==errno.EAGAIN or e.errno==errno.EWOULDBLOCK:
-                        if logger is not None:
-                            logger.debug("Error %s from %d - assume no data"
-                                         %(str(e),tgt))
-                        s=None
-                    else:
-                        raise
-                if s=='':
-                    # end of file
-                    if logger is not None:
-                        logger.debug("eof reading output %d"%tgt)
-                    pclose(tgt)
-                    work.pop(i)
-                    continue # do not increment i
-                if s is not None:
-                    if logger is not None:
-                        logger.debug("Read %d bytes from output %d"
-                                     %(len(s),tgt))
-                    # read something
-                    outio.write(s)
-                if forceclose:
-                    if logger is not None:
-                        logger.debug("Force close of %d due to timeout."
-                                     %tgt)
-                    pclose(tgt)
-                    work.pop(i)
-                    continue # do not increment i
-            elif job==2:
+                logger.debug("Process %d still running"%proc)
+            return False
+        if logger is not None:
+            logger.debug("Process %d exited"%proc)
+        running.discard(proc)
+        try:
+            ms.remove(proc)
+        except (ValueError,KeyError,TypeError) as e:
+            if logger is not None: 
+                logger.debug("Cannot remove pid %d from _manage_set: %s"
+                             %(proc,str(e)),exc_info=True)
+        if childset is not None:
+            try:
+                childset.remove(proc)
+            except (ValueError,KeyError,TypeError) as e:
+                if logger is not None: 
+                    logger.debug("Cannot remove pid %d from childset: %s"
+                                 %(proc,str(e)),exc_info=True)
+        done[proc]=r
+        return True
+
+    try:
+        backoff=0.001
+        lastproc=time.time()
+        while running or streams:
+            if _kill_all is not None:
                 if logger is not None:
-                    logger.debug("Check process %d"%tgt)
-                didproc=True
-                r=os.wait4(tgt,os.WNOHANG)
-                if r and ( r[0]!=0 or r[1]!=0 ):
+                    logger.debug("Kill all processes.")
+                for proc in running:
+                    os.kill(proc,signal.SIGTERM)
+
+            # Sleep until something happens.  Never sleep longer than
+            # a second, so that kill_all() is noticed.
+            if unwatched:
+                timeout=min(backoff,maxsleep)
+                backoff*=2
+            elif running:
+                timeout=1.0
+            else:
+                # All processes have exited.  Streams still open after
+                # two seconds are held by grandchildren, so give up on
+                # them then.
+                timeout=min(1.0,max(0,lastproc+2-time.time()))
+            try:
+                events=poller.poll(int(math.ceil(timeout*1000)))
+            except select.error as e:
+                if e.args[0]!=errno.EINTR: raise
+                events=list()
+
+            for (fd,event) in events:
+                if fd in pidfds:
+                    proc=pidfds.pop(fd)
+                    poller.unregister(fd)
+                    os.close(fd)
+                    reap(proc,0)
+                elif fd not in streams:
+                    continue
+                elif streams[fd] is None:
                     if logger is not None:
-                        logger.debug("Process %d exited"%tgt)
-                    work.pop(i)
+                        logger.debug("Attempt a write of %d bytes to %d"
+                                     %(len(instr)-nin,fd))
                     try:
-                        ms.remove(tgt)
-                    except (ValueError,KeyError,TypeError) as e:
-                        if logger is not None: 
-                            logger.debug(
-                                "Cannot remove pid %d from _manage_set: %s"
-                                %(tgt,str(e)),exc_info=True)
-                    if childset is not None:
-                        try:
-                            childset.remove(tgt)
-                        except (ValueError,KeyError,TypeError) as e:
-                            if logger is not None: 
-                                logger.debug(
-                                    "Cannot remove pid %d from childset: %s"
-                                    %(tgt,str(e)),exc_info=True)
-                    done[tgt]=r
-                    continue # do not increment i
+                        n=os.write(fd,instr[nin:nin+bufsize])
+                    except EnvironmentError as e:
+                        if e.errno==errno.EAGAIN or \
+                                e.errno==errno.EWOULDBLOCK:
+                            n=None
+                        else:
+                            raise
+                    if n:
+                        if logger is not None:
+                            logger.debug("Wrote %d bytes to %d."%(n,fd))
+                        nin+=n
+                    if nin>=len(instr):
+                        close_stream(fd,"Done writing all %d bytes"%nin)
                 else:
-                    if logger is not None:
-                        logger.debug("Process %d still running"%tgt)
-            i+=1
-        if didproc:
-            lastproc=time.time()
-        else:
-            now=time.time()
-            if now-lastproc > 2 and work:
+                    try:
+                        if logger is not None:
+                            logger.debug("Attempt a read from %d"%fd)
+                        s=os.read(fd,bufsize)
+                    except EnvironmentError as e:
+                        if e.errno==errno.EAGAIN or \
+                                e.errno==errno.EWOULDBLOCK:
+                            if logger is not None:
+                                logger.debug("Error %s from %d - assume "
+                                             "no data"%(str(e),fd))
+                            continue
+                        raise
+                    if not s:
+                        close_stream(fd,"eof reading output %d"%fd)
+                    else:
+                        if logger is not None:
+                            logger.debug("Read %d bytes from output %d"
+                                         %(len(s),fd))
+                        streams[fd].extend(s)
+
+            for proc in list(unwatched):
                 if logger is not None:
-                    logger.debug(
-                        "No data two seconds after processes exited.  "
-                        "Forcing a close of all streams.")
-                # No data in past two seconds and all processes have
-                # exited.
-                forceclose=True
-                continue
-        if work:
-            if logger is not None:
-                logger.debug("Bottom of loop with work=%s"%repr(work))
-            if sleeptime:
-                time.sleep(sleeptime)
-            elif haveio:
-                time.sleep(0.01)
-            else:
-                time.sleep(0.2)
+                    logger.debug("Check process %d"%proc)
+                if reap(proc,os.WNOHANG):
+                    unwatched.remove(proc)
+            if events:
+                backoff=0.001
+
+            if running:
+                lastproc=time.time()
+            elif streams and time.time()-lastproc>=2:
+                for fd in list(streams.keys()):
+                    close_stream(fd,"No data two seconds after processes "
+                                 "exited; force close")
+    finally:
+        for fd in pidfds.keys():
+            os.close(fd)
+
     if logger is not None:
         logger.debug("Done monitoring pipeline.")
 
     outstr=None
     if outf is not None:
-        outstr=outio.getvalue()
-        outio.close()
+        outstr=str(outio)
 
     errstr=None
     if errf is not None:
-        errstr=errio.getvalue()
-        errio.close()
+        errstr=str(errio)
 
     if _kill_all is not None:
         raise NoMoreProcesses(
@@ -33,12 +33,15 @@ from io import StringIO
 from itertools import groupby
 from time import time
 from multiprocessing import Process, Queue
+from Queue import Queue as ThreadQueue, Empty
+import threading
 import time as std_time
 from datetime import datetime, timedelta
 import uuid
 import shutil
 
-import sqlite3,datetime,collections
+import sqlite3,datetime,collections,calendar,hashlib
+import struct,array,mmap,zlib,json
 import xml.etree.ElementTree as ET
 import cPickle
 
@@ -54,7 +57,10 @@ database_file_agmented = None
 use_performance_metrics = False
 default_column_length = 125
 stat_read_time_delay = 3*60
+checkpoint_poll_delay = 30
+bjobs_cache_ttl = 60
 temp_workflow_file = ''
+task_catalog_version = 2
 header_string = ''
 format_string = "jobid slots submit_time start_time cpu_used run_time delimiter=';'"
 
@@ -95,7 +101,7 @@ html_output_file = None
 rzdm_path = ''
 only_check_point = False
 save_checkfile_path = None
-use_multiprocessing = True
+use_background_refresh = True
 get_user = getpass.getuser()
 
 screen_resized = False
@@ -104,6 +110,8 @@ debug = None
 mlines = 0
 mcols = 0
 
+rocoto_stat_engine = None
+
 def sigwinch_handler(signum, frame):
     global screen_resized
     global mlines
@@ -119,7 +127,7 @@ def sigwinch_handler(signum, frame):
 def usage(message=None):
     curses.endwin()
     print>>sys.stderr, '''
-Usage: rocoto_status_viewer.py  -w workflow.xml -d database.db [--listtasks]\n                                                               [--html=filename.html]\n                                                               [--perfmetrics={True,False}]
+Usage: rocoto_status_viewer.py  -w workflow.xml -d database.db [--listtasks]\n                                                               [--html=filename.html]\n                                                               [--perfmetrics={True,False}]\n                                                               [--perfttl=seconds]
 
 Mandatory arguments:
   -w workflow.xml
@@ -128,6 +136,7 @@ Optional arguments:
   --listtasks             --- print out a list of all tasks
   --html=filename.html    --- creates an HTML document of status
   --perfmetrics=True      --- turn on/off extra columns for performance metrics 
+  --perfttl=60            --- seconds to reuse bjobs output for performance metrics
   --help                  --- print this usage message'''
 
     if message is not None:
@@ -138,24 +147,41 @@ def augment_SQLite3(filename):
 
     connection=sqlite3.connect(filename)
     c=connection.cursor()
-    #qinfo=c.execute("DROP TABLE IF EXISTS jobs_augment;")
-    qinfo=c.execute("PRAGMA table_info(jobs_augment)").fetchall()
+    qinfo=c.execute("PRAGMA table_info(jobs_perf)").fetchall()
     if any('qtime' in element for element in qinfo):
         c.close()
         return 'is_already_augmented'
-    else:
-        sql_create_augment_table = "CREATE TABLE jobs_augment AS SELECT * FROM jobs;"
-        q=c.execute(sql_create_augment_table)
-        q=c.execute("alter table jobs_augment add column qtime integer;")
-        q=c.execute("alter table jobs_augment add column cputime integer;")
-        q=c.execute("alter table jobs_augment add column runtime integer;")
-        q=c.execute("alter table jobs_augment add column slots integer;")
-        connection.commit()
-
+    # jobs_augment was a full copy of the jobs table made by older viewers
+    q=c.execute("DROP TABLE IF EXISTS jobs_augment;")
+    q=c.execute("CREATE TABLE jobs_perf (jobid VARCHAR(64) PRIMARY KEY, qtime TEXT, cputime TEXT, runtime TEXT, slots TEXT);")
+    q=c.execute("CREATE TABLE IF NOT EXISTS jobs_perf_update (id INTEGER PRIMARY KEY, time REAL);")
+    connection.commit()
     c.close()
-    database_file = filename
     return 'now_augmented'
 
+def update_perf_table(c, username):
+    '''Bulk loads the LSF performance metrics from bjobs into the jobs_perf
+    side table, which is joined to the jobs table when the status is read.
+    bjobs is only run when its last output is older than bjobs_cache_ttl
+    seconds.  Returns the set of jobids whose metrics changed.'''
+    row = c.execute('SELECT time FROM jobs_perf_update WHERE id=0').fetchone()
+    now = time()
+    if row is not None and now - row[0] < bjobs_cache_ttl:
+        return set()
+    aug_perf = get_aug_perf_values( username )
+    c.execute('INSERT OR REPLACE INTO jobs_perf_update (id,time) VALUES (0,?)',(now,))
+    if aug_perf is None:
+        return set()
+    columns = ('qtime','cputime','runtime','slots')
+    known = dict( (row[0],row[1:]) for row in c.execute('SELECT jobid,qtime,cputime,runtime,slots FROM jobs_perf') )
+    upsert = []
+    for jobid,perf_values in aug_perf.iteritems():
+        values = tuple( perf_values.get(column) for column in columns )
+        if known.get(jobid) != values:
+            upsert.append( (jobid,)+values )
+    c.executemany('INSERT OR REPLACE INTO jobs_perf (jobid,qtime,cputime,runtime,slots) VALUES (?,?,?,?,?)', upsert)
+    return set( row[0] for row in upsert )
+
 def isSQLite3(filename):
     from produtil.fileop import check_file
     from produtil.fileop import deliver_file
@@ -209,7 +235,7 @@ def load_produtil_pythonpath():
 def get_arguments():
     from produtil.fileop import check_file
     short_opts = "w:d:f:"
-    long_opts  = ["checkfile=","workfolw=","database=","html=","listtasks","onlycheckpoint","help","perfmetrics="]
+    long_opts  = ["checkfile=","workfolw=","database=","html=","listtasks","onlycheckpoint","help","perfmetrics=","perfttl="]
     try:
         opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
     except getopt.GetoptError as err:
@@ -231,6 +257,12 @@ def get_arguments():
             save_checkfile_path = v
         elif k in ('--perfmetrics'):
             perfmetrics_on = v
+        elif k in ('--perfttl'):
+            global bjobs_cache_ttl
+            try:
+                bjobs_cache_ttl = int(v)
+            except ValueError:
+                usage('perfttl must be a number of seconds (e.g. --perfttl=60)')
         elif k in ('--listtasks'):
             global list_tasks
             list_tasks = True
@@ -705,18 +737,125 @@ def rocoto_run(params):
         sys.exit(-1)
     return stat
 
+class CycleDefRanges(object):
+    '''The cycles of one cycledef group.  Each cycledef line is kept as an
+    arithmetic (start,end,step) range in epoch seconds instead of a list of
+    cycle strings, so membership of a YYYYMMDDHHMM string is O(1).  Cycles
+    that do not follow a fixed step (monthly UGCS cycling) are kept as a set.'''
+
+    def __init__(self):
+        self.ranges = []
+        self.cycles = set()
+
+    def add_range(self, start_cycle, end_cycle, inc_cycle):
+        step = int(timedelta_total_seconds(inc_cycle))
+        if step <= 0:
+            return
+        self.ranges.append( (calendar.timegm(start_cycle.timetuple()),
+                             calendar.timegm(end_cycle.timetuple()), step) )
+
+    def add_cycle(self, cycle):
+        self.cycles.add(cycle.strftime("%Y%m%d%H%M"))
+
+    def __contains__(self, cycle_string):
+        if cycle_string in self.cycles:
+            return True
+        if len(self.ranges) == 0 or len(cycle_string) != 12:
+            return False
+        try:
+            cycle = calendar.timegm( (int(cycle_string[0:4]),int(cycle_string[4:6]),int(cycle_string[6:8]),
+                                      int(cycle_string[8:10]),int(cycle_string[10:12]),0,0,0,0) )
+        except ValueError:
+            return False
+        for start,end,step in self.ranges:
+            if start <= cycle <= end and (cycle-start) % step == 0:
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.cycles) + sum( (end-start)//step+1 for start,end,step in self.ranges if end >= start )
+
+    def __iter__(self):
+        for start,end,step in self.ranges:
+            for cycle in xrange(start,end+1,step):
+                yield std_time.strftime("%Y%m%d%H%M",std_time.gmtime(cycle))
+        for cycle_string in sorted(self.cycles):
+            yield cycle_string
+
+def task_catalog_file(workflow_file):
+    return os.path.join( dirname(realpath(workflow_file)), '.'+basename(workflow_file)+'.rocoto_viewer_catalog' )
+
+def task_catalog_settings():
+    '''Returns the settings other than the XML that change what
+    get_tasklist parses: PACKAGE and, for ugcs, the SDATE, EDATE and
+    INC_MONTHS entities (INC_MONTHS decides ucgs_is_cron).'''
+    settings = { 'PACKAGE':PACKAGE.lower() }
+    if settings['PACKAGE'] == 'ugcs':
+        for name in ('SDATE','EDATE','INC_MONTHS'):
+            settings[name] = entity_values.get(name)
+    return settings
+
+def load_task_catalog(workflow_file, parse_file):
+    '''Returns the (tasks_ordered, metatask_list, cycledef_group_cycles)
+    task catalog of workflow_file, as parsed from parse_file.  The catalog
+    is kept in a file next to the workflow, keyed on the SHA-1 hash of
+    parse_file and on task_catalog_settings(), and parse_file is only
+    parsed when they do not match.'''
+    if list_tasks:
+        return get_tasklist(parse_file)
+    catalog_file = task_catalog_file(workflow_file)
+    with open(parse_file,'rb') as f:
+        sha1 = hashlib.sha1(f.read()).hexdigest()
+    settings = task_catalog_settings()
+    cached = None
+    try:
+        with open(catalog_file,'rb') as f:
+            cached = cPickle.load(f)
+    except Exception:
+        pass
+    if isinstance(cached,dict) and cached.get('version') == task_catalog_version \
+            and cached.get('sha1') == sha1 and cached.get('settings') == settings:
+        return cached['catalog']
+    catalog = get_tasklist(parse_file)
+    save_task_catalog(catalog_file, { 'version':task_catalog_version, 'sha1':sha1, 'settings':settings, 'catalog':catalog })
+    return catalog
+
+def save_task_catalog(catalog_file, cached):
+    try:
+        temp_file = tempfile.NamedTemporaryFile(prefix=basename(catalog_file)+'.', dir=dirname(catalog_file), delete=False)
+    except (IOError,OSError):
+        return
+    try:
+        cPickle.dump(cached, temp_file, cPickle.HIGHEST_PROTOCOL)
+        temp_file.close()
+        os.rename(temp_file.name,catalog_file)
+    except (IOError,OSError,cPickle.PicklingError):
+        temp_file.close()
+        try:
+            os.remove(temp_file.name)
+        except OSError:
+            pass
+
 def get_tasklist(workflow_file):
     import produtil.run, produtil.numerics
     tasks_ordered = []
+    task_names = set()
     metatask_list = collections.defaultdict(list)
-    tree = ET.parse(workflow_file)
-    root = tree.getroot()
-    cycledef_group_cycles = collections.defaultdict(list)
+    cycledef_group_cycles = collections.defaultdict(CycleDefRanges)
     if list_tasks:
         curses.endwin() 
         print
     cycle_noname = 'default_cycle' 
-    for child in root:
+    depth = 0
+    for event, child in ET.iterparse(workflow_file, events=('start','end')):
+        if event == 'start':
+            if depth == 0:
+                root = child
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
         if child.tag == 'cycledef':
             if len(child.attrib) != 0:
                 cycle_def_name = child.attrib['group']
@@ -742,155 +881,586 @@ def get_tasklist(workflow_file):
                 end_cycle   = produtil.numerics.to_datetime ( cycle_string[1] )
                 inc_cycle   = produtil.numerics.to_timedelta( cycle_string[2] )
 
-            while  start_cycle <= end_cycle:
-                cycledef_group_cycles[cycle_def_name].append(start_cycle.strftime("%Y%m%d%H%M"))
-                if PACKAGE.lower() == 'ugcs' and ucgs_is_cron:
+            if PACKAGE.lower() == 'ugcs' and ucgs_is_cron:
+                while  start_cycle <= end_cycle:
+                    cycledef_group_cycles[cycle_def_name].add_cycle(start_cycle)
                     try:
                         start_cycle = start_cycle + relativedelta(months=+inc_cycle)
-                    except AttributeError:
+                    except (AttributeError,NameError):
                         curses.endwin()
                         print;print
                         print 'dateutil which uses relativedelta to increment monthly (used by UGCS) is not supported with this version of python.\nUse Anaconda the native version in /user/bin'
                         sys.exit(-1)
-                else:
-                    start_cycle = start_cycle + inc_cycle
-                #if list_tasks:
-                #print 'cycledef=%s number of cycles %s inc: %s'%(cycle_def_name, len(cycledef_group_cycles[cycle_def_name]),inc_cycle)
-                #print 'contails cycles',cycledef_group_cycles[cycle_def_name]
+            else:
+                cycledef_group_cycles[cycle_def_name].add_range(start_cycle, end_cycle, inc_cycle)
         if child.tag == 'task':
             task_name = child.attrib['name']
             log_file = child.find('join').find('cyclestr').text.replace( '@Y@m@d@H','CYCLE' )
-            #if len(log_file) != 0:
-            #   print 'LOG: %s %s'%( task_name, log_file )
             if 'cycledefs' in child.attrib:
                 task_cycledefs = child.attrib['cycledefs']
-                #if list_tasks:
-                #   print 'task_cycledefs:',task_cycledefs
             else:
                 task_cycledefs = cycle_noname
             if list_tasks:
                 print task_name,task_cycledefs
-                #dependancies = child.getiterator('dependency')
-                #for dependency in dependancies:
-                #   for them in dependency.getchildren():
-                #       print them.attrib
             tasks_ordered.append((task_name,task_cycledefs,log_file))
+            task_names.add(task_name)
         elif child.tag == 'metatask':
-            all_metatasks_iterator = child.getiterator('metatask')
+            all_metatasks_iterator = child.iter('metatask')
             all_vars = dict() ; all_tasks = []
             for i,metatasks in enumerate(all_metatasks_iterator):
-                metatask_name = 'NO_NAME'
-                try:
-                    metatask_name = metatasks.attrib['name']
-                except:
-                    pass
+                metatask_name = metatasks.attrib.get('name','NO_NAME')
                 if list_tasks:
                     print ' '*i+'metatask:',metatask_name
-                all_vars_list = metatasks.findall('var')
-                all_tasks_list = metatasks.findall('task')
-                for var in all_vars_list:
-                    var_list_values = var.text.split()
-                    #print ' '+'  '*i+'(%d) var name:'%i,var.attrib['name'],var_list_values
-                    all_vars[var.attrib['name']] = var_list_values
-                for task in all_tasks_list:
+                for var in metatasks.findall('var'):
+                    all_vars[var.attrib['name']] = var.text.split()
+                for task in metatasks.findall('task'):
                     task_name = task.attrib['name']
                     task_log = task.find('join').find('cyclestr').text.replace( '@Y@m@d@H','CYCLE' )
-                    #if len(task_log) != 0:
-                    #   print 'LOG: %s %s'%( task_name, task_log)
-                    #print ' '+'  '*i+'(%d) task name:'%i,task.attrib['name']
                     if 'cycledefs' in task.attrib:
                         task_cycledefs = task.attrib['cycledefs']
-                        #if list_tasks:
-                        #   print 'task_cycledefs (meta):',task_cycledefs
                     else:
                         task_cycledefs = cycle_noname
                     all_tasks.append((task_name,task_cycledefs,task_log))
-                add_task = []
                 for task_name in all_tasks:
                     first_task_resolved = False
                     first_task_resolved_name = ''
-                    add_task[:] = []
-                    add_task.append(task_name)
+                    add_task = [task_name]
                     for name,vars in all_vars.iteritems():
                         replace_var = '#'+name+'#'
-                        #print 'TASK_NAME: %s | %s'%(task_name,replace_var)
                         for each_task_name in add_task:
-                        #for each_task_name in all_tasks:
                             if replace_var in each_task_name[0]:
                                 for var in vars:
                                     new_task_name = each_task_name[0].replace(replace_var, var)
                                     new_task_log = each_task_name[2].replace(replace_var, var)
                                     add_task.append((new_task_name,each_task_name[1],new_task_log))
                         for task in add_task:
-                            if '#' not in task[0]:
-                                if task[0] not in [ j[0] for j in tasks_ordered]:
-                                    tasks_ordered.append(task)
-                                    if not  first_task_resolved:
-                                        first_task_resolved = True
-                                        first_task_resolved_name = task[0]
-                                        if metatask_name == 'NO_NAME':
-                                            metatask_list[task[0]].append(task[0])
-                                        else:
-                                            metatask_list[task[0]].append(metatask_name)
-                                        metatask_list[task[0]].append(task[0])
-                                    else:
-                                        metatask_list[first_task_resolved_name].append(task[0])
-                                    if list_tasks:
-                                        print ' '+' '*i+task[0],task[1],'LOG:',task[2]
-
-    # Default expantion of metatasks True = collapsed
-    #for metatask,metatasks in metatask_list.iteritems():
-    #   metatask_list[metatask].append(True)
+                            if '#' in task[0] or task[0] in task_names:
+                                continue
+                            tasks_ordered.append(task)
+                            task_names.add(task[0])
+                            if not  first_task_resolved:
+                                first_task_resolved = True
+                                first_task_resolved_name = task[0]
+                                if metatask_name == 'NO_NAME':
+                                    metatask_list[task[0]].append(task[0])
+                                else:
+                                    metatask_list[task[0]].append(metatask_name)
+                                metatask_list[task[0]].append(task[0])
+                            else:
+                                metatask_list[first_task_resolved_name].append(task[0])
+                            if list_tasks:
+                                print ' '+' '*i+task[0],task[1],'LOG:',task[2]
+        root.clear()
 
     return tasks_ordered,metatask_list,cycledef_group_cycles
 
-def get_rocoto_stat(params, queue_stat):
+def split_metatask_list(metatask_list):
+    '''Splits a metatask_list from get_tasklist, in which each list holds
+    the metatask name followed by its tasks, into (metatask_name,
+    metatask_members) dicts keyed on the first task.  metatask_list itself
+    is left as it is, so the catalog, the checkpoint and every refresh all
+    carry the same form.'''
+    metatask_name = collections.defaultdict(list)
+    metatask_members = collections.defaultdict(list)
+    for first_task,tasks in metatask_list.iteritems():
+        metatask_name[first_task] = tasks[0]
+        metatask_members[first_task] = list(tasks[1:])
+    return metatask_name,metatask_members
+
+class RocotoStatEngine(object):
+    '''Keeps the per-(cycle,task) job state read from the Rocoto database
+    so that a refresh only pulls the job rows that are new since the last
+    refresh or that belong to a cycle which is still active.  Both are read
+    by row id, since the Rocoto jobs table has no index on the cycle.
+    Cycles that have not changed keep their formatted status lines and
+    their place in the status list from the last pass.'''
+
+    max_sql_variables = 900
+
+    def __init__(self, use_perf=False):
+        self.use_perf = use_perf
+        self.last_job_id = 0
+        self.cycle_done = dict()
+        self.cycle_strings = dict()
+        self.cycle_tasks = collections.defaultdict(dict)
+        self.cycle_jobids = collections.defaultdict(set)
+        self.cycle_rowids = collections.defaultdict(set)
+        self.jobid_owner = dict()
+        self.cycle_lines = dict()
+        self.task_key = None
+        self.task_groups = []
+        self.cycledef_sets = dict()
+        self.rocoto_stat = []
+        self.stat_position = dict()
+
+    def cycle_string(self, cycle):
+        if cycle not in self.cycle_strings:
+            self.cycle_strings[cycle] = datetime.datetime.fromtimestamp(cycle).strftime('%Y%m%d%H%M')
+        return self.cycle_strings[cycle]
+
+    def set_tasks(self, tasks_ordered, cycledef_group_cycles):
+        task_key = ( tuple(tasks_ordered),
+                     tuple(sorted( (group,len(cycles)) for group,cycles in cycledef_group_cycles.iteritems() )) )
+        if task_key == self.task_key:
+            return False
+        self.task_key = task_key
+        self.task_groups = [ (task[0], tuple(task[1].split(','))) for task in tasks_ordered ]
+        self.cycledef_sets = dict( (group,cycles if isinstance(cycles,CycleDefRanges) else set(cycles))
+                                   for group,cycles in cycledef_group_cycles.iteritems() )
+        return True
+
+    def format_line(self, row):
+        row = tuple('-' if x is None else x for x in row)
+        if self.use_perf:
+            (theid,jobid,taskname,cycle,state,exit_status,duration,tries,qtime,cputime,runtime,slots)=row
+            return '%s %s %s %s %s %s %s %s %s %s %s'%(self.cycle_string(cycle),taskname,str(jobid),str(state),str(exit_status),str(tries),str(duration).split('.')[0],str(slots),str(qtime),str(cputime).split('.')[0],str(runtime))
+        (theid,jobid,taskname,cycle,state,exit_status,duration,tries)=row
+        return '%s %s %s %s %s %s %s'%(self.cycle_string(cycle),taskname,str(jobid),str(state),str(exit_status),str(tries),str(duration).split('.')[0])
+
+    def forget_cycle(self, cycle):
+        for jobid in self.cycle_jobids.pop(cycle,()):
+            del self.jobid_owner[jobid]
+        self.cycle_rowids.pop(cycle,None)
+        self.cycle_tasks.pop(cycle,None)
+        self.cycle_lines.pop(cycle,None)
+
+    def render_cycle(self, cycle):
+        cycle_string = self.cycle_string(cycle)
+        tasks = self.cycle_tasks.get(cycle,{})
+        in_groups = set( group for group,cycles in self.cycledef_sets.iteritems() if cycle_string in cycles )
+        lines = []
+        for taskname,groups in self.task_groups:
+            if in_groups.isdisjoint(groups):
+                continue
+            if taskname in tasks:
+                lines.append(tasks[taskname][1])
+            else:
+                lines.append(cycle_string+' '*7+taskname+' - - - - -')
+        self.cycle_lines[cycle] = lines
+
+    def refresh(self, c, tasks_ordered, cycledef_group_cycles, changed_jobids=()):
+        '''Brings the engine up to date with the database behind cursor c
+        and returns the per-cycle status lines, oldest cycle first.  Cycles
+        holding one of changed_jobids, whose performance metrics were
+        updated, are read again even if they are done.'''
+        rerender_all = self.set_tasks(tasks_ordered, cycledef_group_cycles)
+
+        cycle_rows = c.execute('SELECT cycle,done FROM cycles').fetchall()
+        cycle_done = dict(cycle_rows)
+        changed_cycles = set( cycle for cycle,done in set(cycle_rows).symmetric_difference(self.cycle_done.iteritems()) )
+        added = set( cycle for cycle in changed_cycles if cycle not in self.cycle_done )
+        removed = set( cycle for cycle in changed_cycles if cycle not in cycle_done )
+        reread = changed_cycles - removed
+        reread.update( row[0] for row in c.execute('SELECT cycle FROM cycles WHERE done IS NULL OR done=0') )
+        for jobid in changed_jobids:
+            if jobid in self.jobid_owner:
+                reread.add(self.jobid_owner[jobid])
+        rowids = []
+        for cycle in reread:
+            rowids.extend(self.cycle_rowids.get(cycle,()))
+        for cycle in removed | reread:
+            self.forget_cycle(cycle)
+        self.cycle_done = cycle_done
+
+        columns = 'jobs.id,jobs.jobid,jobs.taskname,jobs.cycle,jobs.state,jobs.exit_status,jobs.duration,jobs.tries'
+        table = 'jobs'
+        if self.use_perf:
+            columns += ',jobs_perf.qtime,jobs_perf.cputime,jobs_perf.runtime,jobs_perf.slots'
+            table += ' LEFT JOIN jobs_perf ON jobs_perf.jobid=jobs.jobid'
+        select = 'SELECT %s FROM %s WHERE '%(columns,table)
+        rows = c.execute(select+'jobs.id > ?', (self.last_job_id,)).fetchall()
+        for i in xrange(0,len(rowids),self.max_sql_variables):
+            chunk = rowids[i:i+self.max_sql_variables]
+            rows.extend( c.execute(select+'jobs.id IN (%s)'%','.join('?'*len(chunk)), chunk) )
+        rows.sort(key=lambda row: row[0])
+
+        touched = set(reread)
+        for row in rows:
+            theid, jobid, taskname, cycle = row[:4]
+            if theid > self.last_job_id:
+                self.last_job_id = theid
+            self.cycle_rowids[cycle].add(theid)
+            if jobid is None or jobid in self.jobid_owner:
+                continue
+            self.jobid_owner[jobid] = cycle
+            self.cycle_jobids[cycle].add(jobid)
+            tasks = self.cycle_tasks[cycle]
+            if taskname not in tasks:
+                tasks[taskname] = (theid,self.format_line(row))
+            touched.add(cycle)
+
+        if not rerender_all and not added and not removed:
+            rocoto_stat = list(self.rocoto_stat)
+            for cycle in touched:
+                if cycle not in cycle_done:
+                    continue
+                self.render_cycle(cycle)
+                position = self.stat_position.get(cycle)
+                if position is None and len(self.cycle_lines[cycle]) == 0:
+                    continue
+                if position is None or len(self.cycle_lines[cycle]) == 0:
+                    break
+                rocoto_stat[position] = self.cycle_lines[cycle]
+            else:
+                self.rocoto_stat = rocoto_stat
+                return rocoto_stat
+
+        rocoto_stat = []
+        self.stat_position = dict()
+        for cycle in sorted(cycle_done):
+            if rerender_all or cycle in touched or cycle not in self.cycle_lines:
+                self.render_cycle(cycle)
+            if len(self.cycle_lines[cycle]) != 0:
+                self.stat_position[cycle] = len(rocoto_stat)
+                rocoto_stat.append(self.cycle_lines[cycle])
+        self.rocoto_stat = rocoto_stat
+        return rocoto_stat
+
+class CheckpointError(Exception):
+    '''The checkpoint file is not in the binary format or is partly written.'''
+
+class CheckpointFile(object):
+    '''Versioned, columnar checkpoint of the workflow status.
+
+    The file is a header followed by appended records, each a type byte,
+    a length and a payload, and ends with a trailer pointing at the last
+    index record.  Strings (task names, states and any value that is not a
+    small integer) are coded as integers through an appendable string
+    table.  Each cycle is one record with a row-kind array and the field
+    codes of all its rows stored column by column.  A refresh only appends
+    the strings and cycles that changed plus a new index, and a reader
+    mmaps the file and decodes only the cycles it is asked for.'''
+
+    magic = 'RVCKPT\0\0'
+    trailer_magic = 'RVCKEND\0'
+    version = 1
+    header_format = '<8sI'
+    record_format = '<cI'
+    trailer_format = '<Q8s'
+    index_format = '<IIQI20s'
+    index_entry_format = '<12sQII'
+    cycle_format = '<12sIB'
+    max_literal = 2**31-1
+
+    ROW_JOB = 0
+    ROW_PLACEHOLDER = 1
+    ROW_RAW = 2
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.strings = []
+        self.string_codes = dict()
+        self.string_offsets = []
+        self.index = collections.OrderedDict()
+        self.catalog_offset = 0
+        self.catalog_crc = 0
+        self.stat_update_time = ''
+        self.cycles = dict()
+        self.mapped = None
+        self.size = 0
+
+    def open(self):
+        '''Maps an existing checkpoint and reads its index and string table.'''
+        self.__init__(self.filename)
+        with open(self.filename,'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size < struct.calcsize(self.header_format)+struct.calcsize(self.trailer_format):
+                raise CheckpointError('%s: too short for a checkpoint'%self.filename)
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from(self.header_format, self.mapped, 0)
+        if magic != self.magic:
+            raise CheckpointError('%s: not a binary checkpoint'%self.filename)
+        if version != self.version:
+            raise CheckpointError('%s: checkpoint version %d is not %d'%(self.filename,version,self.version))
+        index_offset, trailer = struct.unpack_from(self.trailer_format, self.mapped, self.size-struct.calcsize(self.trailer_format))
+        if trailer != self.trailer_magic or index_offset >= self.size:
+            raise CheckpointError('%s: checkpoint is being written'%self.filename)
+        kind, payload, length = self.read_record(index_offset)
+        if kind != 'I':
+            raise CheckpointError('%s: bad checkpoint index'%self.filename)
+        ncycles, nstrings, self.catalog_offset, self.catalog_crc, stat_update_time = \
+            struct.unpack_from(self.index_format, self.mapped, payload)
+        self.stat_update_time = stat_update_time.rstrip('\0')
+        position = payload + struct.calcsize(self.index_format)
+        self.string_offsets = list(struct.unpack_from('<%dQ'%nstrings, self.mapped, position))
+        position += 8*nstrings
+        entry_size = struct.calcsize(self.index_entry_format)
+        for n in xrange(ncycles):
+            cycle_string, offset, crc, length = struct.unpack_from(self.index_entry_format, self.mapped, position)
+            self.index[cycle_string.rstrip('\0')] = (offset, crc, length)
+            position += entry_size
+        for offset in self.string_offsets:
+            self.read_strings(offset)
+        return self
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+    def read_record(self, offset):
+        kind, length = struct.unpack_from(self.record_format, self.mapped, offset)
+        payload = offset + struct.calcsize(self.record_format)
+        if payload + length > self.size:
+            raise CheckpointError('%s: truncated checkpoint record'%self.filename)
+        return kind, payload, length
+
+    def read_strings(self, offset):
+        kind, position, length = self.read_record(offset)
+        (count,) = struct.unpack_from('<I', self.mapped, position)
+        position += 4
+        for n in xrange(count):
+            (length,) = struct.unpack_from('<I', self.mapped, position)
+            position += 4
+            self.add_string(self.mapped[position:position+length])
+            position += length
+
+    def add_string(self, string):
+        self.string_codes[string] = len(self.strings)
+        self.strings.append(string)
+
+    def encode(self, value, new_strings):
+        if value.isdigit() and (value == '0' or value[0] != '0') and len(value) <= 10 and int(value) <= self.max_literal:
+            return int(value)
+        if value not in self.string_codes:
+            self.add_string(value)
+            new_strings.append(value)
+        return -1-self.string_codes[value]
+
+    def decode(self, code):
+        if code >= 0:
+            return str(code)
+        return self.strings[-1-code]
+
+    def encode_column(self, column, new_strings):
+        try:
+            codes = array.array('i', map(int, column))
+            if min(codes) >= 0 and map(str, codes) == list(column):
+                return codes
+        except (ValueError,OverflowError):
+            pass
+        indexes = map(self.string_codes.get, column)
+        if None in indexes:
+            return array.array('i', [ self.encode(value, new_strings) for value in column ])
+        return array.array('i', [ -1-i for i in indexes ])
+
+    def cycle_text(self, lines):
+        text = '\n'.join(lines)
+        if isinstance(text,unicode):
+            text = text.encode('utf-8')
+        return text
+
+    def encode_cycle(self, text, new_strings):
+        lines = text.split('\n')
+        rows = map(str.split, lines)
+        cycle_string = rows[0][0][:12]
+        nfields = max(1, max(map(len, rows))-1)
+        kinds = array.array('B', [self.ROW_JOB]) * len(rows)
+        columns = None
+        if len(set(map(len, rows))) == 1 and map(' '.join, rows) == lines:
+            columns = zip(*rows)
+            if set(columns[0]) != set([cycle_string]):
+                columns = None
+        if columns is None:
+            padded = []
+            for r,fields in enumerate(rows):
+                line = lines[r]
+                if len(fields) == 7 and fields[0] == cycle_string and line == cycle_string+' '*7+fields[1]+' - - - - -':
+                    kinds[r] = self.ROW_PLACEHOLDER
+                    fields = fields[:2]
+                elif len(fields) != nfields+1 or fields[0] != cycle_string or ' '.join(fields) != line:
+                    kinds[r] = self.ROW_RAW
+                    fields = [cycle_string, line]
+                padded.append( fields + ['0']*(nfields+1-len(fields)) )
+            columns = zip(*padded)
+        codes = array.array('i')
+        for column in columns[1:]:
+            codes.extend( self.encode_column(column, new_strings) )
+        return struct.pack(self.cycle_format, cycle_string, len(rows), nfields) + kinds.tostring() + codes.tostring()
+
+    def encode_changed(self, texts):
+        '''Encodes the cycles whose text differs from the indexed one.'''
+        new_strings = []
+        cycles = dict()
+        for cycle_string,text in texts.iteritems():
+            crc = zlib.crc32(text) & 0xffffffff
+            if cycle_string not in self.index or self.index[cycle_string][1] != crc:
+                cycles[cycle_string] = (self.encode_cycle(text, new_strings), crc)
+        return new_strings, cycles
+
+    def cycle_lines(self, cycle_string):
+        '''Decodes the status lines of one cycle.'''
+        if cycle_string in self.cycles:
+            return self.cycles[cycle_string]
+        kind, position, length = self.read_record(self.index[cycle_string][0])
+        cycle_string, nrows, nfields = struct.unpack_from(self.cycle_format, self.mapped, position)
+        cycle_string = cycle_string.rstrip('\0')
+        position += struct.calcsize(self.cycle_format)
+        kinds = array.array('B', self.mapped[position:position+nrows])
+        position += nrows
+        codes = array.array('i', self.mapped[position:position+4*nrows*nfields])
+        columns = []
+        for f in xrange(nfields):
+            column = codes[f*nrows:(f+1)*nrows]
+            if min(column) >= 0:
+                columns.append( map(str, column) )
+            else:
+                columns.append( map(self.decode, column) )
+        prefix = cycle_string+' '
+        lines = [ prefix+line for line in map(' '.join, zip(*columns)) ]
+        if kinds.count(self.ROW_JOB) != nrows:
+            for r in xrange(nrows):
+                if kinds[r] == self.ROW_PLACEHOLDER:
+                    lines[r] = cycle_string+' '*7+columns[0][r]+' - - - - -'
+                elif kinds[r] == self.ROW_RAW:
+                    lines[r] = columns[0][r]
+        self.cycles[cycle_string] = lines
+        return lines
+
+    def catalog(self):
+        '''Returns (tasks_ordered, metatask_list, cycledef_group_cycles).'''
+        kind, position, length = self.read_record(self.catalog_offset)
+        catalog = json.loads(self.mapped[position:position+length])
+        tasks_ordered = [ tuple(task) for task in catalog['tasks_ordered'] ]
+        metatask_list = collections.defaultdict(list)
+        for metatask,tasks in catalog['metatask_list']:
+            metatask_list[metatask] = tasks
+        cycledef_group_cycles = collections.defaultdict(CycleDefRanges)
+        for group,ranges,cycles in catalog['cycledefs']:
+            cycledef_group_cycles[group].ranges = [ tuple(cycle_range) for cycle_range in ranges ]
+            cycledef_group_cycles[group].cycles = set(cycles)
+        return tasks_ordered, metatask_list, cycledef_group_cycles
+
+    def encode_catalog(self, tasks_ordered, metatask_list, cycledef_group_cycles):
+        cycledefs = []
+        for group,cycles in sorted(cycledef_group_cycles.iteritems()):
+            if isinstance(cycles,CycleDefRanges):
+                cycledefs.append( (group, cycles.ranges, sorted(cycles.cycles)) )
+            else:
+                cycledefs.append( (group, [], sorted(cycles)) )
+        return json.dumps( { 'tasks_ordered':tasks_ordered,
+                             'metatask_list':sorted(metatask_list.iteritems()),
+                             'cycledefs':cycledefs }, sort_keys=True )
+
+    def write(self, rocoto_stat, tasks_ordered, metatask_list, cycledef_group_cycles, stat_update_time):
+        '''Appends the cycles, strings and catalog that changed since the
+        last write, followed by a new index.  A cycle is only encoded when
+        the CRC of its text differs from the indexed one.  The file is
+        rewritten from scratch when it is missing, in another format, or
+        when superseded records make up more than half of it.'''
+        try:
+            self.open()
+            fresh = False
+        except (IOError,OSError,CheckpointError,struct.error):
+            self.__init__(self.filename)
+            fresh = True
+        self.close()
+
+        texts = collections.OrderedDict()
+        for lines in rocoto_stat:
+            if len(lines) != 0:
+                text = self.cycle_text(lines)
+                texts[text.split(None,1)[0][:12]] = text
+        catalog = self.encode_catalog(tasks_ordered, metatask_list, cycledef_group_cycles)
+        new_strings, cycles = self.encode_changed(texts)
+        live = len(catalog) + sum( len(cycles[cycle_string][0]) if cycle_string in cycles else self.index[cycle_string][2]
+                                   for cycle_string in texts )
+        if not fresh and self.size > 2*live + 65536:
+            self.__init__(self.filename)
+            fresh = True
+            new_strings, cycles = self.encode_changed(texts)
+
+        if fresh:
+            temp_file = tempfile.NamedTemporaryFile(prefix=basename(self.filename)+'.', dir=dirname(realpath(self.filename)), delete=False)
+            out = temp_file
+            out.write(struct.pack(self.header_format, self.magic, self.version))
+        else:
+            out = open(self.filename,'r+b')
+            out.seek(0,os.SEEK_END)
+
+        def append(kind, payload):
+            offset = out.tell()
+            out.write(struct.pack(self.record_format, kind, len(payload)))
+            out.write(payload)
+            return offset
+
+        try:
+            if len(new_strings) != 0:
+                payload = [struct.pack('<I',len(new_strings))]
+                for string in new_strings:
+                    payload.append(struct.pack('<I',len(string)))
+                    payload.append(string)
+                self.string_offsets.append( append('S',''.join(payload)) )
+            catalog_crc = zlib.crc32(catalog) & 0xffffffff
+            if fresh or catalog_crc != self.catalog_crc:
+                self.catalog_offset = append('K',catalog)
+                self.catalog_crc = catalog_crc
+            index = collections.OrderedDict()
+            for cycle_string in texts:
+                if cycle_string in cycles:
+                    payload, crc = cycles[cycle_string]
+                    index[cycle_string] = (append('C',payload), crc, len(payload))
+                else:
+                    index[cycle_string] = self.index[cycle_string]
+            self.index = index
+            payload = [ struct.pack(self.index_format, len(index), len(self.string_offsets), self.catalog_offset, self.catalog_crc, stat_update_time[:20]),
+                        struct.pack('<%dQ'%len(self.string_offsets), *self.string_offsets) ]
+            for cycle_string,(offset,crc,length) in index.iteritems():
+                payload.append( struct.pack(self.index_entry_format, cycle_string, offset, crc, length) )
+            index_offset = append('I',''.join(payload))
+            out.write(struct.pack(self.trailer_format, index_offset, self.trailer_magic))
+            out.close()
+            if fresh:
+                os.rename(temp_file.name, self.filename)
+        except:
+            out.close()
+            if fresh:
+                os.remove(temp_file.name)
+            raise
+        self.cycles = dict()
+
+class CheckpointCycles(object):
+    '''Sequence of per-cycle status lines backed by a CheckpointFile, which
+    only decodes a cycle when it is indexed.'''
+
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.cycle_strings = list(checkpoint.index)
+
+    def __len__(self):
+        return len(self.cycle_strings)
+
+    def __getitem__(self, i):
+        return self.checkpoint.cycle_lines(self.cycle_strings[i])
+
+    def __iter__(self):
+        for cycle_string in self.cycle_strings:
+            yield self.checkpoint.cycle_lines(cycle_string)
+
+def read_checkpoint(filename):
+    '''Opens a checkpoint file and returns the same (rocoto_stat,
+    tasks_ordered, metatask_list, cycledef_group_cycles, stat_update_time)
+    tuple that get_rocoto_stat saved.  Checkpoints pickled by older viewers
+    are still read.'''
+    with open(filename,'rb') as savefile:
+        if savefile.read(len(CheckpointFile.magic)) != CheckpointFile.magic:
+            savefile.seek(0)
+            return cPickle.load(savefile)
+    checkpoint = CheckpointFile(filename).open()
+    return (CheckpointCycles(checkpoint),) + checkpoint.catalog() + (checkpoint.stat_update_time,)
+def get_rocoto_stat(params, update_perf=True, changed_jobids=()):
     workflow_file, database_file, tasks_ordered, metatask_list, cycledef_group_cycles = params
 
     global temp_workflow_file
     global database_file_agmented
     if len(tasks_ordered) == 0 or len(metatask_list) == 0 or len(cycledef_group_cycles) == 0 or list_tasks:
-        tasks_ordered, metatask_list,cycledef_group_cycles  = get_tasklist(temp_workflow_file)
-
-    if use_performance_metrics:
-        aug_perf = get_aug_perf_values(get_user)
-    else:
-        aug_perf = None
-
-    info=collections.defaultdict(list)
-    cycles=set()
+        tasks_ordered, metatask_list,cycledef_group_cycles  = load_task_catalog(workflow_file, temp_workflow_file)
 
     connection=sqlite3.connect(database_file)
     c=connection.cursor()
 
-    if use_performance_metrics:
-        q=c.execute("DROP TABLE IF EXISTS jobs_augment_tmp;")
-        sql_create_augment_table = "CREATE TABLE jobs_augment_tmp AS SELECT * FROM jobs;"
-        q=c.execute(sql_create_augment_table)
-        q=c.execute("alter table jobs_augment_tmp add column qtime integer;")
-        q=c.execute("alter table jobs_augment_tmp add column cputime integer;")
-        q=c.execute("alter table jobs_augment_tmp add column runtime integer;")
-        q=c.execute("alter table jobs_augment_tmp add column slots integer;")
-
-        sq_command = ''
-        column_updates = ('qtime','cputime','runtime','slots')
-        sqlite_merge_command = "%s=(SELECT jobs_augment.%s FROM jobs_augment WHERE jobs_augment.id=jobs_augment_tmp.id)"
-        for column in column_updates:
-            sq_command += sqlite_merge_command%(column,column)+','
-        sq_command=';'.join(sq_command.rsplit(',', 1))
-        sq_command = 'UPDATE jobs_augment_tmp SET '+sq_command
-        q=c.execute(sq_command)
-
-        sq_command = 'UPDATE jobs_augment_tmp SET '
-        sqlite_update_command = "%s = '%s' WHERE jobs_augment_tmp.jobid = %s"
-        #debug.write('WRITING TO DATABASE'+'\n')
-        for perf_jobid,perf_values in aug_perf.iteritems():
-            for name,each_value in perf_values.iteritems():
-                 q=c.execute(sq_command+sqlite_update_command%(name,each_value,perf_jobid))
-                #debug.write('SQL: '+sq_command+sqlite_update_command%(name,each_value,perf_jobid+'\n'))
-
-        qinfo=c.execute("DROP TABLE IF EXISTS jobs_augment;")
-        qinfo=c.execute("ALTER TABLE jobs_augment_tmp RENAME TO jobs_augment;")
+    if use_performance_metrics and update_perf:
+        changed_jobids = set(changed_jobids) | update_perf_table( c, get_user )
 
     cycledifitions = []
     q=c.execute('SELECT id, groupname, cycledef FROM cycledef')
@@ -898,129 +1468,132 @@ def get_rocoto_stat(params, queue_stat):
         (theid, groupname, cycledef) = row
         cycledifitions.append( (theid, groupname, cycledef) )
         
-    cycle_done_stat = dict()
-    q=c.execute('SELECT id,cycle,done FROM cycles')
-    for row in q:
-        (theid,cycle,done)=row
-        cycles.add(cycle)
-        cycle_done_stat[cycle]=done
-
-    if use_performance_metrics:
-        q=c.execute('SELECT id,jobid,taskname,cycle,state,exit_status,duration,tries,qtime,cputime,runtime,slots FROM jobs_augment')
-    else:
-        q=c.execute('SELECT id,jobid,taskname,cycle,state,exit_status,duration,tries FROM jobs')
-        
-    q_get = []
-    entered_jobids = []
-    last_task_index = 0
-    for row in q:
-        row = tuple('-' if x is None else x for x in row)
-        if use_performance_metrics:
-            (theid, jobid,taskname,cycle,state,exit_status,duration,tries,qtime,cputime,runtime,slots)=row
-        else:
-            (theid, jobid,taskname,cycle,state,exit_status,duration,tries,)=row
-        if jobid in entered_jobids:
-            continue
-        else:
-            if taskname in tasks_ordered:
-                task_index = [x[0] for x in task_ordered].index(taskname)
-                #task_index = tasks_ordered.index(taskname)
-                last_task_index = task_index
-            else:
-                task_index = last_task_index
-            
-            if use_performance_metrics:
-                q_get.append( (theid,jobid,task_index,taskname,cycle,state,exit_status,duration,tries,qtime,cputime,runtime,slots) )
-            else:
-                q_get.append( (theid,jobid,task_index,taskname,cycle,state,exit_status,duration,tries) )
-        entered_jobids.append(jobid)
-
-    q_get.sort( key=lambda x: x[2] )
+    global rocoto_stat_engine
+    if rocoto_stat_engine is None:
+        rocoto_stat_engine = RocotoStatEngine( use_performance_metrics )
+    rocoto_stat = rocoto_stat_engine.refresh( c, tasks_ordered, cycledef_group_cycles, changed_jobids )
 
     connection.commit()
     c.close()
 
-    for row in q_get:
-        if use_performance_metrics:
-            (theid,jobid,task_order,taskname,cycle,state,exit_status,duration,tries,qtime,cputime,runtime,slots)=row
-        else:
-            (theid,jobid,task_order,taskname,cycle,state,exit_status,duration,tries)=row
-        if jobid != '-':
-            if use_performance_metrics:
-                line = '%s %s %s %s %s %s %s %s %s %s %s'%(datetime.datetime.fromtimestamp(cycle).strftime('%Y%m%d%H%M'),taskname,str(jobid),str(state),str(exit_status),str(tries),str(duration).split('.')[0],str(slots),str(qtime),str(cputime).split('.')[0],str(runtime))
-            else:
-                line = '%s %s %s %s %s %s %s'%(datetime.datetime.fromtimestamp(cycle).strftime('%Y%m%d%H%M'),taskname,str(jobid),str(state),str(exit_status),str(tries),str(duration).split('.')[0])
-            #debug.write('LINE: '+line+'\n')
-            info[cycle].append(line)
-
-    for every_cycle in cycles:
-        if len(info[every_cycle]) == 0:
-            info[every_cycle].append('place holder')
-
-    new_info=collections.defaultdict(list)
-    job_ids = []
-    job_id = ''
-    for each_cycle,lines_in_cycle in info.iteritems():
-        for task in tasks_ordered:
-            skip_task = False
-            for each_line in lines_in_cycle:
-                if task[0] == each_line.split()[1]:
-                #if task[0]+' ' in each_line:
-                    job_id = each_line.split()[2]
-                    if job_id in job_ids:
-                        break
-                    cycle_string = datetime.datetime.fromtimestamp(each_cycle).strftime('%Y%m%d%H%M')
-                    #print 'TESTB:', len(task), task[0],task[1]
-                    cycledefs = task[1].split(',')
-                    if len(cycledefs) > 1:
-                        #print 'Checking if %s for %s is in a gfs cycle:'%(task[0],cycle_string)
-                        for each_cycledef in cycledefs:
-                            #print 'group:', each_cycledef, cycledef_group_cycles[each_cycledef]
-                            if cycle_string in cycledef_group_cycles[each_cycledef]:
-                                #print 'Found:', task[0],'with cycle',cycle_string
-                                new_info[each_cycle].append(each_line)
-                                job_ids.append(job_id)
-                                skip_task = True
-                                break
-                    elif cycle_string in cycledef_group_cycles[task[1]]:
-                        new_info[each_cycle].append(each_line)
-                        job_ids.append(job_id)
-                        skip_task = True
-                        break
-            if skip_task:
-                continue    
-            line = datetime.datetime.fromtimestamp(each_cycle).strftime('%Y%m%d%H%M')+' '*7+task[0]+' - - - - -'
-            cycle_string = datetime.datetime.fromtimestamp(each_cycle).strftime('%Y%m%d%H%M')
-            cycledefs = task[1].split(',')
-            if len(cycledefs) > 1:
-                for each_cycledef in cycledefs:
-                    if cycle_string in cycledef_group_cycles[each_cycledef]:
-                        new_info[each_cycle].append(line)
-                        skip_task = True
-                        break
-            elif cycle_string in cycledef_group_cycles[task[1]]:
-                new_info[each_cycle].append(line)
-                skip_task = True
-            if skip_task:
-                continue
-
-    rocoto_stat = []
-    for cycle in sorted(cycles):
-        if len(new_info[cycle]) != 0:
-            rocoto_stat.append(new_info[cycle])
-
     if save_checkfile_path is not None:
         stat_update_time = str(datetime.datetime.now()).rsplit(':',1)[0]
-        with open(save_checkfile_path, 'w') as savefile:
-            rocoto_data_and_time = (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles, stat_update_time)
-            cPickle.dump(rocoto_data_and_time, savefile)
+        CheckpointFile(save_checkfile_path).write(rocoto_stat, tasks_ordered, metatask_list, cycledef_group_cycles, stat_update_time)
         if only_check_point:
             sys.exit(0)
 
-    if use_multiprocessing:
-        queue_stat.put((rocoto_stat, tasks_ordered, metatask_list, cycledef_group_cycles))
-    else:
-        return (rocoto_stat, tasks_ordered, metatask_list, cycledef_group_cycles)
+    return (rocoto_stat, tasks_ordered, metatask_list, cycledef_group_cycles)
+
+class RefreshWorker(threading.Thread):
+    '''Background refresh of the workflow status for the curses loop.  The
+    Rocoto database, bjobs and the checkpoint file are polled on their own
+    schedules and each new status is pushed onto the results queue along
+    with the indexes of the cycles that changed.  Refresh requests that
+    arrive while another one is pending are coalesced into one.'''
+
+    def __init__(self, params, checkpoint_mtime=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.params = params
+        self.results = ThreadQueue()
+        self.condition = threading.Condition()
+        self.pending = set()
+        self.stopped = False
+        self.busy = False
+        self.changed_jobids = set()
+        self.rocoto_stat = []
+        self.checkpoint_mtime = checkpoint_mtime
+        now = time()
+        self.due = { 'stat':now }
+        if use_performance_metrics:
+            self.due['perf'] = now
+        if save_checkfile_path is not None:
+            self.due['checkpoint'] = now + checkpoint_poll_delay
+
+    def request(self, kind='stat'):
+        with self.condition:
+            self.pending.add(kind)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def next_work(self):
+        with self.condition:
+            while not self.stopped:
+                now = time()
+                work = self.pending | set( kind for kind,when in self.due.iteritems() if when <= now )
+                if len(work) != 0:
+                    self.pending = set()
+                    return work
+                self.condition.wait( min(self.due.itervalues()) - now )
+        return None
+
+    def run(self):
+        while True:
+            work = self.next_work()
+            if work is None:
+                return
+            self.busy = True
+            try:
+                if 'run' in work:
+                    rocoto_run( self.params[:2] )
+                    work.add('stat')
+                if 'perf' in work:
+                    self.poll_perf()
+                if 'checkpoint' in work:
+                    self.poll_checkpoint()
+                if 'stat' in work or len(self.changed_jobids) != 0:
+                    self.poll_stat()
+            except Exception as e:
+                self.results.put( ('error',str(e)) )
+            finally:
+                self.busy = False
+
+    def push(self, rocoto_stat, tasks_ordered, metatask_list, cycledef_group_cycles, stat_update_time):
+        if len(rocoto_stat) == len(self.rocoto_stat):
+            changed = set( i for i,lines in enumerate(rocoto_stat)
+                           if lines is not self.rocoto_stat[i] and lines != self.rocoto_stat[i] )
+        else:
+            changed = None
+        self.rocoto_stat = rocoto_stat
+        self.params = self.params[:2] + (tasks_ordered, metatask_list, cycledef_group_cycles)
+        self.results.put( ('stat',(rocoto_stat, tasks_ordered, metatask_list, cycledef_group_cycles), changed, stat_update_time) )
+
+    def poll_perf(self):
+        self.due['perf'] = time() + bjobs_cache_ttl
+        connection=sqlite3.connect(self.params[1])
+        c=connection.cursor()
+        self.changed_jobids |= update_perf_table( c, get_user )
+        connection.commit()
+        c.close()
+
+    def poll_stat(self):
+        changed_jobids = self.changed_jobids
+        self.changed_jobids = set()
+        stat = get_rocoto_stat( self.params, update_perf=False, changed_jobids=changed_jobids )
+        self.due['stat'] = time() + stat_read_time_delay
+        if save_checkfile_path is not None and os.path.exists(save_checkfile_path):
+            self.checkpoint_mtime = os.stat(save_checkfile_path).st_mtime
+        self.push( *(stat + (str(datetime.datetime.now()).rsplit(':',1)[0],)) )
+
+    def poll_checkpoint(self):
+        self.due['checkpoint'] = time() + checkpoint_poll_delay
+        if not os.path.exists(save_checkfile_path):
+            return
+        mtime = os.stat(save_checkfile_path).st_mtime
+        if mtime == self.checkpoint_mtime:
+            return
+        try:
+            rocoto_data_and_time = read_checkpoint(save_checkfile_path)
+        except CheckpointError:
+            return
+        self.checkpoint_mtime = mtime
+        self.rocoto_stat = []
+        self.push( *rocoto_data_and_time )
+        self.rocoto_stat = []
             
 
 def display_results(results,screen,params):
@@ -1084,12 +1657,25 @@ def display_results(results,screen,params):
 
     return
 
+def stat_header(header_string, stat_update_time):
+    header = header_string.replace('t'*16,stat_update_time)
+    if PSLOT.lower() == 'no_name':
+        return header.replace(' PSLOT: pslot ','==============')
+    elif PACKAGE.lower() == 'ugcs':
+        return header.replace(' PSLOT: pslot ','==== UGCS ====')
+    header = header.replace('pslot',PSLOT)
+    reduce_header_size = int((len(PSLOT)-len('PSLOT'))/2)
+    if reduce_header_size > 0:
+        header = header[:-reduce_header_size]
+        header = header[reduce_header_size:]
+    return header
+
 def main(screen):
 
     global mlines
     global mcols
     global default_column_length
-    global use_multiprocessing
+    global use_background_refresh
     global highlightText
     global highlightSelectedText
     global normalText
@@ -1123,7 +1709,7 @@ def main(screen):
         if sys.stdin.isatty():
             curses.endwin()
         print '\nPreparing to write out an html folder'
-        use_multiprocessing = False
+        use_background_refresh = False
 
     import produtil.run, produtil.numerics
     from produtil.run import run,runstr, batchexe
@@ -1137,7 +1723,6 @@ def main(screen):
     aug_perf = collections.defaultdict(dict)
     if use_performance_metrics:
         result = augment_SQLite3( database_file )
-        aug_perf = get_aug_perf_values(get_user)
         header_string += '  SLOTS   QTIME    CPU    RUN\n'
         header_string_under += '=============================\n'
         header_string += header_string_under
@@ -1254,7 +1839,6 @@ def main(screen):
     metatask_list = collections.defaultdict(list)
     cycledef_group_cycles = collections.defaultdict(list)
 
-    queue_stat = Queue()
     queue_check = Queue()
 
     if only_check_point:
@@ -1262,13 +1846,14 @@ def main(screen):
         sys.stdout = os.fdopen(0,'w',0)
         print 'Creating check point file ...'
         params = (workflow_file, database_file, tasks_ordered, metatask_list, cycledef_group_cycles )
-        get_rocoto_stat( params, queue_stat )
+        get_rocoto_stat( params )
 
     stat_update_time = ''
     params_check = ''
     header = None
 
-    process_get_rocoto_stat = None
+    refresh_worker = None
+    checkpoint_mtime = None
     process_get_rocoto_check = None
 
     cycle = 0
@@ -1282,35 +1867,33 @@ def main(screen):
         sys.exit(-1)
     if not html_output:
         screen.refresh()
-    rocoto_stat_params = ''
-    rocoto_stat_params_tmp = ''
-    step = 0.0 ; i = 0
+    i = 0
     dots = ('.    ','..   ','...  ','.... ','.....',' ....','  ...','    .')
     dot_stat = 0 ; dot_check = 0 
     current_time = time()
     meta_tasklist = collections.defaultdict(list)
 
     if save_checkfile_path is not None and check_file(save_checkfile_path):
-        with open(save_checkfile_path) as savefile:
-            rocoto_data_and_time = cPickle.load(savefile)
-            rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles, stat_update_time = rocoto_data_and_time
-            start_time = time() - stat_read_time_delay - 10
-            header = header_string
-            header = header.replace('t'*16,stat_update_time)
-            if PACKAGE.lower() == 'ugcs':
-                header = header.replace(' PSLOT: pslot ','==== UGCS ====')
-            elif PSLOT.lower() == 'no_name':
-                header = header.replace(' PSLOT: pslot ','==============')
-                reduce_header_size = 0
-            else:
-                header = header.replace(' PSLOT: pslot ','==== UGCS ====')
-                reduce_header_size = 0
-            if reduce_header_size > 0:
-                header = header[:-reduce_header_size]
-                header = header[reduce_header_size:]
+        checkpoint_mtime = os.stat(save_checkfile_path).st_mtime
+        rocoto_data_and_time = read_checkpoint(save_checkfile_path)
+        rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles, stat_update_time = rocoto_data_and_time
+        start_time = time() - stat_read_time_delay - 10
+        header = header_string
+        header = header.replace('t'*16,stat_update_time)
+        if PACKAGE.lower() == 'ugcs':
+            header = header.replace(' PSLOT: pslot ','==== UGCS ====')
+        elif PSLOT.lower() == 'no_name':
+            header = header.replace(' PSLOT: pslot ','==============')
+            reduce_header_size = 0
+        else:
+            header = header.replace(' PSLOT: pslot ','==== UGCS ====')
+            reduce_header_size = 0
+        if reduce_header_size > 0:
+            header = header[:-reduce_header_size]
+            header = header[reduce_header_size:]
     if list_tasks:
         params = (workflow_file, database_file, tasks_ordered, metatask_list, cycledef_group_cycles )
-        get_rocoto_stat( params, Queue() )
+        get_rocoto_stat( params )
         curses.endwin()
         sys.stdout = os.fdopen(0,'w',0)
         sys.exit(0)
@@ -1318,69 +1901,45 @@ def main(screen):
 
     if save_checkfile_path is None or (save_checkfile_path is not None and not check_file(save_checkfile_path)):
         params = (workflow_file, database_file, tasks_ordered, metatask_list,cycledef_group_cycles)
-        if use_multiprocessing:
-            process_get_rocoto_stat = Process( target=get_rocoto_stat, args=[params, queue_stat] )
-            process_get_rocoto_stat.start()
+        if use_background_refresh:
+            refresh_worker = RefreshWorker( params )
+            refresh_worker.start()
             screen.addstr(mlines-2,0,'No checkpoint file, must get rocoto stats please wait',curses.A_BOLD)
             screen.addstr(mlines-1,0,'Running rocotostat ',curses.A_BOLD)
         else:
-            (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles) = get_rocoto_stat( params, Queue() )
-            header = header_string
+            (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles) = get_rocoto_stat( params )
             stat_update_time = str(datetime.datetime.now()).rsplit(':',1)[0]
-            header = header.replace('t'*16,stat_update_time)
-            if PSLOT.lower() == 'no_name':
-                header = header.replace(' PSLOT: pslot ','==============')
-                reduce_header_size = 0
-            elif PACKAGE.lower() == 'ugcs':
-                header = header.replace(' PSLOT: pslot ','==== UGCS ====')
-                reduce_header_size = 0
-            else:
-                header = header.replace('pslot',PSLOT)
-                reduce_header_size = int((len(PSLOT)-len('PSLOT'))/2)
-            if reduce_header_size > 0:
-                header = header[:-reduce_header_size]
-                header = header[reduce_header_size:]
+            header = stat_header( header_string, stat_update_time )
             
-        while use_multiprocessing:
+        while use_background_refresh:
             if  mcols < default_column_length:
                 curses.endwin()
                 print
                 print 'Your terminal is only %d characters must be at least %d to display workflow status'%(mcols,default_column_length)
                 sys.exit(-1)
-            step += 0.001
-            if step > 100:
-                step = 0.0
+            try:
+                refresh = refresh_worker.results.get(timeout=0.2)
+            except Empty:
                 i = (0 if i == len(dots)-1 else i+1 )
                 curses.curs_set(0)
                 screen.addstr(mlines-1,19,dots[i],curses.A_BOLD)
                 screen.refresh()
-            try:
-                rocoto_stat_params = queue_stat.get_nowait()
-            except:
-                pass
-            if len(rocoto_stat_params) != 0:
-                (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles) = rocoto_stat_params
-                if use_multiprocessing:
-                    process_get_rocoto_stat.join()
-                    process_get_rocoto_stat.terminate()
-                stat_update_time = str(datetime.datetime.now()).rsplit(':',1)[0]
-                header = header_string
-                header = header.replace('t'*16,stat_update_time)
-                if PSLOT.lower() == 'no_name':
-                    header = header.replace(' PSLOT: pslot ','==============')
-                    reduce_header_size = 0
-                elif PACKAGE.lower() == 'ugcs':
-                    header = header.replace(' PSLOT: pslot ','==== UGCS ====')
-                    reduce_header_size = 0
-                else:
-                    header = header.replace('pslot',PSLOT)
-                    reduce_header_size = int((len(PSLOT)-len('PSLOT'))/2)
-                if reduce_header_size > 0:
-                    header = header[:-reduce_header_size]
-                    header = header[reduce_header_size:]
-                break
+                continue
+            if refresh[0] == 'error':
+                curses.endwin()
+                print
+                print 'rocotostat failed: %s'%refresh[1]
+                sys.exit(-1)
+            (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles) = refresh[1]
+            stat_update_time = refresh[3]
+            header = stat_header( header_string, stat_update_time )
+            break
 
         start_time = time()
+    elif use_background_refresh:
+        params = (workflow_file, database_file, tasks_ordered, metatask_list,cycledef_group_cycles)
+        refresh_worker = RefreshWorker( params, checkpoint_mtime )
+        refresh_worker.start()
 
     num_cycle = len(rocoto_stat)
     time_to_load = (time()- current_time)/60.0
@@ -1401,10 +1960,7 @@ def main(screen):
     metatasks_state_string_cycle = []
 
     metatask_list_copy = collections.defaultdict(list)
-    metatask_name =  collections.defaultdict(list)
-    for each_metatask in metatask_list:
-        metatask_name[each_metatask] = metatask_list[each_metatask][0]
-        del metatask_list[each_metatask][0]
+    metatask_name, metatask_members = split_metatask_list(metatask_list)
 
     tasks_in_cycle = []
     for each_cycle in rocoto_stat:
@@ -1412,7 +1968,7 @@ def main(screen):
         meta_tasks_in_cycle = []
         for each_line in each_cycle:
             line_has_metatask = False
-            for check_metatask, check_metatask_list in metatask_list.iteritems():
+            for check_metatask, check_metatask_list in metatask_members.iteritems():
                 if check_metatask in each_line:
                     meta_tasks_in_cycle.append( (check_metatask, True, check_metatask_list ) )
                     line_has_metatask = True
@@ -1434,7 +1990,7 @@ def main(screen):
 
         meta_tasks_state = dict()
         meta_tasks_state_string = dict()
-        for check_metatask, check_metatask_list in metatask_list.iteritems():
+        for check_metatask, check_metatask_list in metatask_members.iteritems():
             meta_tasks_state[check_metatask] = True
             meta_tasks_state_string[check_metatask] = ''
         meta_tasks_state['False'] = False
@@ -1888,34 +2444,34 @@ def main(screen):
                 print 'Your terminal is only %s characters must be at least %s to display workflow status'%(str(mcols),str(num_columns))
                 sys.exit(-1)
 
-            if loading_stat:
-                dot_stat = (0 if dot_stat == len(dots)-1 else dot_stat+1 )
-                screen.addstr(mlines-2,0,'Running rocotostat ')
-                screen.addstr(mlines-2,20,dots[dot_stat])
-                try:
-                    rocoto_stat_tmp = queue_stat.get_nowait()
-                except:
-                    rocoto_stat_tmp = ''
-                if len(rocoto_stat_tmp) != 0:
-                    (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles) = rocoto_stat_tmp
-                    process_get_rocoto_stat.join()
-                    process_get_rocoto_stat.terminate()
-                    update_pad = True
-                    loading_stat = False
-                    rocoto_stat_tmp = ''
-                    stat_update_time = str(datetime.datetime.now()).rsplit(':',1)[0]
-                    header = header_string
-                    header = header.replace('t'*16,stat_update_time)
-                    header = header.replace('pslot',PSLOT)
-                    reduce_header_size = int((len(PSLOT)-len('PSLOT'))/2)
-                    if reduce_header_size > 0:
-                        header = header[:-reduce_header_size]
-                        header = header[reduce_header_size:]
+            if refresh_worker is not None:
+                loading_stat = refresh_worker.busy
+                if loading_stat:
+                    dot_stat = (0 if dot_stat == len(dots)-1 else dot_stat+1 )
+                    screen.addstr(mlines-2,0,'Running rocotostat ')
+                    screen.addstr(mlines-2,20,dots[dot_stat])
+                refresh = None
+                changed_cycles = set()
+                while True:
+                    try:
+                        next_refresh = refresh_worker.results.get_nowait()
+                    except Empty:
+                        break
+                    if next_refresh[0] == 'error':
+                        screen.addstr(mlines-2,0,('rocotostat failed: %s'%next_refresh[1])[:mcols-1])
+                        continue
+                    refresh = next_refresh
+                    if refresh[2] is None or changed_cycles is None:
+                        changed_cycles = None
+                    else:
+                        changed_cycles |= refresh[2]
+                if refresh is not None:
+                    (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles) = refresh[1]
+                    stat_update_time = refresh[3]
+                    header = stat_header( header_string, stat_update_time )
+                    if changed_cycles is None or cycle in changed_cycles:
+                        update_pad = True
                     screen.addstr(mlines-2,0,'Updated new rocotostatus: %s'%stat_update_time+' '*48)
-                    screen.refresh()
-                    std_time.sleep(0.5)
-                    screen.addstr(mlines-2,0,' '*100)
-                    screen.refresh()
         
             if loading_check:
                 if  time() - current_check_time > 5:
@@ -2247,15 +2803,13 @@ def main(screen):
                 update_pad = True
             elif event == ord('R'):
                 screen.addstr(mlines-2,0,'Running rocotorun and rocotostat ...'+' '*60,curses.A_BOLD)
-                params = (workflow_file, database_file)
-                rocoto_run(params)
-                update_pad = True
-                screen.clear()
-                if loading_stat == True:
-                    screen.addstr(mlines-2,0,'rocotostat is all reading running'+' '*60)
-                    screen.refresh()
-                    std_time.sleep(0.5)
+                if refresh_worker is not None:
+                    refresh_worker.request('run')
                 else:
+                    params = (workflow_file, database_file)
+                    rocoto_run(params)
+                    update_pad = True
+                    screen.clear()
                     start_time = 0
             elif event == ord('/'):
                 curses.echo()
@@ -2323,42 +2877,30 @@ def main(screen):
                     cycle = find_cycle - 2
                     update_pad = True
             elif event == ord('l'):
-                start_time -= stat_read_time_delay
+                if refresh_worker is not None:
+                    refresh_worker.request('stat')
+                else:
+                    start_time -= stat_read_time_delay
             elif event == ord('h'):
                 update_pad = True
                 help_screen(screen)
                 screen.clear()
             current_time = time()
             diff = current_time - start_time
-            if diff > stat_read_time_delay and not loading_stat:
+            if refresh_worker is None and diff > stat_read_time_delay:
                 start_time = current_time
-                if not use_multiprocessing:
-                    params = (workflow_file, database_file, tasks_ordered, metatask_list,cycledef_group_cycles)
-                    (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles) = get_rocoto_stat( params, Queue() )
-                    stat_update_time = str(datetime.datetime.now()).rsplit(':',1)[0]
-                    header = header_string
-                    header = header.replace('t'*16,stat_update_time)
-                    header = header.replace('pslot',PSLOT)
-                    reduce_header_size = int((len(PSLOT)-len('PSLOT'))/2)
-                    if reduce_header_size > 0:
-                        header = header[:-reduce_header_size]
-                        header = header[reduce_header_size:]
-                    update_pad = True
-                    screen.clear()
-                else:
-                    loading_stat = True
-                    screen.addstr(mlines-2,0,'Running rocotostat                                        ')
-                    params = (workflow_file, database_file, tasks_ordered, metatask_list,cycledef_group_cycles)
-                    process_get_rocoto_stat = Process( target=get_rocoto_stat, args=[params, queue_stat] )
-                    process_get_rocoto_stat.start()
-
-        if use_multiprocessing:
-            if  process_get_rocoto_stat is not None:
-                if process_get_rocoto_stat.is_alive():
-                    process_get_rocoto_stat.terminate()
-            if process_get_rocoto_check is not None:
-                if process_get_rocoto_check.is_alive():
-                    process_get_rocoto_check.terminate()
+                params = (workflow_file, database_file, tasks_ordered, metatask_list,cycledef_group_cycles)
+                (rocoto_stat, tasks_ordered, metatask_list,cycledef_group_cycles) = get_rocoto_stat( params )
+                stat_update_time = str(datetime.datetime.now()).rsplit(':',1)[0]
+                header = stat_header( header_string, stat_update_time )
+                update_pad = True
+                screen.clear()
+
+        if refresh_worker is not None:
+            refresh_worker.stop()
+        if process_get_rocoto_check is not None:
+            if process_get_rocoto_check.is_alive():
+                process_get_rocoto_check.terminate()
 
         #debug.close()
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+##@namespace rocoto_viewer_bench
+# @brief Times rocoto_viewer status refreshes against a synthetic Rocoto database.
+#
+# Builds Rocoto databases with a growing number of completed cycles plus a
+# couple of active ones, then times the first full load and the steady-state
+# refresh of the rocoto_viewer status engine:
+#
+#      rocoto_viewer_bench.py [--tasks=400] [--cycles=50,100,200,300] [--repeat=5]
+#
+##@cond ROCOTO_VIEWER_BENCH
+
+import os, sys, getopt, shutil, sqlite3, tempfile
+from time import time
+
+import rocoto_viewer
+
+SCHEMA = [ 'CREATE TABLE cycles (id INTEGER PRIMARY KEY, cycle DATETIME, activated DATETIME, expired DATETIME, done DATETIME)',
+           'CREATE TABLE cycledef (id INTEGER PRIMARY KEY, groupname VARCHAR(64), cycledef VARCHAR(256))',
+           'CREATE TABLE jobs (id INTEGER PRIMARY KEY, jobid VARCHAR(64), taskname VARCHAR(64), cycle DATETIME, cores INTEGER, state VARCHAR(64), native_state VARCHAR(64), exit_status INTEGER, tries INTEGER, nunknowns INTEGER, duration REAL)' ]
+
+first_cycle = 1483228800
+cycle_step = 6*3600
+
+def make_tasks(ntasks, ncycles):
+    tasks_ordered = [ ('task%04d'%i,'gfs','/log/task%04d_CYCLE.log'%i) for i in range(ntasks) ]
+    cycledef_group_cycles = { 'gfs': rocoto_viewer.CycleDefRanges() }
+    cycledef_group_cycles['gfs'].add_range( rocoto_viewer.datetime.datetime.utcfromtimestamp(first_cycle),
+                                            rocoto_viewer.datetime.datetime.utcfromtimestamp(first_cycle+(ncycles-1)*cycle_step),
+                                            rocoto_viewer.timedelta(seconds=cycle_step) )
+    return tasks_ordered, cycledef_group_cycles
+
+def make_database(filename, ntasks, ncycles, nactive):
+    connection = sqlite3.connect(filename)
+    c = connection.cursor()
+    for create in SCHEMA:
+        c.execute(create)
+    c.execute("INSERT INTO cycledef (groupname,cycledef) VALUES ('gfs','201701010000 203701010000 06:00:00')")
+    jobid = 1000000
+    for n in range(ncycles):
+        cycle = first_cycle+n*cycle_step
+        done = 0 if n >= ncycles-nactive else cycle+cycle_step
+        c.execute('INSERT INTO cycles (cycle,activated,expired,done) VALUES (?,?,0,?)',(cycle,cycle,done))
+        rows = []
+        for i in range(ntasks):
+            if done == 0 and i >= ntasks//2:
+                break
+            jobid += 1
+            state = 'SUCCEEDED' if done else 'RUNNING'
+            rows.append( (str(jobid),'task%04d'%i,cycle,24,state,state,0,1,0,812.0) )
+        c.executemany('INSERT INTO jobs (jobid,taskname,cycle,cores,state,native_state,exit_status,tries,nunknowns,duration) VALUES (?,?,?,?,?,?,?,?,?,?)',rows)
+    connection.commit()
+    return connection
+
+def advance_database(connection, ntasks, ncycles, step):
+    c = connection.cursor()
+    cycle = first_cycle+(ncycles-1)*cycle_step
+    c.execute("UPDATE jobs SET state='SUCCEEDED' WHERE cycle=? AND taskname=?",(cycle,'task%04d'%step))
+    c.execute("INSERT INTO jobs (jobid,taskname,cycle,cores,state,native_state,exit_status,tries,nunknowns,duration) VALUES (?,?,?,24,'QUEUED','PEND',0,0,0,0.0)",
+              (str(9000000+step),'task%04d'%(ntasks//2+step),cycle))
+    connection.commit()
+
+def bench(ntasks, ncycles, repeat):
+    tempdir = tempfile.mkdtemp(prefix='rocoto_viewer_bench.')
+    try:
+        filename = os.path.join(tempdir,'bench.db')
+        connection = make_database(filename, ntasks, ncycles, 2)
+        tasks_ordered, cycledef_group_cycles = make_tasks(ntasks, ncycles)
+        engine = rocoto_viewer.RocotoStatEngine()
+        c = connection.cursor()
+        start = time()
+        engine.refresh(c, tasks_ordered, cycledef_group_cycles)
+        first = time()-start
+        refresh = 0.0
+        for step in range(repeat):
+            advance_database(connection, ntasks, ncycles, step)
+            start = time()
+            engine.refresh(c, tasks_ordered, cycledef_group_cycles)
+            refresh += time()-start
+        connection.close()
+        return first, refresh/repeat
+    finally:
+        shutil.rmtree(tempdir)
+
+def main():
+    ntasks = 400 ; cycles = [50,100,200,300] ; repeat = 5
+    opts, args = getopt.getopt(sys.argv[1:], '', ['tasks=','cycles=','repeat='])
+    for k, v in opts:
+        if k == '--tasks':
+            ntasks = int(v)
+        elif k == '--cycles':
+            cycles = [ int(n) for n in v.split(',') ]
+        elif k == '--repeat':
+            repeat = int(v)
+    os.environ['TZ']='UTC'
+    rocoto_viewer.std_time.tzset()
+    print '%8s %8s %12s %12s'%('CYCLES','TASKS','FIRST(s)','REFRESH(s)')
+    for ncycles in cycles:
+        first, refresh = bench(ntasks, ncycles, repeat)
+        print '%8d %8d %12.4f %12.4f'%(ncycles,ntasks,first,refresh)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+#
+##@namespace rocoto_viewer_test
+# @brief Self-test for the rocoto_viewer status engine, checkpoint and
+# background refresh.
+#
+# Checks incremental status refreshes against full ones on a synthetic
+# Rocoto database as jobs finish, are rewound and new cycles start.  Also
+# writes a checkpoint, reloads it, and refreshes it through the
+# RefreshWorker, checking that the metatask list keeps the same form
+# through every step.  Checks that the task catalog is parsed again
+# when the parsed XML or the package settings change:
+#
+#      rocoto_viewer_test.py [-v]
+#
+##@cond ROCOTO_VIEWER_TEST
+
+import os, shutil, tempfile, unittest
+
+import rocoto_viewer
+from rocoto_viewer_bench import make_database, make_tasks, advance_database, first_cycle, cycle_step
+
+class TestCheckpointRefresh(unittest.TestCase):
+
+    ntasks = 6
+    ncycles = 3
+
+    def setUp(self):
+        os.environ['TZ']='UTC'
+        rocoto_viewer.std_time.tzset()
+        self.tempdir = tempfile.mkdtemp(prefix='rocoto_viewer_test.')
+        self.database_file = os.path.join(self.tempdir,'test.db')
+        self.connection = make_database(self.database_file, self.ntasks, self.ncycles, 1)
+        self.tasks_ordered, self.cycledef_group_cycles = make_tasks(self.ntasks, self.ncycles)
+        self.metatask_list = { 'task0002':['post','task0002','task0003','task0004'] }
+        rocoto_viewer.save_checkfile_path = os.path.join(self.tempdir,'checkpoint')
+        rocoto_viewer.rocoto_stat_engine = None
+
+    def tearDown(self):
+        self.connection.close()
+        rocoto_viewer.save_checkfile_path = None
+        rocoto_viewer.rocoto_stat_engine = None
+        shutil.rmtree(self.tempdir)
+
+    def params(self, tasks_ordered, metatask_list, cycledef_group_cycles):
+        return (os.path.join(self.tempdir,'workflow.xml'), self.database_file,
+                tasks_ordered, metatask_list, cycledef_group_cycles)
+
+    def check_metatasks(self, metatask_list):
+        self.assertEqual(dict(metatask_list), self.metatask_list)
+        metatask_name, metatask_members = rocoto_viewer.split_metatask_list(metatask_list)
+        self.assertEqual(dict(metatask_name), { 'task0002':'post' })
+        self.assertEqual(dict(metatask_members), { 'task0002':['task0002','task0003','task0004'] })
+        self.assertEqual(dict(metatask_list), self.metatask_list)
+
+    def test_reload_and_refresh(self):
+        rocoto_viewer.get_rocoto_stat( self.params(self.tasks_ordered, self.metatask_list,
+                                                   self.cycledef_group_cycles) )
+        rocoto_stat, tasks_ordered, metatask_list, cycledef_group_cycles, stat_update_time = \
+            rocoto_viewer.read_checkpoint(rocoto_viewer.save_checkfile_path)
+        self.assertEqual(len(rocoto_stat), self.ncycles)
+        self.check_metatasks(metatask_list)
+
+        worker = rocoto_viewer.RefreshWorker( self.params(tasks_ordered, metatask_list,
+                                                          cycledef_group_cycles) )
+        worker.poll_checkpoint()
+        kind, stat, changed, update_time = worker.results.get_nowait()
+        self.assertEqual(kind, 'stat')
+        self.assertEqual(list(stat[0]), list(rocoto_stat))
+        self.check_metatasks(stat[2])
+
+        advance_database(self.connection, self.ntasks, self.ncycles, 0)
+        worker.poll_stat()
+        kind, stat, changed, update_time = worker.results.get_nowait()
+        self.assertEqual(kind, 'stat')
+        self.assertTrue(any( 'task0000 1000013 SUCCEEDED' in line for line in stat[0][-1] ))
+        self.check_metatasks(stat[2])
+        self.check_metatasks(worker.params[3])
+        self.check_metatasks(rocoto_viewer.read_checkpoint(rocoto_viewer.save_checkfile_path)[2])
+
+class TestStatEngine(unittest.TestCase):
+
+    ntasks = 8
+    ncycles = 6
+
+    def setUp(self):
+        os.environ['TZ']='UTC'
+        rocoto_viewer.std_time.tzset()
+        self.tempdir = tempfile.mkdtemp(prefix='rocoto_viewer_test.')
+        self.connection = make_database(os.path.join(self.tempdir,'test.db'), self.ntasks, self.ncycles, 2)
+        self.c = self.connection.cursor()
+        self.tasks_ordered, self.cycledef_group_cycles = make_tasks(self.ntasks, self.ncycles+1)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.tempdir)
+
+    def check(self, engine):
+        '''Refreshes engine and checks it against a new engine.'''
+        rocoto_stat = engine.refresh(self.c, self.tasks_ordered, self.cycledef_group_cycles)
+        expected = rocoto_viewer.RocotoStatEngine().refresh(self.c, self.tasks_ordered, self.cycledef_group_cycles)
+        self.assertEqual(rocoto_stat, expected)
+        return rocoto_stat
+
+    def test_incremental_matches_full_refresh(self):
+        engine = rocoto_viewer.RocotoStatEngine()
+        first = self.check(engine)
+        self.assertEqual(len(first), self.ncycles)
+        last_cycle = first_cycle+(self.ncycles-1)*cycle_step
+        for step in range(3):
+            advance_database(self.connection, self.ntasks, self.ncycles, step)
+            rocoto_stat = self.check(engine)
+            for i in range(self.ncycles-2):
+                self.assertTrue(rocoto_stat[i] is first[i])
+        # Rewind a task of a done cycle and finish it again
+        done_cycle = first_cycle
+        self.c.execute('DELETE FROM jobs WHERE cycle=? AND taskname=?',(done_cycle,'task0001'))
+        self.c.execute('UPDATE cycles SET done=0 WHERE cycle=?',(done_cycle,))
+        self.connection.commit()
+        rocoto_stat = self.check(engine)
+        self.assertTrue(any( 'task0001 - - - - -' in line for line in rocoto_stat[0] ))
+        self.c.execute("INSERT INTO jobs (jobid,taskname,cycle,cores,state,native_state,exit_status,tries,nunknowns,duration) VALUES ('8000000','task0001',?,24,'SUCCEEDED','DONE',0,2,0,5.0)",(done_cycle,))
+        self.c.execute('UPDATE cycles SET done=? WHERE cycle=?',(done_cycle+cycle_step,done_cycle))
+        self.connection.commit()
+        self.check(engine)
+        # Finish the last cycle and activate a new one
+        self.c.execute("UPDATE jobs SET state='SUCCEEDED' WHERE cycle=?",(last_cycle,))
+        self.c.execute('UPDATE cycles SET done=? WHERE cycle=?',(last_cycle+cycle_step,last_cycle))
+        self.c.execute('INSERT INTO cycles (cycle,activated,expired,done) VALUES (?,?,0,0)',(last_cycle+cycle_step,last_cycle+cycle_step))
+        self.connection.commit()
+        self.assertEqual(len(self.check(engine)), self.ncycles+1)
+
+class TestTaskCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='rocoto_viewer_test.')
+        self.workflow_file = os.path.join(self.tempdir,'workflow.xml')
+        self.parse_file = os.path.join(self.tempdir,'parse.xml')
+        self.write(self.workflow_file,'<workflow/>')
+        self.write(self.parse_file,'<workflow/>')
+        self.parsed = []
+        self.get_tasklist = rocoto_viewer.get_tasklist
+        rocoto_viewer.get_tasklist = self.fake_tasklist
+        rocoto_viewer.PACKAGE = 'none'
+        rocoto_viewer.entity_values = dict()
+
+    def tearDown(self):
+        rocoto_viewer.get_tasklist = self.get_tasklist
+        shutil.rmtree(self.tempdir)
+
+    def write(self, filename, text):
+        with open(filename,'wt') as f:
+            f.write(text)
+
+    def fake_tasklist(self, parse_file):
+        with open(parse_file,'rt') as f:
+            catalog = (f.read(), rocoto_viewer.PACKAGE, dict(rocoto_viewer.entity_values))
+        self.parsed.append(catalog)
+        return catalog
+
+    def load(self):
+        return rocoto_viewer.load_task_catalog(self.workflow_file, self.parse_file)
+
+    def test_key(self):
+        first = self.load()
+        self.assertEqual(self.load(), first)
+        self.assertEqual(len(self.parsed), 1)
+        # The parsed file changes, but not the workflow
+        self.write(self.parse_file,'<workflow><cycledef/></workflow>')
+        self.assertEqual(self.load()[0], '<workflow><cycledef/></workflow>')
+        self.assertEqual(len(self.parsed), 2)
+        # The package changes
+        rocoto_viewer.PACKAGE = 'ugcs'
+        rocoto_viewer.entity_values = { 'SDATE':'201501010000', 'EDATE':'201601010000', 'INC_MONTHS':'0' }
+        self.assertEqual(self.load()[1], 'ugcs')
+        self.assertEqual(len(self.parsed), 3)
+        self.load()
+        self.assertEqual(len(self.parsed), 3)
+        # ucgs_is_cron changes
+        rocoto_viewer.entity_values['INC_MONTHS'] = '1'
+        self.assertEqual(self.load()[2]['INC_MONTHS'], '1')
+        self.assertEqual(len(self.parsed), 4)
+
+if __name__ == '__main__':
+    unittest.main()